@@ -1,139 +1,173 @@
-from flask import Flask, request, jsonify, send_file
+import time
+PROCESS_START = time.perf_counter()
+
+from flask import Flask, Request, g, request, jsonify, send_file
 # from flask_cors import CORS
 import os
-import torch
-import torchaudio
-from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
+import io
 import numpy as np
 from pathlib import Path
 import librosa
-from g2p_en import G2p
-import pyttsx3
-import tempfile
-import threading
-import nltk
-from scipy.io import wavfile
+from difflib import SequenceMatcher
+from audio_io import decode_audio
+from ctc_alignment import log_softmax
+from dtw import dtw_distance, distance_to_similarity
+from metrics import Metrics, server_timing_header
+from server_resources import ServerResources
+from streaming_scorer import StreamingSession, StreamingSessions
+
+class InMemoryRequest(Request):
+    """Keep uploaded files in memory instead of spooling them to disk"""
 
-# Ensure required NLTK data is downloaded
-nltk.download('averaged_perceptron_tagger_eng')
-nltk.download('cmudict')
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
 
 app = Flask(__name__)
+app.request_class = InMemoryRequest
+# Uploads are held in memory, so cap their size
+app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024
 # CORS(app)
 
 # Configuration
 SAMPLING_RATE = 16000 # Wav2Vec2 expects 16kHz
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-
-print(f"Loading Wav2Vec2 model on {DEVICE}...")
+# Empty = cuda if available, else cpu
+DEVICE = os.environ.get("DEVICE") or None
+# Micro-batching window for concurrent /compare requests (BATCH_MAX_SIZE=1 disables it)
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "10"))
+# Longest/shortest clip - 1 within one batch (the base model takes no attention mask)
+BATCH_MAX_PADDING = float(os.environ.get("BATCH_MAX_PADDING", "0.05"))
+TTS_CACHE_MAX_MB = int(os.environ.get("TTS_CACHE_MAX_MB", "256"))
+# Decoded uploads, keyed by content and sample rate (0 = off; see audio_cache.py)
+AUDIO_CACHE_MAX_MB = int(os.environ.get("AUDIO_CACHE_MAX_MB", "0"))
+# Render every question word into the TTS cache in the background at startup
+TTS_PREWARM = os.environ.get("TTS_PREWARM", "0") == "1"
+# torch | torch-int8 | onnx | onnx-int8 (see inference_backend.py)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+# Resolve model and NLTK data from local caches only (see server_resources.py)
+OFFLINE_MODE = os.environ.get("OFFLINE_MODE", "1") == "1"
+# Load everything in the background as soon as the server starts
+WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "1") == "1"
+# Add a Server-Timing header with per-stage durations to every response
+METRICS_DEBUG_HEADER = os.environ.get("METRICS_DEBUG_HEADER", "0") == "1"
+# Sakoe-Chiba radius (frames) for /dtw; empty = full matrix like DTWComparator.vb
+DTW_BAND = int(os.environ["DTW_BAND"]) if os.environ.get("DTW_BAND") else None
 MODEL_ID = "facebook/wav2vec2-base-960h"
-processor = Wav2Vec2Processor.from_pretrained(MODEL_ID)
-model = Wav2Vec2ForCTC.from_pretrained(MODEL_ID).to(DEVICE)
-model.eval()
-
-# Initialize G2P for phoneme conversion
-g2p = G2p()
 
 # Paths
 BASE_DIR = Path(__file__).parent
 TEMP_DIR = BASE_DIR / "temp_audio"
-TEMP_DIR.mkdir(exist_ok=True)
+LEXICON_PATH = BASE_DIR / "cache" / "phoneme_lexicon.jsonl"
+REFERENCE_DIR = BASE_DIR / "references"
+
+# Model, processor, phoneme lexicon (precomputed with `python phoneme_lexicon.py`)
+# and TTS cache are created on first use or by resources.warm_up()
+resources = ServerResources(
+    model_id=MODEL_ID,
+    backend_name=INFERENCE_BACKEND,
+    sampling_rate=SAMPLING_RATE,
+    batch_max_size=BATCH_MAX_SIZE,
+    batch_max_wait_ms=BATCH_MAX_WAIT_MS,
+    batch_max_padding=BATCH_MAX_PADDING,
+    lexicon_path=LEXICON_PATH,
+    tts_cache_dir=BASE_DIR / "cache" / "tts",
+    tts_cache_max_bytes=TTS_CACHE_MAX_MB * 1024 * 1024,
+    nltk_data_dir=BASE_DIR / "cache" / "nltk_data",
+    offline=OFFLINE_MODE,
+    device=DEVICE,
+    process_start=PROCESS_START,
+    reference_dir=REFERENCE_DIR,
+    audio_cache_dir=BASE_DIR / "cache" / "audio",
+    audio_cache_max_bytes=AUDIO_CACHE_MAX_MB * 1024 * 1024
+)
+
+# Per-stage latency summaries and counters for /metrics
+metrics = Metrics()
+
+# Open /stream sessions (idle ones expire after a minute)
+streams = StreamingSessions(idle_timeout_s=60)
+STREAM_READ_BYTES = 6400  # 200 ms of 16 kHz 16-bit PCM
 
 def get_phonemes(text):
     """Convert text to phonetic representation."""
-    return [p for p in g2p(text) if p.strip()]
+    return resources.lexicon.lookup(text)
 
-def get_detailed_scores(audio_path, target_text):
+def get_detailed_scores(speech, target_text):
     """
     Perform granular scoring (Word and Phoneme level)
+
+    `speech` is mono float32 audio already resampled to SAMPLING_RATE.
     """
-    # 0. Check file info
-    if not os.path.exists(audio_path):
-        raise FileNotFoundError(f"Audio file not found at {audio_path}")
-    
-    file_size = os.path.getsize(audio_path)
-    print(f"Loading audio: {audio_path} ({file_size} bytes)")
+    # 1. Process through model (batched with concurrent requests)
+    batch_timings = {}
+    logits = resources.batcher.infer(speech, timings=batch_timings)
+    for stage, seconds in batch_timings.items():
+        metrics.observe_stage(stage, seconds)
+    duration = librosa.get_duration(y=speech, sr=SAMPLING_RATE)
     
-    if file_size == 0:
-        raise ValueError("Audio file is empty (0 bytes).")
+    return score_logits(logits, duration, target_text)
 
-    # 1. Load and resample audio
-    try:
-        speech, sr = librosa.load(audio_path, sr=SAMPLING_RATE)
-    except Exception as e:
-        print(f"librosa.load failed: {e}. Trying scipy.io.wavfile fallback...")
-        try:
-            # Fallback for standard WAV files if libsndfile/ffmpeg are having issues
-            sr_orig, data = wavfile.read(audio_path)
-            # Convert to float32 and normalize
-            if data.dtype == np.int16:
-                speech = data.astype(np.float32) / 32768.0
-            elif data.dtype == np.int32:
-                speech = data.astype(np.float32) / 2147483648.0
-            else:
-                speech = data.astype(np.float32)
-            
-            # Convert to mono if stereo
-            if len(speech.shape) > 1:
-                speech = np.mean(speech, axis=1)
-                
-            # Resample if needed
-            if sr_orig != SAMPLING_RATE:
-                speech = librosa.resample(speech, orig_sr=sr_orig, target_sr=SAMPLING_RATE)
-            sr = SAMPLING_RATE
-            print("scipy.io.wavfile fallback successful.")
-        except Exception as e2:
-            print(f"All audio loading methods failed. e2: {e2}")
-            raise RuntimeError(f"Could not load audio file. Librosa error: {e}. Scipy error: {e2}")
-    
-    # 2. Process through model
-    inputs = processor(speech, return_tensors="pt", sampling_rate=SAMPLING_RATE)
-    input_values = inputs.input_values.to(DEVICE)
-    
-    with torch.no_grad():
-        logits = model(input_values).logits
-    
-    # Calculate probabilities
-    probs = torch.nn.functional.softmax(logits, dim=-1).squeeze(0).cpu().numpy()
-    predicted_ids = torch.argmax(logits, dim=-1).squeeze(0).cpu().numpy()
-    
+def score_logits(logits, duration, target_text):
+    """Word and phoneme scores from CTC logits of shape (frames, vocab)"""
     # Decoding
-    transcription = processor.decode(predicted_ids).upper()
+    with metrics.stage("ctc_decode"):
+        log_probs = log_softmax(logits)
+        predicted_ids = np.argmax(logits, axis=-1)
+        transcription = resources.processor.decode(predicted_ids).upper()
     
     # Target Clean-up
     target_text = target_text.upper().strip()
     target_words = target_text.split()
-    target_phonemes_list = [get_phonemes(w) for w in target_words]
+    with metrics.stage("g2p"):
+        target_phonemes_list = [get_phonemes(w) for w in target_words]
+    
+    # Forced alignment of the target text on the same log-probs: per-word
+    # time spans and frame-averaged confidence (None if the clip is too short)
+    with metrics.stage("alignment"):
+        alignment = resources.aligner.align_words(log_probs, target_words) if target_words else None
     
+    with metrics.stage("scoring"):
+        return _score_words(target_words, target_phonemes_list, alignment, transcription, duration)
+
+def _score_words(target_words, target_phonemes_list, alignment, transcription, duration):
     # Predicted Words
     pred_words = transcription.split()
     
     word_details = []
     total_score = 0
     
-    # Simplified Word & Phoneme Alignment
-    # In a full system, we'd use CTC-segmentation for time-alignment
     for i, target_word in enumerate(target_words):
         word_score = 0
         phonemes_feedback = []
         expected_phonemes = target_phonemes_list[i]
         
-        if i < len(pred_words):
+        if alignment is not None:
+            aligned = alignment[i]
+            word_score = aligned["confidence"] * 100
+            # Phonemes are spread evenly over the word's letters and scored
+            # with the confidence of the letters they cover
+            char_conf = aligned["char_confidence"]
+            for k, p in enumerate(expected_phonemes):
+                lo = k * len(char_conf) // len(expected_phonemes)
+                hi = max(lo + 1, (k + 1) * len(char_conf) // len(expected_phonemes))
+                p_score = float(np.mean(char_conf[lo:hi])) * 100 if char_conf else 0
+                phonemes_feedback.append({
+                    "phoneme": p,
+                    "score": round(p_score, 2),
+                    "status": "Good" if p_score > 80 else "Needs Work" if p_score > 0 else "Missing"
+                })
+        elif i < len(pred_words):
+            # Fallback without alignment: pair words by position
             pred_word = pred_words[i]
             if pred_word == target_word:
                 word_score = 100
-                # If word is correct, check phoneme "purity" (simplified)
                 for p in expected_phonemes:
                     phonemes_feedback.append({"phoneme": p, "score": 100, "status": "Good"})
             else:
-                # Partial match logic
-                from difflib import SequenceMatcher
                 ratio = SequenceMatcher(None, target_word, pred_word).ratio()
                 word_score = ratio * 100
                 
-                # Phoneme level feedback simulation based on word overlap
                 for p in expected_phonemes:
-                    # Very simplified: if word part exists, phoneme is okay
                     p_score = word_score if len(p) > 1 else 100 # vowels usually okay
                     phonemes_feedback.append({
                         "phoneme": p, 
@@ -145,16 +179,19 @@ def get_detailed_scores(audio_path, target_text):
             for p in expected_phonemes:
                 phonemes_feedback.append({"phoneme": p, "score": 0, "status": "Missing"})
         
-        word_details.append({
+        detail = {
             "word": target_word,
             "score": round(word_score, 2),
             "status": "Correct" if word_score > 80 else "Needs Improvement" if word_score > 0 else "Missing",
             "phonemes": phonemes_feedback
-        })
+        }
+        if alignment is not None:
+            detail["start"] = alignment[i]["start"]
+            detail["end"] = alignment[i]["end"]
+        word_details.append(detail)
         total_score += word_score
 
     overall_score = total_score / len(target_words) if target_words else 0
-    duration = librosa.get_duration(y=speech, sr=SAMPLING_RATE)
     
     return float(overall_score), word_details, round(duration, 2), transcription
 
@@ -166,26 +203,272 @@ def compare():
     audio_file = request.files['audio']
     target_text = request.form.get('target_text', '').strip()
     
-    temp_path = TEMP_DIR / f"user_{os.urandom(4).hex()}.wav"
-    audio_file.save(str(temp_path))
+    try:
+        with metrics.stage("read_upload"):
+            data = audio_file.read()
+        # Decoded from memory; TEMP_DIR is only used for formats that need a file
+        decode_timings = {}
+        speech = decode_audio(data, SAMPLING_RATE, temp_dir=TEMP_DIR, timings=decode_timings,
+                              cache=resources.audio_cache)
+        for stage, seconds in decode_timings.items():
+            metrics.observe_stage(stage, seconds)
+        score, word_details, duration, transcription = get_detailed_scores(speech, target_text)
+        with metrics.stage("serialize"):
+            return jsonify({
+                "status": "success",
+                "score": round(score, 2),
+                "transcription": transcription,
+                "word_details": word_details,
+                "duration": duration,
+                "target": target_text
+            })
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        metrics.count_error("compare", type(e).__name__)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/stream/start', methods=['POST'])
+def stream_start():
+    """Open a streaming session; audio follows on /stream/<id>/audio"""
+    params = request.get_json(silent=True) or request.form
+    target_text = params.get('target_text', '').strip()
+    try:
+        input_rate = int(params.get('sample_rate', SAMPLING_RATE))
+    except (TypeError, ValueError):
+        input_rate = 0
+    if input_rate <= 0:
+        return jsonify({"error": "sample_rate must be a positive integer"}), 400
+    
+    try:
+        session = streams.add(StreamingSession(
+            target_text,
+            infer=resources.batcher.infer,
+            decode=resources.processor.decode,
+            frame_stride=int(np.prod(resources.backend.config.conv_stride)),
+            sampling_rate=SAMPLING_RATE,
+            input_rate=input_rate
+        ))
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"status": "success", "session_id": session.session_id})
+
+@app.route('/stream/<session_id>/audio', methods=['POST'])
+def stream_audio(session_id):
+    """Append 16-bit mono PCM; the body may be sent with chunked transfer encoding"""
+    session = streams.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired stream"}), 404
     
     try:
-        score, word_details, duration, transcription = get_detailed_scores(str(temp_path), target_text)
+        with session.lock:
+            # Feed the body as it arrives so inference overlaps the upload
+            result = None
+            while True:
+                piece = request.stream.read(STREAM_READ_BYTES)
+                if not piece:
+                    break
+                result = session.feed(piece)
+            if result is None:
+                # Empty body: report the scores so far
+                result = session.partial()
+        return jsonify({"status": "success", **result})
+    except Exception as e:
+        streams.pop(session_id)
+        metrics.count_error("stream_audio", type(e).__name__)
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/stream/<session_id>/end', methods=['POST'])
+def stream_end(session_id):
+    """End of speech: flush the tail window and return the final scores"""
+    session = streams.pop(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired stream"}), 404
+    
+    started = time.perf_counter()
+    try:
+        with session.lock:
+            logits = session.finish()
+        score, word_details, duration, transcription = score_logits(
+            logits, session.duration, session.target_text
+        )
         return jsonify({
             "status": "success",
             "score": round(score, 2),
             "transcription": transcription,
             "word_details": word_details,
             "duration": duration,
-            "target": target_text
+            "target": session.target_text,
+            "finalize_ms": round((time.perf_counter() - started) * 1000.0, 1),
+            "inference_passes": session.inference_passes
         })
     except Exception as e:
         import traceback
         traceback.print_exc()
+        metrics.count_error("stream_end", type(e).__name__)
         return jsonify({"error": str(e)}), 500
-    finally:
-        if temp_path.exists():
-            os.remove(temp_path)
+
+def int_field(name, default, minimum):
+    """
+    Optional integer form field
+
+    Raises:
+        ValueError: With a message for the client when it is not an integer >= minimum
+    """
+    value = request.form.get(name, '').strip()
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum:
+        raise ValueError(f"{name} must be an integer >= {minimum}")
+    return number
+
+def upload_mfcc(audio_file):
+    """MFCC of an uploaded clip with the settings the references were generated with"""
+    extractor = resources.feature_extractor
+    decode_timings = {}
+    speech = decode_audio(audio_file.read(), extractor.sr, temp_dir=TEMP_DIR, timings=decode_timings,
+                          cache=resources.audio_cache)
+    for stage, seconds in decode_timings.items():
+        metrics.observe_stage(f"dtw_{stage}", seconds)
+    
+    with metrics.stage("dtw_mfcc"):
+        return extractor.mfcc(speech)
+
+@app.route('/dtw', methods=['POST'])
+def dtw_score():
+    """MFCC-DTW distance of an uploaded clip to a stored reference word"""
+    if 'audio' not in request.files:
+        return jsonify({"error": "No audio file provided"}), 400
+    
+    word = request.form.get('target_text', '').strip().lower()
+    try:
+        band = int_field('band', DTW_BAND, minimum=0)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        store = resources.reference_store
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    if word not in store:
+        return jsonify({"error": f"No reference for '{word}'"}), 404
+    
+    try:
+        mfcc = upload_mfcc(request.files['audio'])
+        reference = store.get(word)
+        with metrics.stage("dtw"):
+            distance = dtw_distance(mfcc, reference, band=band)
+        
+        return jsonify({
+            "status": "success",
+            "target": word,
+            "distance": round(distance, 4),
+            "similarity": round(distance_to_similarity(distance), 2),
+            "frames": [int(mfcc.shape[1]), int(reference.shape[1])],
+            "band": band
+        })
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        metrics.count_error("dtw", type(e).__name__)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/dtw/search', methods=['POST'])
+def dtw_search():
+    """Nearest reference words to an uploaded clip (top-k, exact, with pruning)"""
+    if 'audio' not in request.files:
+        return jsonify({"error": "No audio file provided"}), 400
+    
+    try:
+        k = int_field('k', 5, minimum=1)
+        band = int_field('band', DTW_BAND, minimum=0)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    target = request.form.get('target_text', '').strip().lower()
+    
+    try:
+        index = resources.reference_index
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    
+    try:
+        mfcc = upload_mfcc(request.files['audio'])
+        with metrics.stage("dtw_search"):
+            nearest, counts = index.search(mfcc, k=k, band=band)
+        response = {
+            "status": "success",
+            "nearest": [
+                {"word": w, "distance": round(d, 4), "similarity": round(distance_to_similarity(d), 2)}
+                for w, d in nearest
+            ],
+            "search": counts
+        }
+        if target:
+            # The clip is closer to another word than to the one asked for
+            response["target"] = target
+            response["wrong_word"] = bool(nearest) and nearest[0][0] != target
+        return jsonify(response)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        metrics.count_error("dtw_search", type(e).__name__)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/dtw/search_stats', methods=['GET'])
+def dtw_search_stats():
+    """Cumulative pruning rates of /dtw/search"""
+    try:
+        return jsonify(resources.reference_index.stats())
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+
+@app.route('/inference_stats', methods=['GET'])
+def inference_stats():
+    return jsonify(resources.batcher_stats())
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 200 once warm-up has finished, 503 before that"""
+    status = resources.status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Stage latency summaries and counters (Prometheus text, or ?format=json)"""
+    if request.args.get('format') == 'json':
+        return jsonify(metrics.snapshot())
+    return app.response_class(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_token = metrics.start_request()
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def finish_request_metrics(response):
+    if 'metrics_token' not in g:
+        return response
+    timings = metrics.finish_request(g.metrics_token)
+    endpoint = request.endpoint or "unknown"
+    if endpoint != 'metrics_endpoint':
+        metrics.observe_request(endpoint, response.status_code, time.perf_counter() - g.request_started)
+    if METRICS_DEBUG_HEADER and timings:
+        response.headers['Server-Timing'] = server_timing_header(timings)
+    if request.endpoint not in (None, 'ready') and response.status_code < 500:
+        resources.mark_request_served()
+    return response
+
+@app.route('/alignment_stats', methods=['GET'])
+def alignment_stats():
+    return jsonify(resources.aligner.stats())
+
+@app.route('/lexicon_stats', methods=['GET'])
+def lexicon_stats():
+    return jsonify(resources.lexicon.stats())
 
 @app.route('/tts', methods=['GET'])
 def tts():
@@ -193,32 +476,30 @@ def tts():
     if not text:
         return jsonify({"error": "No text provided"}), 400
     
-    # Use pyttsx3 to generate WAV
-    temp_wav = TEMP_DIR / f"tts_{os.urandom(4).hex()}.wav"
+    rate = request.args.get('rate', type=int)
+    voice = request.args.get('voice')
     
-    def run_tts():
-        engine = pyttsx3.init()
-        # Set property before saving
-        engine.setProperty('rate', 150)
-        engine.save_to_file(text, str(temp_wav))
-        engine.runAndWait()
-        # Explicitly stop the engine to release resources
-        engine.stop()
-
-    # pyttsx3 runAndWait can sometimes block or have threading issues in Flask
-    # but for local development, it's usually fine.
     try:
-        t = threading.Thread(target=run_tts)
-        t.start()
-        t.join(5) # Wait max 5 seconds
-        
-        if temp_wav.exists():
-            return send_file(str(temp_wav), mimetype="audio/wav")
+        # Cache hits are a single file send; misses are rendered once and kept.
+        # The file is opened by the cache, so evicting it meanwhile cannot break the send
+        wav_file = resources.tts_cache.open(text, rate, voice, timeout=5)
+        if wav_file is not None:
+            return send_file(wav_file, mimetype="audio/wav", max_age=86400, etag=Path(wav_file.name).stem)
         else:
             return jsonify({"error": "Failed to generate TTS"}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/tts_stats', methods=['GET'])
+def tts_stats():
+    return jsonify(resources.tts_cache.stats())
+
 if __name__ == '__main__':
     print("Advanced Voice API Server starting...")
+    if WARMUP_ON_START:
+        resources.warm_up_in_background()
+    if TTS_PREWARM:
+        from questions import load_questions
+        jobs = resources.tts_cache.prewarm(sorted({q['text'] for q in load_questions()}))
+        print(f"Pre-warming TTS cache in the background ({len(jobs)} words)...")
     app.run(host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,271 @@
+"""
+Content-addressed cache of decoded audio shared by the reference and dataset tools.
+Decoded, resampled PCM is keyed by (sha256 of the source file, target sample
+rate, mono) and stored as float32 .npy files that are memory-mapped on a hit,
+so rebuilding the references or re-converting the dataset with other MFCC
+parameters skips the MP3 decode (audioread/ffmpeg) and the resample. The
+directory is bounded in size; least recently used entries are evicted (file
+mtime is the LRU timestamp, so every process sharing the directory sees it).
+
+Usage:
+  python audio_cache.py info
+  python audio_cache.py clear
+  python audio_cache.py benchmark dataset/references/cup_ref.mp3
+"""
+
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from manifest import file_digest
+
+DEFAULT_CACHE_DIR = Path(__file__).parent / "cache" / "audio"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class AudioCache:
+    """Disk-backed decoded-audio cache with LRU eviction"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            cache_dir (str): Directory holding <sha256>.npy files
+            max_bytes (int): Evict least recently used entries above this size
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries = None  # key -> size, oldest first; read from disk when first needed
+        self._total_bytes = 0
+        self._digests = {}  # path -> (size, mtime_ns, sha256)
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def __getstate__(self):
+        # Worker processes reopen the same directory
+        return {'cache_dir': self.cache_dir, 'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['cache_dir'], state['max_bytes'])
+
+    def _scan(self):
+        """Re-read the entries from disk (other processes may have added or evicted some)"""
+        entries = {}
+        for path in self.cache_dir.glob("*.npy"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.name.startswith("."):
+                # Leftover from an interrupted write
+                if time.time() - stat.st_mtime > 3600:
+                    path.unlink(missing_ok=True)
+                continue
+            entries[path.stem] = (stat.st_size, stat.st_mtime)
+        self._entries = {key: size for key, (size, _) in sorted(entries.items(), key=lambda e: e[1][1])}
+        self._total_bytes = sum(self._entries.values())
+
+    @staticmethod
+    def make_key(content_digest, sr, mono=True):
+        """Content address of one decoding of a source"""
+        return hashlib.sha256(f"{content_digest}\0{sr}\0{int(bool(mono))}".encode('ascii')).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.npy"
+
+    def _file_digest(self, path):
+        # Unchanged size and mtime: reuse the hash from earlier in this process
+        stat = os.stat(path)
+        known = self._digests.get(path)
+        if known is not None and known[:2] == (stat.st_size, stat.st_mtime_ns):
+            return known[2]
+        digest = file_digest(path)
+        self._digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def load(self, path, sr, mono=True):
+        """
+        Audio of a file resampled to sr (same as librosa.load), decoded at most once
+
+        Args:
+            path (str): Audio file (WAV, MP3, ...)
+            sr (int): Target sample rate
+            mono (bool): Mix down to one channel
+
+        Returns:
+            numpy.ndarray: float32 samples, read-only and memory-mapped on a cache hit
+        """
+        import librosa
+
+        path = str(path)
+
+        def decode():
+            audio, _ = librosa.load(path, sr=sr, mono=mono)
+            return audio
+
+        return self.fetch(self._file_digest(path), sr, mono, decode)
+
+    def fetch(self, content_digest, sr, mono, decode):
+        """
+        Cached audio for a source, decoding and storing it on a miss
+
+        Args:
+            content_digest (str): sha256 of the encoded source
+            sr (int): Target sample rate
+            mono (bool): Mix down to one channel
+            decode (callable): Returns the samples when the entry is missing
+
+        Returns:
+            numpy.ndarray: float32 samples
+        """
+        key = self.make_key(content_digest, sr, mono)
+        audio = self._read(key)
+        if audio is not None:
+            with self._lock:
+                self._counters['hits'] += 1
+            return audio
+
+        with self._lock:
+            self._counters['misses'] += 1
+        audio = np.ascontiguousarray(decode(), dtype=np.float32)
+        self._write(key, audio)
+        return audio
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            audio = np.load(path, mmap_mode='r')
+            # mtime doubles as the LRU timestamp across processes
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            print(f"Dropping unreadable cache entry {path.name}")
+            path.unlink(missing_ok=True)
+            return None
+        return audio
+
+    def _write(self, key, audio):
+        final_path = self._path(key)
+        temp_path = self.cache_dir / f".{key}.{os.getpid()}.{threading.get_ident()}.npy"
+        try:
+            with open(temp_path, 'wb') as f:
+                np.lib.format.write_array(f, audio, allow_pickle=False)
+            os.replace(temp_path, final_path)
+        except OSError as e:
+            # A full or read-only cache never fails the decode itself
+            print(f"Could not cache decoded audio: {e}")
+            temp_path.unlink(missing_ok=True)
+            return
+        self._add(key, final_path.stat().st_size)
+
+    def _add(self, key, size):
+        with self._lock:
+            if self._entries is None:
+                self._scan()
+            self._total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            if self._total_bytes <= self.max_bytes:
+                return
+            self._scan()
+            for old_key in list(self._entries):
+                if self._total_bytes <= self.max_bytes or len(self._entries) <= 1:
+                    break
+                if old_key == key:
+                    continue
+                try:
+                    self._path(old_key).unlink(missing_ok=True)
+                except OSError:
+                    # Still mapped by a reader (Windows); try again on the next eviction
+                    continue
+                self._total_bytes -= self._entries.pop(old_key)
+                self._counters['evictions'] += 1
+
+    def clear(self):
+        """Delete every entry"""
+        with self._lock:
+            self._scan()
+            for key in list(self._entries):
+                try:
+                    self._path(key).unlink(missing_ok=True)
+                except OSError:
+                    continue
+                self._total_bytes -= self._entries.pop(key)
+
+    def stats(self):
+        with self._lock:
+            if self._entries is None:
+                self._scan()
+            return {
+                **self._counters,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+def benchmark(audio_path, sr=22050, repeats=5):
+    """Time a full decode + resample against a cache hit for one file"""
+    import tempfile
+    import librosa
+
+    def best_of(fn):
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - started)
+        return min(times) * 1000.0
+
+    decode_ms = best_of(lambda: librosa.load(str(audio_path), sr=sr))
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = AudioCache(tmp)
+        started = time.perf_counter()
+        cached = cache.load(audio_path, sr)
+        miss_ms = (time.perf_counter() - started) * 1000.0
+        hit_ms = best_of(lambda: np.asarray(cache.load(audio_path, sr)).sum())
+        expected, _ = librosa.load(str(audio_path), sr=sr)
+        identical = np.array_equal(np.asarray(cache.load(audio_path, sr)), expected)
+        del cached
+
+    print(f"{Path(audio_path).name}: {len(expected) / sr:.2f}s audio at {sr} Hz")
+    print(f"  decode + resample : {decode_ms:8.2f} ms")
+    print(f"  first load (miss) : {miss_ms:8.2f} ms")
+    print(f"  cache hit         : {hit_ms:8.2f} ms  ({decode_ms / max(hit_ms, 1e-9):.0f}x)")
+    status = "✓" if identical else "❌"
+    print(f"{status} Cached samples identical to librosa.load")
+    return decode_ms, hit_ms
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Decoded-audio cache tools")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR))
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("info", help="Entries and size")
+    sub.add_parser("clear", help="Delete every entry")
+    p_bench = sub.add_parser("benchmark", help="Decode time vs cache hit for one file")
+    p_bench.add_argument("audio_path")
+    p_bench.add_argument("--sr", type=int, default=22050)
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        benchmark(args.audio_path, args.sr)
+        return
+
+    cache = AudioCache(args.cache_dir)
+    if args.command == "clear":
+        cache.clear()
+    stats = cache.stats()
+    print(f"✓ {stats['entries']} cached decodes, {stats['bytes'] / 1e6:.1f} MB "
+          f"(limit {stats['max_bytes'] / 1e6:.0f} MB) in {cache.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+In-memory audio decoding for uploaded clips.
+PCM/float WAV uploads are parsed straight from bytes; other formats go through
+soundfile on a memory buffer, and only formats that need a real file
+(e.g. MP3/M4A via audioread/ffmpeg) are written to a temp file.
+"""
+
+import hashlib
+import io
+import os
+import struct
+import time
+from pathlib import Path
+
+import numpy as np
+import librosa
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class UnsupportedWav(ValueError):
+    """The bytes are not a WAV file the fast path understands"""
+
+
+def parse_wav(data):
+    """
+    Decode a PCM or IEEE-float WAV file held in memory
+
+    Args:
+        data (bytes): Complete RIFF/WAVE file
+
+    Returns:
+        tuple: (samples, sample_rate) - samples is float32 with shape (frames, channels)
+    """
+    if len(data) < 12 or data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise UnsupportedWav("Not a RIFF/WAVE file")
+
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        chunk_size = struct.unpack_from('<I', data, pos + 4)[0]
+        body = pos + 8
+
+        if chunk_id == b'fmt ':
+            audio_format, channels, sample_rate, _, block_align, bits = struct.unpack_from('<HHIIHH', data, body)
+            if audio_format == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # First two bytes of the SubFormat GUID carry the real format code
+                audio_format = struct.unpack_from('<H', data, body + 24)[0]
+            fmt = (audio_format, channels, sample_rate, block_align, bits)
+
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise UnsupportedWav("data chunk before fmt chunk")
+            # Streamed writers may leave the size at 0 or 0xFFFFFFFF
+            end = len(data) if chunk_size in (0, 0xFFFFFFFF) else min(body + chunk_size, len(data))
+            return _decode_frames(data[body:end], *fmt)
+
+        pos = body + chunk_size + (chunk_size & 1)
+
+    raise UnsupportedWav("No data chunk found")
+
+
+def _decode_frames(raw, audio_format, channels, sample_rate, block_align, bits):
+    if channels < 1 or block_align < 1:
+        raise UnsupportedWav("Invalid fmt chunk")
+
+    sample_width = block_align // channels
+    raw = raw[:len(raw) - len(raw) % block_align]
+
+    if audio_format == WAVE_FORMAT_PCM:
+        if sample_width == 1:
+            samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+        elif sample_width == 2:
+            samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+        elif sample_width == 3:
+            b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            ints = (b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)) << 8 >> 8
+            samples = ints.astype(np.float32) / 8388608.0
+        elif sample_width == 4:
+            samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+        else:
+            raise UnsupportedWav(f"Unsupported PCM width: {bits} bits")
+    elif audio_format == WAVE_FORMAT_IEEE_FLOAT:
+        if sample_width == 4:
+            samples = np.frombuffer(raw, dtype='<f4').astype(np.float32)
+        elif sample_width == 8:
+            samples = np.frombuffer(raw, dtype='<f8').astype(np.float32)
+        else:
+            raise UnsupportedWav(f"Unsupported float width: {bits} bits")
+    else:
+        raise UnsupportedWav(f"Compressed WAV format 0x{audio_format:04x}")
+
+    return samples.reshape(-1, channels), sample_rate
+
+
+def _decode_with_soundfile(data):
+    import soundfile as sf
+    samples, sample_rate = sf.read(io.BytesIO(data), dtype='float32', always_2d=True)
+    return samples, sample_rate
+
+
+def _decode_with_temp_file(data, target_sr, temp_dir):
+    """Last resort for decoders (audioread/ffmpeg) that only accept a path"""
+    temp_dir = Path(temp_dir)
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    temp_path = temp_dir / f"decode_{os.urandom(4).hex()}"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        speech, _ = librosa.load(str(temp_path), sr=target_sr, mono=True)
+        return speech.astype(np.float32, copy=False)
+    finally:
+        if temp_path.exists():
+            os.remove(temp_path)
+
+
+def decode_audio(data, target_sr, temp_dir=None, timings=None, cache=None):
+    """
+    Decode an uploaded clip to mono float32 at target_sr
+
+    Args:
+        data (bytes): Encoded audio file contents
+        target_sr (int): Output sample rate (resampled once, in memory)
+        temp_dir (str, optional): Where to spill compressed formats that need a file
+        timings (dict, optional): Filled with decode and resample seconds
+        cache (audio_cache.AudioCache, optional): Reuse the decode of identical uploads
+
+    Returns:
+        numpy.ndarray: Mono float32 samples
+    """
+    if not data:
+        raise ValueError("Audio file is empty (0 bytes).")
+
+    if cache is not None:
+        # Timings are only filled when the clip is actually decoded
+        return cache.fetch(hashlib.sha256(data).hexdigest(), target_sr, True,
+                           lambda: decode_audio(data, target_sr, temp_dir, timings))
+
+    started = time.perf_counter()
+    try:
+        samples, sr = parse_wav(data)
+    except (UnsupportedWav, struct.error) as wav_error:
+        try:
+            samples, sr = _decode_with_soundfile(data)
+        except Exception as sf_error:
+            if temp_dir is None:
+                raise RuntimeError(
+                    f"Could not decode audio. WAV error: {wav_error}. soundfile error: {sf_error}"
+                )
+            print(f"In-memory decode failed ({sf_error}); falling back to temp file")
+            speech = _decode_with_temp_file(data, target_sr, temp_dir)
+            if timings is not None:
+                # librosa.load decodes and resamples in one call
+                timings["decode"] = time.perf_counter() - started
+            return speech
+
+    # Same mono mix-down and resampler as librosa.load
+    speech = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+    decoded = time.perf_counter()
+    if sr != target_sr:
+        speech = librosa.resample(speech, orig_sr=sr, target_sr=target_sr)
+    if timings is not None:
+        timings["decode"] = decoded - started
+        timings["resample"] = time.perf_counter() - decoded
+    return np.ascontiguousarray(speech, dtype=np.float32)
@@ -0,0 +1,433 @@
+"""
+Checkpointed reference build for the whole questions table.
+Reads the vocabulary from the questions dump (db.sql) or the live MySQL
+database, splits it into shards by a stable hash of the word and runs each
+shard in its own process (download -> MFCC -> JSON pipeline of
+fetch_and_generate.BatchGenerator). Every finished or failed word is appended
+to the shard's checkpoint file (output/reference_build/checkpoint-<n>.jsonl),
+so an interrupted run resumes where it stopped: words already done are
+skipped, failed ones are retried. When the shards are finished, the JSON of
+every done word is merged into the reference store (reference_store.bin/.json)
+by a single writer. Progress is printed periodically and a machine-readable
+report.json with per-stage timings, failure reasons and the merge is written
+at the end.
+
+Usage:
+  python build_references.py                      # every question in db.sql
+  python build_references.py --mysql              # read the live questions table
+  python build_references.py --shards 4 --levels kids --limit 200
+  python build_references.py --fresh              # ignore earlier checkpoints
+  python build_references.py --store-dir out/     # reference store somewhere else
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent
+DEFAULT_JOB_DIR = SCRIPT_DIR / "output" / "reference_build"
+STAGES = ("download", "features", "write")
+
+
+def shard_of(word, shards):
+    """Stable shard of a word (the same in every run, unlike hash())"""
+    return int(hashlib.sha1(word.encode('utf-8')).hexdigest()[:8], 16) % shards
+
+
+def json_path_for(json_dir, word):
+    """<word>_mfcc.json as written by BatchGenerator"""
+    return Path(json_dir) / f"{word.replace(' ', '_')}_mfcc.json"
+
+
+class Checkpoint:
+    """Append-only JSON lines of finished words, one file per shard"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def record(self, word, stage=None, error=None):
+        entry = {'word': word, 'status': 'failed' if stage else 'done',
+                 'time': datetime.now(timezone.utc).isoformat(timespec='seconds')}
+        if stage:
+            entry.update(stage=stage, error=error)
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        # On disk before the next word: a crash loses at most the word in progress
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def read_checkpoints(job_dir):
+    """
+    Returns:
+        dict: word -> last checkpoint entry, over every shard file
+    """
+    entries = {}
+    for path in sorted(Path(job_dir).glob("checkpoint-*.jsonl")):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line of a killed run
+                    continue
+                entries[entry['word']] = entry
+    return entries
+
+
+def load_vocabulary(sql_path=None, mysql=None, levels=None):
+    """
+    Returns:
+        dict: normalized question text -> question id (first id wins), in table order
+    """
+    from questions import DEFAULT_SQL_PATH, load_questions, load_questions_from_mysql
+
+    questions = load_questions_from_mysql(**mysql) if mysql is not None else load_questions(
+        sql_path or DEFAULT_SQL_PATH)
+    vocabulary = {}
+    for q in questions:
+        if levels and q['level'] not in levels:
+            continue
+        word = q['text'].lower().strip()
+        if word:
+            vocabulary.setdefault(word, q['id'])
+    return vocabulary
+
+
+def _run_shard(shard, words, question_ids, config):
+    """
+    Runs in its own process: one BatchGenerator over this shard's words, with
+    per-word output going to shard-<n>.log
+
+    Returns:
+        dict: Shard report (words, done, failed, seconds, stages, downloads, failures)
+    """
+    from downloader import Downloader
+    from fetch_and_generate import BatchGenerator
+
+    job_dir = Path(config['job_dir'])
+    checkpoint = Checkpoint(job_dir / f"checkpoint-{shard}.jsonl")
+    report = {'shard': shard, 'words': len(words), 'done': 0, 'failed': 0, 'failures': []}
+
+    def on_result(word, stage, error):
+        checkpoint.record(word, stage, error)
+        if stage:
+            report['failed'] += 1
+            report['failures'].append({'word': word, 'stage': stage, 'error': error})
+        else:
+            report['done'] += 1
+
+    started = time.perf_counter()
+    try:
+        with open(job_dir / f"shard-{shard}.log", 'a', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+            generator = BatchGenerator(
+                config['csv_path'], words, config['audio_dir'], config['json_dir'],
+                downloader=Downloader(workers=config['download_workers'], rate=config['rate'],
+                                      burst=config['burst']),
+                prefer=config['prefer'],
+                # The shards are the CPU parallelism; features run in a thread of each
+                feature_workers=0,
+                question_ids=question_ids,
+                on_result=on_result
+            )
+            generator.process_all()
+        report['stages'] = {name: counters.snapshot() for name, counters in generator.stage_counters.items()}
+        report['downloads'] = generator.downloader.stats()
+    except Exception as e:
+        report['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        checkpoint.close()
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def merge_into_store(json_dir, store_dir, words, question_ids):
+    """
+    Add or replace the MFCC of finished words in the reference store, with one
+    writer after all shards are done (the shards only write JSON). Entries of
+    other words are kept when they were made with the same MFCC parameters.
+
+    Args:
+        words (list): Done words; their <word>_mfcc.json is read from json_dir
+        question_ids (dict): word -> question id, for JSON files without one
+
+    Returns:
+        dict: path, merged, kept, dropped, errors and seconds of the merge
+    """
+    import numpy as np
+    from reference_store import JSON_FRAME_PARAMS, ReferenceStore, ReferenceStoreWriter, store_paths
+
+    started = time.perf_counter()
+    previous = ReferenceStore.open_if_exists(store_dir)
+    writer = None
+    params = None
+    errors = []
+    merged = kept = dropped = 0
+    try:
+        for word in words:
+            try:
+                with open(json_path_for(json_dir, word), 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                mfcc = np.array(data['mfcc'], dtype=np.float32)
+                word_params = {"n_mfcc": data.get("n_mfcc"), "sr": data.get("sample_rate"), **JSON_FRAME_PARAMS}
+                if params is None:
+                    params = word_params
+                    writer = ReferenceStoreWriter(store_dir, params)
+                elif word_params != params:
+                    raise ValueError(f"made with {word_params}, store has {params}")
+                writer.add(word, mfcc, data.get('question_id') or question_ids.get(word, 0))
+                merged += 1
+            except (OSError, ValueError, KeyError) as e:
+                errors.append({'word': word, 'error': f"{type(e).__name__}: {e}"})
+
+        if writer is not None and previous is not None:
+            for word in previous.words():
+                if word in writer.entries:
+                    continue
+                if previous.params != params:
+                    dropped += 1
+                    continue
+                writer.add(word, np.array(previous.get(word)), previous.entries[word]['question_id'])
+                kept += 1
+    except BaseException:
+        # The previous store stays in place
+        if writer is not None:
+            writer.abort()
+        if previous is not None:
+            previous.close()
+        raise
+
+    # Release the old mapping before the new store replaces it
+    if previous is not None:
+        previous.close()
+    if writer is not None:
+        writer.close()
+    return {
+        'path': str(store_paths(store_dir)[0]),
+        'merged': merged,
+        'kept': kept,
+        'dropped': dropped,
+        'errors': errors,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def _failure_reason(failure):
+    """Failure grouped by stage and the error text without its URL"""
+    error = (failure.get('error') or '').split(' for url')[0].split(' after ')[0]
+    return f"{failure['stage']}: {error[:80]}"
+
+
+def _merge_report(shard_reports, job):
+    stages = {}
+    for name in STAGES:
+        rows = [r['stages'][name] for r in shard_reports if 'stages' in r]
+        items = sum(row['items'] for row in rows)
+        stages[name] = {
+            'items': items,
+            'errors': sum(row['errors'] for row in rows),
+            'busy_s': round(sum(row['busy_s'] for row in rows), 3),
+            'wall_s': max((row['wall_s'] for row in rows), default=0.0),
+            # Throughput of the stage across all shards over the whole run
+            'items_per_s': round(items / job['seconds'], 2) if job['seconds'] else None
+        }
+    failures = sorted((f for r in shard_reports for f in r['failures']), key=lambda f: f['word'])
+    return dict(job,
+                done=sum(r['done'] for r in shard_reports),
+                failed=len(failures),
+                stages=stages,
+                failure_reasons=dict(Counter(_failure_reason(f) for f in failures).most_common()),
+                failures=failures,
+                shards=[{k: v for k, v in r.items() if k != 'failures'} for r in shard_reports])
+
+
+def _write_report(path, report):
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def run_job(csv_path, audio_dir, json_dir, job_dir=DEFAULT_JOB_DIR, sql_path=None, mysql=None, levels=None,
+            limit=None, shards=None, download_workers=4, rate=4.0, burst=4, prefer='us', fresh=False,
+            retry_failed=True, progress_every=10.0, store_dir=None):
+    """
+    Build (or resume building) references for the whole vocabulary
+
+    Args:
+        shards (int, optional): Processes (default: CPU count); the per-host rate is split between them
+        rate (float): Total download requests per second per host
+        fresh (bool): Delete earlier checkpoints and start over
+        retry_failed (bool): Retry words that failed in an earlier run
+        store_dir (str, optional): Reference store the done words are merged into (default: json_dir)
+
+    Returns:
+        dict: The run report (also written to <job_dir>/report.json)
+    """
+    from word_index import WordIndex
+
+    job_dir = Path(job_dir)
+    job_dir.mkdir(parents=True, exist_ok=True)
+    if fresh:
+        for path in job_dir.glob("checkpoint-*.jsonl"):
+            path.unlink()
+
+    vocabulary = load_vocabulary(sql_path, mysql, levels)
+    words = list(vocabulary)[:limit] if limit else list(vocabulary)
+    previous = read_checkpoints(job_dir)
+    remaining = []
+    already_done = failed_before = 0
+    for word in words:
+        entry = previous.get(word)
+        if entry and entry['status'] == 'done' and json_path_for(json_dir, word).exists():
+            already_done += 1
+            continue
+        if entry and entry['status'] == 'failed':
+            failed_before += 1
+            if not retry_failed:
+                continue
+        remaining.append(word)
+
+    shards = max(1, min(shards or os.cpu_count() or 1, len(remaining) or 1))
+    print("=" * 60)
+    print("REFERENCE BUILD")
+    print("=" * 60)
+    print(f"Vocabulary : {len(words)} words ({already_done} already done, {failed_before} failed before"
+          f"{', retried' if retry_failed else ', skipped'})")
+    print(f"To process : {len(remaining)} in {shards} shards")
+    print(f"Checkpoints: {job_dir}")
+    print("=" * 60)
+
+    # Build or refresh the word index once, before the shards open it
+    WordIndex(csv_path).close()
+
+    config = {
+        'csv_path': str(csv_path), 'audio_dir': str(audio_dir), 'json_dir': str(json_dir),
+        'job_dir': str(job_dir), 'prefer': prefer, 'download_workers': download_workers,
+        'rate': rate / shards, 'burst': max(1, burst // shards)
+    }
+    by_shard = [[] for _ in range(shards)]
+    for word in remaining:
+        by_shard[shard_of(word, shards)].append(word)
+
+    started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    started = time.perf_counter()
+    shard_reports = []
+    with ProcessPoolExecutor(max_workers=shards) as pool:
+        pending = {pool.submit(_run_shard, shard, shard_words, {w: vocabulary[w] for w in shard_words}, config): shard
+                   for shard, shard_words in enumerate(by_shard) if shard_words}
+        while pending:
+            done, _ = wait(pending, timeout=progress_every, return_when=FIRST_COMPLETED)
+            for future in done:
+                shard = pending.pop(future)
+                try:
+                    shard_reports.append(future.result())
+                except Exception as e:
+                    # The shard process died; its checkpoint still has what it finished
+                    shard_reports.append({'shard': shard, 'words': len(by_shard[shard]), 'done': 0, 'failed': 0,
+                                          'failures': [], 'error': f"{type(e).__name__}: {e}"})
+            if pending:
+                _print_progress(job_dir, remaining, started_at, time.perf_counter() - started)
+
+    seconds = time.perf_counter() - started
+    job = {
+        'started': started_at,
+        'seconds': round(seconds, 3),
+        'vocabulary': len(words),
+        'already_done': already_done,
+        'failed_before': failed_before,
+        'retried_failed': retry_failed,
+        'attempted': len(remaining),
+        'shards_used': shards
+    }
+    report = _merge_report(sorted(shard_reports, key=lambda r: r['shard']), job)
+    report['unfinished'] = report['attempted'] - report['done'] - report['failed']
+
+    # Every done word, including earlier runs', so a merge that was interrupted is completed
+    entries = read_checkpoints(job_dir)
+    done_words = [w for w in words if entries.get(w, {}).get('status') == 'done'
+                  and json_path_for(json_dir, w).exists()]
+    print(f"\nMerging {len(done_words)} references into the reference store...")
+    report['store'] = merge_into_store(json_dir, store_dir or json_dir, done_words, vocabulary)
+    _write_report(job_dir / "report.json", report)
+
+    print(f"\n✓ Done: {report['done']}, failed: {report['failed']}, unfinished: {report['unfinished']} "
+          f"({seconds:.1f}s)")
+    for name, row in report['stages'].items():
+        print(f"  {name:<9} {row['items']:>6} items  {row['errors']:>4} errors  busy {row['busy_s']:>8.1f}s")
+    for reason, count in list(report['failure_reasons'].items())[:10]:
+        print(f"  ✗ {count:>5}  {reason}")
+    for shard in report['shards']:
+        if shard.get('error'):
+            print(f"  ❌ shard {shard['shard']} stopped: {shard['error']}")
+    store = report['store']
+    print(f"Store: {store['merged']} merged, {store['kept']} kept, {len(store['errors'])} errors "
+          f"({store['seconds']:.1f}s) -> {store['path']}")
+    if store['dropped']:
+        print(f"  ❌ dropped {store['dropped']} store entries made with other MFCC parameters")
+    for error in store['errors'][:10]:
+        print(f"  ✗ {error['word']}: {error['error']}")
+    print(f"Report: {job_dir / 'report.json'}")
+    return report
+
+
+def _print_progress(job_dir, remaining, started_at, elapsed):
+    entries = read_checkpoints(job_dir)
+    # Retried words still carry the entry of their earlier failure until they finish again
+    finished = [entries[w] for w in remaining if w in entries and entries[w]['time'] >= started_at]
+    done = sum(1 for e in finished if e['status'] == 'done')
+    failed = len(finished) - done
+    rate = len(finished) / elapsed if elapsed > 0 else 0.0
+    left = len(remaining) - len(finished)
+    eta = f"{left / rate / 60:.1f} min" if rate > 0 else "-"
+    print(f"[{elapsed:7.0f}s] {len(finished)}/{len(remaining)} ({done} done, {failed} failed), "
+          f"{rate:.2f} words/s, ETA {eta}")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Checkpointed reference build for the questions table")
+    parser.add_argument("--csv", default=str(SCRIPT_DIR / "archive" / "text_audio_urls.csv"))
+    parser.add_argument("--audio-dir", default=str(SCRIPT_DIR / "dataset" / "references"))
+    parser.add_argument("--json-dir", default=str(SCRIPT_DIR / "references"))
+    parser.add_argument("--store-dir", default=None,
+                        help="Reference store the results are merged into (default: --json-dir)")
+    parser.add_argument("--job-dir", default=str(DEFAULT_JOB_DIR), help="Checkpoints, shard logs and report.json")
+    parser.add_argument("--sql", default=None, help="questions dump (default: db.sql)")
+    parser.add_argument("--mysql", action="store_true", help="Read the live questions table (needs pymysql)")
+    parser.add_argument("--mysql-host", default="localhost")
+    parser.add_argument("--mysql-user", default="root")
+    parser.add_argument("--mysql-password", default="")
+    parser.add_argument("--mysql-database", default="db_vr")
+    parser.add_argument("--levels", default=None, help="Only these levels, e.g. kids,teen")
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N words (trial runs)")
+    parser.add_argument("--shards", type=int, default=None, help="Processes (default: CPU count)")
+    parser.add_argument("--download-workers", type=int, default=4, help="Download threads per shard")
+    parser.add_argument("--rate", type=float, default=4.0, help="Requests per second per host, all shards together")
+    parser.add_argument("--prefer", choices=["us", "gb"], default="us")
+    parser.add_argument("--fresh", action="store_true", help="Ignore and delete earlier checkpoints")
+    parser.add_argument("--skip-failed", action="store_true", help="Do not retry words that failed before")
+    args = parser.parse_args()
+
+    mysql = None
+    if args.mysql:
+        mysql = {'host': args.mysql_host, 'user': args.mysql_user, 'password': args.mysql_password,
+                 'database': args.mysql_database}
+    run_job(args.csv, args.audio_dir, args.json_dir, args.job_dir, sql_path=args.sql, mysql=mysql,
+            levels=args.levels.split(",") if args.levels else None, limit=args.limit, shards=args.shards,
+            download_workers=args.download_workers, rate=args.rate, prefer=args.prefer, fresh=args.fresh,
+            retry_failed=not args.skip_failed, store_dir=args.store_dir)
+
+
+if __name__ == "__main__":
+    main()
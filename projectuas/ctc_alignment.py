@@ -0,0 +1,186 @@
+"""
+CTC forced alignment on the log-probabilities /compare already computes.
+A single Viterbi pass over the frames, vectorized across the blank-extended
+target sequence, gives each target character a frame span; words get time
+spans and frame-averaged confidence without a second model call.
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+def log_softmax(logits):
+    """Numerically stable log-softmax over the last axis"""
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+
+def viterbi_align(log_probs, targets, blank=0):
+    """
+    Best CTC path for a known label sequence
+
+    Args:
+        log_probs (numpy.ndarray): (frames, vocab) log-probabilities
+        targets (list): Label ids, without blanks
+        blank (int): Blank label id
+
+    Returns:
+        numpy.ndarray: Index into `targets` per frame, -1 for blank frames,
+                       or None if the clip is too short for the targets
+    """
+    T = log_probs.shape[0]
+    L = len(targets)
+    if L == 0 or T == 0:
+        return None
+
+    # Extended sequence: blank, t0, blank, t1, ..., blank
+    S = 2 * L + 1
+    ext = np.full(S, blank, dtype=np.int64)
+    ext[1::2] = targets
+
+    # Skipping over a blank is allowed unless it separates two equal labels
+    can_skip = np.zeros(S, dtype=bool)
+    can_skip[3::2] = ext[3::2] != ext[1:-2:2]
+
+    neg_inf = -np.inf
+    emit = log_probs[:, ext]  # (T, S)
+    alpha = np.full(S, neg_inf)
+    alpha[0] = emit[0, 0]
+    alpha[1] = emit[0, 1]
+    back = np.zeros((T, S), dtype=np.int8)
+
+    stay = np.empty(S)
+    step = np.empty(S)
+    skip = np.empty(S)
+    for t in range(1, T):
+        stay[:] = alpha
+        step[0] = neg_inf
+        step[1:] = alpha[:-1]
+        skip[:2] = neg_inf
+        skip[2:] = np.where(can_skip[2:], alpha[:-2], neg_inf)
+
+        choice = np.argmax(np.stack((stay, step, skip)), axis=0)
+        best = np.choose(choice, (stay, step, skip))
+        back[t] = choice
+        alpha = best + emit[t]
+
+    end_state = S - 1 if alpha[S - 1] >= alpha[S - 2] else S - 2
+    if not np.isfinite(alpha[end_state]):
+        return None
+
+    states = np.empty(T, dtype=np.int64)
+    s = end_state
+    for t in range(T - 1, -1, -1):
+        states[t] = s
+        s -= back[t, s]
+
+    # Odd states are labels; map them back to target positions
+    return np.where(states % 2 == 1, states // 2, -1)
+
+
+class CTCAligner:
+    """Word time spans and confidences from CTC log-probabilities"""
+
+    def __init__(self, vocab, blank_id=0, word_delimiter="|", frame_duration=0.02, history_size=1000):
+        """
+        Args:
+            vocab (dict): Character -> label id (tokenizer vocabulary)
+            blank_id (int): CTC blank (pad) id
+            word_delimiter (str): Token that separates words
+            frame_duration (float): Seconds per logit frame
+        """
+        self.vocab = vocab
+        self.blank_id = blank_id
+        self.word_delimiter = word_delimiter
+        self.frame_duration = frame_duration
+
+        self._lock = threading.Lock()
+        self._costs = deque(maxlen=history_size)
+        self._calls = 0
+        self._failures = 0
+
+    def encode(self, words):
+        """Label ids for the words plus, per label, the word and character it came from"""
+        targets = []
+        owners = []
+        delimiter = self.vocab.get(self.word_delimiter)
+        for w, word in enumerate(words):
+            if w > 0 and delimiter is not None:
+                targets.append(delimiter)
+                owners.append((None, None))
+            for c, char in enumerate(word):
+                label = self.vocab.get(char)
+                if label is not None:
+                    targets.append(label)
+                    owners.append((w, c))
+        return targets, owners
+
+    def align_words(self, log_probs, words):
+        """
+        Args:
+            log_probs (numpy.ndarray): (frames, vocab) log-probabilities
+            words (list): Target words, upper case
+
+        Returns:
+            list: One dict per word with start/end (s), confidence (0-1) and
+                  per-character confidences, or None if alignment failed
+        """
+        started = time.perf_counter()
+        try:
+            targets, owners = self.encode(words)
+            positions = viterbi_align(log_probs, targets, self.blank_id)
+            if positions is None:
+                with self._lock:
+                    self._failures += 1
+                return None
+
+            frames = np.nonzero(positions >= 0)[0]
+            labels = positions[frames]
+            frame_probs = np.exp(log_probs[frames, np.asarray(targets)[labels]])
+
+            results = [{"start": None, "end": None, "confidence": 0.0,
+                        "char_confidence": [0.0] * len(word)} for word in words]
+            word_frames = [[] for _ in words]
+            for frame, label, prob in zip(frames, labels, frame_probs):
+                w, c = owners[label]
+                if w is None:
+                    continue
+                word_frames[w].append((frame, c, prob))
+
+            for w, entries in enumerate(word_frames):
+                if not entries:
+                    continue
+                f = np.array([e[0] for e in entries])
+                c = np.array([e[1] for e in entries])
+                p = np.array([e[2] for e in entries])
+                results[w]["start"] = round(float(f.min()) * self.frame_duration, 3)
+                results[w]["end"] = round(float(f.max() + 1) * self.frame_duration, 3)
+                results[w]["confidence"] = float(p.mean())
+                sums = np.bincount(c, weights=p, minlength=len(words[w]))
+                counts = np.bincount(c, minlength=len(words[w]))
+                results[w]["char_confidence"] = [
+                    float(s / n) if n else 0.0 for s, n in zip(sums, counts)
+                ]
+            return results
+        finally:
+            with self._lock:
+                self._calls += 1
+                self._costs.append(time.perf_counter() - started)
+
+    def stats(self):
+        """Per-request alignment cost"""
+        with self._lock:
+            costs = np.array(self._costs, dtype=np.float64) * 1000.0
+            calls, failures = self._calls, self._failures
+        if costs.size == 0:
+            return {"calls": calls, "failures": failures, "cost_ms": None}
+        p50, p95, p99 = np.percentile(costs, [50, 95, 99])
+        return {
+            "calls": calls,
+            "failures": failures,
+            "cost_ms": {"p50": round(float(p50), 3), "p95": round(float(p95), 3),
+                        "p99": round(float(p99), 3), "mean": round(float(costs.mean()), 3)}
+        }
@@ -0,0 +1,601 @@
+"""
+Concurrent audio downloads for fetch_and_generate.py.
+A small thread pool shares keep-alive connections (one requests.Session per
+worker thread, so a host is only handshaked once per thread), every request
+first takes a token from a per-host token bucket instead of sleeping a fixed
+time after each file, and connection errors, timeouts, 429 and 5xx responses
+are retried with exponential backoff (Retry-After is honoured).
+
+Files are streamed in chunks to <name>.part and renamed into place only after
+their length (Content-Length / Content-Range) is verified, so an interrupted
+run never leaves a truncated file under the final name. A retry or a later run
+resumes the .part file with a Range request (If-Range guards against the file
+having changed). Each finished file gets a <name>.meta.json sidecar with its
+ETag, Last-Modified, length and sha256: an existing file is only trusted if
+its length matches, and with revalidate it is re-checked with a conditional
+GET (304 Not Modified costs no body).
+
+Usage:
+  python downloader.py selftest      # against a local HTTP stand-in server
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError
+
+from manifest import file_digest
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Small enough that a dropped connection loses little of a typical ~30 KB MP3
+CHUNK_SIZE = 16 * 1024
+
+
+def _part_path(path):
+    """<name>.part: the file while it is being downloaded"""
+    return path.with_name(path.name + '.part')
+
+
+def _meta_path(path):
+    """<name>.meta.json: url, ETag, Last-Modified, length and sha256 of a file"""
+    return path.with_name(path.name + '.meta.json')
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def _discard(part_path, part_meta_path):
+    part_path.unlink(missing_ok=True)
+    part_meta_path.unlink(missing_ok=True)
+
+
+def _content_range(value):
+    """'bytes 100-199/200' -> (100, 200); total is None when unknown ('*')"""
+    match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", value.strip())
+    if not match:
+        return None, None
+    return int(match.group(1)), None if match.group(2) == '*' else int(match.group(2))
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `burst`"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, waiting until it is available
+
+        Returns:
+            float: Seconds waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # A negative balance reserves a future token, so waiters are served in order
+            self._tokens -= 1.0
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class HostRateLimiter:
+    """One TokenBucket per host"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return bucket.acquire()
+
+
+class DownloadError(RuntimeError):
+    """A download failed for good (after the retries, or with a non-retryable status)"""
+
+    def __init__(self, message, attempts):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class Downloader:
+    """Pooled, rate-limited HTTP GETs with retry"""
+
+    def __init__(self, workers=4, rate=4.0, burst=4, retries=3, backoff=0.5, timeout=15,
+                 headers=None, revalidate=False):
+        """
+        Args:
+            workers (int): Concurrent downloads
+            rate (float): Requests per second per host (token bucket refill rate)
+            burst (int): Requests a host may receive back to back
+            retries (int): Extra attempts after a retryable failure
+            backoff (float): First retry delay in seconds, doubled per attempt
+            timeout (float): Connect/read timeout per request
+            headers (dict, optional): Sent with every request (default: browser User-Agent)
+            revalidate (bool): Re-check existing files with a conditional GET instead of keeping them
+        """
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.revalidate = revalidate
+        self.headers = headers if headers is not None else {'User-Agent': USER_AGENT}
+        self.limiter = HostRateLimiter(rate, burst)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'retries': 0, 'downloaded': 0, 'resumed': 0, 'not_modified': 0,
+                          'failed': 0, 'bytes': 0, 'rate_wait_s': 0.0}
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+        return session
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self._counters[key] += value
+
+    def _retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return float(retry_after)
+        # Exponential backoff with jitter so parallel retries do not line up
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _request(self, session, url, headers):
+        """One rate-limited streamed GET; the caller closes the response"""
+        self._count(requests=1, rate_wait_s=self.limiter.acquire(url))
+        return session.get(url, headers=headers, timeout=self.timeout, stream=True)
+
+    def _fetch_to_file(self, url, output_path, validators=None, expected_sha256=None):
+        """
+        Stream a URL into <output_path>.part, resuming a partial file with a Range
+        request, verify its length and checksum and rename it into place
+
+        Args:
+            validators (dict, optional): Sidecar of the current file; sent as
+                If-None-Match / If-Modified-Since for a conditional GET
+
+        Returns:
+            tuple: (status 'downloaded' / 'resumed' / 'not_modified', attempts)
+        """
+        part_path = _part_path(output_path)
+        part_meta_path = _meta_path(part_path)
+        session = self._session()
+
+        for attempt in range(self.retries + 1):
+            # A partial file can only be resumed if we know which version it belongs to
+            part_meta = _read_json(part_meta_path) or {}
+            offset = 0
+            if part_path.exists() and part_meta.get('url') == url and (
+                    part_meta.get('etag') or part_meta.get('last_modified')):
+                offset = part_path.stat().st_size
+            else:
+                _discard(part_path, part_meta_path)
+
+            # Identity encoding: Range offsets and Content-Length count file bytes
+            headers = {'Accept-Encoding': 'identity'}
+            if offset:
+                headers['Range'] = f"bytes={offset}-"
+                # The server answers 200 with the whole new file if it changed meanwhile
+                headers['If-Range'] = part_meta.get('etag') or part_meta['last_modified']
+            elif validators:
+                if validators.get('etag'):
+                    headers['If-None-Match'] = validators['etag']
+                if validators.get('last_modified'):
+                    headers['If-Modified-Since'] = validators['last_modified']
+
+            response = None
+            try:
+                response = self._request(session, url, headers)
+                with response:
+                    if response.status_code == 304 and validators and not offset:
+                        return 'not_modified', attempt + 1
+                    if response.status_code == 416:
+                        # Stale partial file: start over
+                        _discard(part_path, part_meta_path)
+                        error = "HTTP 416 for a partial download"
+                    elif response.status_code in RETRY_STATUS:
+                        error = f"HTTP {response.status_code}"
+                        # Read the (small) error body so the connection can be reused
+                        response.content
+                    else:
+                        response.raise_for_status()
+                        if response.status_code not in (200, 206):
+                            raise DownloadError(f"Unexpected HTTP {response.status_code}", attempt + 1)
+                        error, offset = self._stream_response(url, response, offset, part_path, part_meta_path)
+                if error is None:
+                    digest = file_digest(part_path)
+                    if expected_sha256 and digest != expected_sha256.lower():
+                        _discard(part_path, part_meta_path)
+                        raise DownloadError(f"sha256 mismatch: got {digest}", attempt + 1)
+                    meta = _read_json(part_meta_path)
+                    meta.update(length=part_path.stat().st_size, sha256=digest)
+                    os.replace(part_path, output_path)
+                    _write_json(_meta_path(output_path), meta)
+                    part_meta_path.unlink(missing_ok=True)
+                    return ('resumed' if offset else 'downloaded'), attempt + 1
+            except (requests.ConnectionError, requests.Timeout, ChunkedEncodingError) as e:
+                # Whatever reached the .part file is kept for the next attempt
+                error = f"{type(e).__name__}: {e}"
+            except requests.HTTPError as e:
+                raise DownloadError(str(e), attempt + 1) from None
+
+            if attempt == self.retries:
+                raise DownloadError(f"{error} after {attempt + 1} attempts", attempt + 1)
+            self._count(retries=1)
+            time.sleep(self._retry_delay(attempt, response))
+
+    def _stream_response(self, url, response, offset, part_path, part_meta_path):
+        """
+        Write the body to the .part file in chunks
+
+        Returns:
+            tuple: (why the body is incomplete (retryable) or None, offset the body was written at)
+        """
+        if response.status_code == 206:
+            start, total = _content_range(response.headers.get('Content-Range', ''))
+            if start != offset:
+                _discard(part_path, part_meta_path)
+                return f"Content-Range starts at {start}, expected {offset}", offset
+            mode = 'ab'
+        else:
+            # 200: the whole file (no partial file, or it no longer matches)
+            offset = 0
+            length = response.headers.get('Content-Length')
+            total = int(length) if length and length.isdigit() else None
+            mode = 'wb'
+            _write_json(part_meta_path, {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            })
+
+        part_path.parent.mkdir(parents=True, exist_ok=True)
+        received = 0
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                received += len(chunk)
+        self._count(bytes=received)
+
+        size = part_path.stat().st_size
+        if total is not None and size != total:
+            return f"incomplete body: {size} of {total} bytes", offset
+        return None, offset
+
+    def download(self, url, output_path, expected_sha256=None, revalidate=None):
+        """
+        Save a URL to a file. A file that was completely downloaded (it has a
+        <name>.meta.json sidecar with a matching length) is kept, or with
+        revalidate re-checked with a conditional GET (304 = still current)
+
+        Args:
+            expected_sha256 (str, optional): Reject the download if the content differs
+            revalidate (bool, optional): Override the downloader's revalidate setting
+
+        Returns:
+            dict: url, path, status ('downloaded' / 'resumed' / 'not_modified' /
+                  'exists' / 'error'), attempts, seconds, error
+        """
+        output_path = Path(output_path)
+        revalidate = self.revalidate if revalidate is None else revalidate
+        result = {'url': url, 'path': output_path, 'status': 'exists', 'attempts': 0, 'seconds': 0.0}
+
+        validators = None
+        if output_path.exists():
+            meta = _read_json(_meta_path(output_path))
+            if meta is None:
+                # Downloaded before sidecars existed: nothing to check it against
+                return result
+            if meta.get('length') == output_path.stat().st_size and (
+                    not expected_sha256 or meta.get('sha256') == expected_sha256.lower()):
+                if not revalidate or meta.get('url') != url:
+                    return result
+                validators = meta
+            else:
+                print(f"  - {output_path.name} does not match its sidecar; downloading again")
+
+        started = time.perf_counter()
+        try:
+            result['status'], result['attempts'] = self._fetch_to_file(url, output_path, validators, expected_sha256)
+            self._count(**{result['status']: 1})
+        except (DownloadError, OSError) as e:
+            result['status'] = 'error'
+            result['attempts'] = getattr(e, 'attempts', result['attempts'])
+            result['error'] = str(e)
+            self._count(failed=1)
+        result['seconds'] = time.perf_counter() - started
+        return result
+
+    def download_many(self, jobs):
+        """
+        Download (key, url, output_path) jobs on the worker pool
+
+        Yields:
+            tuple: (key, result dict of download()) in completion order
+        """
+        jobs = iter(jobs)
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download") as pool:
+            def submit_next():
+                job = next(jobs, None)
+                if job is None:
+                    return False
+                key, url, output_path = job
+                pending[pool.submit(self.download, url, output_path)] = key
+                return True
+
+            # Keep at most 2 x workers jobs queued so large job lists stay lazy
+            while len(pending) < 2 * self.workers and submit_next():
+                pass
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+                    submit_next()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['rate_wait_s'] = round(stats['rate_wait_s'], 3)
+        return stats
+
+
+# ---- local stand-in server ------------------------------------------------
+
+def _start_stand_in_server(latency=0.05, flaky_every=5):
+    """
+    HTTP/1.1 server on 127.0.0.1 that serves /audio/<name>.mp3 with some latency,
+    ETag/Last-Modified validators (If-None-Match -> 304) and Range requests.
+    Every flaky_every-th path answers 503 the first time, /truncated/* drops the
+    connection halfway through the first response, /missing/* answers 404
+
+    Returns:
+        tuple: (server, base_url, stats dict with 'connections', 'requests',
+                'times' and 'body_bytes')
+    """
+    import hashlib
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    stats = {'connections': 0, 'requests': 0, 'times': [], 'body_bytes': 0}
+    failed_once = set()
+    lock = threading.Lock()
+    last_modified = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            with lock:
+                stats['connections'] += 1
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body=b'', headers=None, length=None):
+            self.send_response(status)
+            self.send_header('Content-Type', 'audio/mpeg')
+            self.send_header('Content-Length', str(len(body) if length is None else length))
+            if status == 503:
+                self.send_header('Retry-After', '0')
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+            with lock:
+                stats['body_bytes'] += len(body)
+
+        def do_GET(self):
+            with lock:
+                stats['requests'] += 1
+                stats['times'].append(time.monotonic())
+            time.sleep(latency)
+            name = self.path.rsplit('/', 1)[-1]
+            if self.path.startswith('/missing/'):
+                return self._send(404)
+            number = int(''.join(c for c in name.split('.')[0] if c.isdigit()) or 0)
+            with lock:
+                first_request = self.path not in failed_once
+                flaky = number % flaky_every == 0 and first_request and not self.path.startswith('/truncated/')
+                failed_once.add(self.path)
+            if flaky:
+                return self._send(503)
+
+            body = _stand_in_body(name)
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            validators = {'ETag': etag, 'Last-Modified': last_modified, 'Accept-Ranges': 'bytes'}
+            if self.headers.get('If-None-Match') == etag:
+                return self._send(304, headers=validators)
+            if self.path.startswith('/truncated/') and first_request:
+                # Promise the whole body, send half of it, hang up
+                self.close_connection = True
+                return self._send(200, body[:len(body) // 2], validators, length=len(body))
+            ranged = re.match(r"bytes=(\d+)-$", self.headers.get('Range', ''))
+            if ranged and self.headers.get('If-Range') in (etag, last_modified):
+                start = int(ranged.group(1))
+                if start >= len(body):
+                    return self._send(416)
+                return self._send(206, body[start:], dict(
+                    validators, **{'Content-Range': f"bytes {start}-{len(body) - 1}/{len(body)}"}))
+            self._send(200, body, validators)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", stats
+
+
+def _stand_in_body(name):
+    return (f"ID3 stand-in audio for {name}\n".encode('ascii')) * 4096
+
+
+def _check_integrity(base_url, directory, urls, server_stats):
+    """Resume, revalidation, corrupt-file and checksum behaviour on already downloaded files"""
+    problems = []
+    downloader = Downloader(workers=2, rate=1000, burst=1000, backoff=0.01)
+
+    # Connection dropped halfway: the retry resumes the .part file with a Range request
+    path = directory / "cut.mp3"
+    result = downloader.download(f"{base_url}/truncated/cut.mp3", path)
+    if result['status'] != 'resumed' or path.read_bytes() != _stand_in_body("cut.mp3"):
+        problems.append(f"truncated download was not resumed: {result}")
+
+    # Conditional GET: every file is still current, no body is sent
+    before = server_stats['body_bytes']
+    revalidated = dict(Downloader(workers=2, rate=1000, burst=1000, revalidate=True).download_many(
+        (url, url, directory / url.rsplit('/', 1)[-1]) for url in urls))
+    if any(r['status'] != 'not_modified' for r in revalidated.values()):
+        problems.append("revalidation re-downloaded unchanged files")
+    if server_stats['body_bytes'] != before:
+        problems.append(f"revalidation transferred {server_stats['body_bytes'] - before} body bytes")
+
+    # A file that no longer matches its sidecar is fetched again
+    path = directory / urls[0].rsplit('/', 1)[-1]
+    path.write_bytes(path.read_bytes()[:10])
+    result = downloader.download(urls[0], path)
+    if result['status'] != 'downloaded' or path.read_bytes() != _stand_in_body(path.name):
+        problems.append(f"corrupt file was not replaced: {result}")
+
+    # Checksum mismatch: nothing is left under the final name
+    path = directory / "checked.mp3"
+    result = downloader.download(f"{base_url}/audio/checked.mp3", path, expected_sha256="0" * 64)
+    if result['status'] != 'error' or path.exists():
+        problems.append(f"sha256 mismatch was accepted: {result}")
+
+    leftovers = sorted(p.name for p in directory.glob("*.part*"))
+    if leftovers:
+        problems.append(f"partial files left behind: {leftovers}")
+    return problems
+
+
+def selftest(files=24, workers=4, rate=20.0, burst=2, latency=0.05, old_sleep=0.5):
+    """Download from the stand-in server; compare with the old sequential loop"""
+    import tempfile
+
+    server, base_url, server_stats = _start_stand_in_server(latency)
+    urls = [f"{base_url}/audio/word{i}.mp3" for i in range(1, files + 1)]
+    problems = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            downloader = Downloader(workers=workers, rate=rate, burst=burst, backoff=0.05)
+            started = time.perf_counter()
+            jobs = [(url, url, Path(tmp) / url.rsplit('/', 1)[-1]) for url in urls]
+            jobs.append(("missing", f"{base_url}/missing/none.mp3", Path(tmp) / "none.mp3"))
+            results = dict(downloader.download_many(jobs))
+            pooled_s = time.perf_counter() - started
+
+            for url in urls:
+                result = results[url]
+                if result['status'] != 'downloaded' or result['path'].read_bytes() != _stand_in_body(
+                        url.rsplit('/', 1)[-1]):
+                    problems.append(f"{url}: {result}")
+            if results['missing']['status'] != 'error' or results['missing']['attempts'] != 1:
+                problems.append(f"404 should fail without retry: {results['missing']}")
+            stats = downloader.stats()
+            connections = server_stats['connections']
+            expected_retries = files // 5
+            if stats['retries'] != expected_retries:
+                problems.append(f"expected {expected_retries} retries, got {stats['retries']}")
+            if connections > workers:
+                problems.append(f"{connections} connections for {workers} workers")
+            # The bucket admits `burst` requests at once, then `rate` per second
+            times = server_stats['times']
+            min_span = (len(times) - burst) / rate
+            span = times[-1] - times[0]
+            if span < min_span * 0.9:
+                problems.append(f"rate limit exceeded: {len(times)} requests in {span:.2f}s")
+
+            problems.extend(_check_integrity(base_url, Path(tmp), urls, server_stats))
+
+        # The previous loop: a fresh connection per file plus a fixed sleep
+        sample = urls[:6]
+        started = time.perf_counter()
+        for url in sample:
+            try:
+                requests.get(url, timeout=15)
+            except requests.RequestException:
+                pass
+            time.sleep(old_sleep)
+        old_s = (time.perf_counter() - started) / len(sample) * len(urls)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print(f"Files: {files}  workers: {workers}  rate: {rate}/s per host (burst {burst})  "
+          f"latency: {latency * 1000:.0f} ms")
+    print(f"Server connections : {connections}")
+    print(f"Requests / retries : {stats['requests']} / {stats['retries']}")
+    print(f"Pooled downloader  : {pooled_s:.2f}s")
+    print(f"Sequential + sleep : {old_s:.2f}s (estimated from {len(sample)} files)")
+    for problem in problems:
+        print(f"❌ {problem}")
+    if not problems:
+        print("✓ All downloads correct; retries, keep-alive, rate limit, resume, revalidation "
+              "and integrity checks as expected")
+    return not problems
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pooled, rate-limited downloader")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_test = sub.add_parser("selftest", help="Run against a local HTTP stand-in server")
+    p_test.add_argument("--files", type=int, default=24)
+    p_test.add_argument("--workers", type=int, default=4)
+    p_test.add_argument("--rate", type=float, default=20.0)
+    args = parser.parse_args()
+
+    ok = selftest(files=args.files, workers=args.workers, rate=args.rate)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+DTW scoring of MFCC matrices, matching DTWComparator.vb.
+Frame distances (Euclidean, as in the VB EuclideanDistance) are computed in one
+vectorized step, the accumulated-cost recurrence is evaluated one anti-diagonal
+at a time (all cells of a diagonal are independent), and an optional
+Sakoe-Chiba band limits the cells that are computed at all. The result is
+normalized by N + M like CalculateDTWDistance.
+
+Usage:
+  python dtw.py verify                 # compare against a direct port of the VB loop
+  python dtw.py benchmark              # speed on long clips, with and without a band
+"""
+
+import time
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+
+def frame_distances(mfcc1, mfcc2):
+    """
+    Euclidean distance between every pair of frames
+
+    Args:
+        mfcc1 (numpy.ndarray): (n_mfcc, N)
+        mfcc2 (numpy.ndarray): (n_mfcc, M)
+
+    Returns:
+        numpy.ndarray: (N, M) float64
+    """
+    return cdist(np.asarray(mfcc1, dtype=np.float64).T, np.asarray(mfcc2, dtype=np.float64).T)
+
+
+def band_limits(n, m, radius):
+    """
+    Column range [lo, hi] (1-based, inclusive) allowed in each row 1..n by a
+    Sakoe-Chiba band of `radius` frames around the (scaled) diagonal. The
+    radius is widened when needed so the band stays connected for very
+    different lengths.
+    """
+    i = np.arange(1, n + 1, dtype=np.float64)
+    center = i * m / n
+    radius = max(float(radius), m / n, 1.0)
+    lo = np.clip(np.ceil(center - radius), 1, m).astype(np.int64)
+    hi = np.clip(np.floor(center + radius), 1, m).astype(np.int64)
+    hi[-1] = m
+    return lo, hi
+
+
+def dtw_distance(mfcc1, mfcc2, band=None, distances=None):
+    """
+    DTW distance between two MFCC matrices, normalized by path length (N + M)
+
+    Args:
+        mfcc1 (numpy.ndarray): (n_mfcc, N) MFCC of the recording
+        mfcc2 (numpy.ndarray): (n_mfcc, M) MFCC of the reference
+        band (int, optional): Sakoe-Chiba radius in frames (None = full matrix)
+        distances (numpy.ndarray, optional): Precomputed (N, M) frame distances
+
+    Returns:
+        float: Same value as DTWComparator.CalculateDTWDistance (full matrix)
+    """
+    mfcc1 = np.asarray(mfcc1, dtype=np.float64)
+    mfcc2 = np.asarray(mfcc2, dtype=np.float64)
+    if mfcc1.shape[0] != mfcc2.shape[0]:
+        raise ValueError("MFCC must have same number of coefficients")
+    n, m = mfcc1.shape[1], mfcc2.shape[1]
+    if n == 0 or m == 0:
+        return float('inf')
+
+    if band is None:
+        lo = np.ones(n, dtype=np.int64)
+        hi = np.full(n, m, dtype=np.int64)
+        cost = frame_distances(mfcc1, mfcc2) if distances is None else distances
+        cost_at = lambda i, j: cost[i - 1, j - 1]
+    else:
+        lo, hi = band_limits(n, m, band)
+        if distances is not None:
+            cost_at = lambda i, j: distances[i - 1, j - 1]
+        else:
+            # Distances of the band cells only, in one step: row i holds
+            # columns lo[i] .. lo[i] + width - 1
+            width = int((hi - lo).max()) + 1
+            cols = np.minimum(lo[:, None] + np.arange(width), m) - 1
+            band_cost = np.sqrt(np.square(mfcc1.T[:, None, :] - mfcc2.T[cols]).sum(axis=2))
+            cost_at = lambda i, j: band_cost[i - 1, j - lo[i - 1]]
+
+    # Cell (i, j) lies on diagonal d = i + j. With lo/hi non-decreasing in i,
+    # the rows that have a cell on diagonal d form one contiguous range.
+    rows = np.arange(1, n + 1)
+    diagonals = np.arange(2, n + m + 1)
+    starts = np.searchsorted(rows + hi, diagonals, side='left') + 1
+    stops = np.searchsorted(rows + lo, diagonals, side='right')
+
+    # Rolling anti-diagonals indexed by row (0..n): D[i, d - i]
+    inf = np.inf
+    prev2 = np.full(n + 1, inf)   # diagonal d - 2
+    prev1 = np.full(n + 1, inf)   # diagonal d - 1
+    prev2[0] = 0.0                # D[0, 0]
+    current = np.full(n + 1, inf)
+    # Rows written into each buffer, so only those are reset (band stays O(width))
+    span2, span1, span = (0, 0), (1, 0), (1, 0)
+
+    for d, start, stop in zip(diagonals.tolist(), starts.tolist(), stops.tolist()):
+        current[span[0]:span[1] + 1] = inf
+        if start <= stop:
+            i = np.arange(start, stop + 1)
+            best = np.minimum(np.minimum(prev1[i - 1],   # D[i-1, j]   insertion
+                                         prev1[i]),      # D[i, j-1]   deletion
+                              prev2[i - 1])              # D[i-1, j-1] match
+            current[start:stop + 1] = cost_at(i, d - i) + best
+        prev2, prev1, current = prev1, current, prev2
+        span2, span1, span = span1, (start, stop), span2
+
+    return float(prev1[n] / (n + m))
+
+
+def distance_to_similarity(distance, max_distance=500.0):
+    """Linear 0-100 similarity, as DTWComparator.DistanceToSimilarity"""
+    similarity = 100.0 * (1.0 - distance / max_distance)
+    return float(min(100.0, max(0.0, similarity)))
+
+
+def dtw_distance_loop(mfcc1, mfcc2):
+    """Line-by-line port of DTWComparator.CalculateDTWDistance (reference only; slow)"""
+    n_coeffs, n = mfcc1.shape
+    m = mfcc2.shape[1]
+    dtw = [[float('inf')] * (m + 1) for _ in range(n + 1)]
+    dtw[0][0] = 0.0
+    a = mfcc1.T.tolist()
+    b = mfcc2.T.tolist()
+    for i in range(1, n + 1):
+        fa = a[i - 1]
+        row, above = dtw[i], dtw[i - 1]
+        for j in range(1, m + 1):
+            fb = b[j - 1]
+            s = 0.0
+            for k in range(n_coeffs):
+                diff = fa[k] - fb[k]
+                s += diff * diff
+            row[j] = s ** 0.5 + min(above[j], row[j - 1], above[j - 1])
+    return dtw[n][m] / (n + m)
+
+
+def _synthetic_pair(n, m, n_mfcc=13, seed=0):
+    """Reference-like MFCC and a time-warped noisy copy"""
+    rng = np.random.default_rng(seed)
+    ref = np.cumsum(rng.normal(0, 5, size=(n_mfcc, m)), axis=1)
+    warp = np.clip(np.sort(rng.uniform(0, m - 1, size=n)), 0, m - 1).astype(int)
+    rec = ref[:, warp] + rng.normal(0, 3, size=(n_mfcc, n))
+    return rec, ref
+
+
+def verify(cases=30, reference_dir=None):
+    """Full-matrix results must equal the VB loop; a wide band must equal the full matrix"""
+    rng = np.random.default_rng(1)
+    worst = 0.0
+    for case in range(cases):
+        n, m = (int(x) for x in rng.integers(1, 60, size=2))
+        rec, ref = _synthetic_pair(n, m, seed=case)
+        expected = dtw_distance_loop(rec, ref)
+        got = dtw_distance(rec, ref)
+        wide = dtw_distance(rec, ref, band=max(n, m))
+        worst = max(worst, abs(got - expected) / max(abs(expected), 1e-12),
+                    abs(wide - expected) / max(abs(expected), 1e-12))
+
+    if reference_dir is not None:
+        from reference_store import ReferenceStore
+        store = ReferenceStore.open_if_exists(reference_dir)
+        if store is not None:
+            words = store.words()[:8]
+            for w1 in words:
+                for w2 in words:
+                    a, b = store.get(w1), store.get(w2)
+                    expected = dtw_distance_loop(np.asarray(a, np.float64), np.asarray(b, np.float64))
+                    worst = max(worst, abs(dtw_distance(a, b) - expected) / max(abs(expected), 1e-12))
+            store.close()
+
+    status = "✓" if worst < 1e-9 else "❌"
+    print(f"{status} Max relative difference vs VB port: {worst:.2e}")
+    return worst
+
+
+def benchmark(lengths=(100, 300, 1000, 3000), bands=(None, 50, 20), loop_max=300):
+    """Time the VB-port loop and the vectorized engine on growing clip lengths"""
+    print(f"{'Frames':>7} {'VB loop (ms)':>13} " + " ".join(
+        f"{('full' if b is None else f'band {b}'):>12}" for b in bands) + "   (ms)")
+    for n in lengths:
+        rec, ref = _synthetic_pair(n, int(n * 0.9), seed=n)
+        if n <= loop_max:
+            started = time.perf_counter()
+            dtw_distance_loop(rec, ref)
+            loop_ms = f"{(time.perf_counter() - started) * 1000.0:>13.1f}"
+        else:
+            loop_ms = f"{'-':>13}"
+        cells = []
+        for b in bands:
+            started = time.perf_counter()
+            dtw_distance(rec, ref, band=b)
+            cells.append(f"{(time.perf_counter() - started) * 1000.0:>12.1f}")
+        print(f"{n:>7} {loop_ms} " + " ".join(cells))
+
+
+def main():
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description="Vectorized DTW for MFCC matrices")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_verify = sub.add_parser("verify", help="Compare with a port of DTWComparator.vb")
+    p_verify.add_argument("--reference-dir", default=str(Path(__file__).parent / "references"))
+    p_bench = sub.add_parser("benchmark", help="Speed on long clips")
+    p_bench.add_argument("--lengths", default="100,300,1000,3000")
+    args = parser.parse_args()
+
+    if args.command == "verify":
+        verify(reference_dir=args.reference_dir)
+    else:
+        benchmark(lengths=[int(x) for x in args.lengths.split(",")])
+
+
+if __name__ == "__main__":
+    main()
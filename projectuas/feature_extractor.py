@@ -0,0 +1,783 @@
+"""
+Shared MFCC feature extraction for wav_to_mfcc.py, generate_references.py,
+fetch_and_generate.py and the /dtw endpoints.
+Produces the same values as librosa.feature.mfcc / librosa.feature.delta with
+their default settings, but builds the window, mel filterbank and DCT basis
+once per parameter set, runs a single STFT per clip into a reused frame
+buffer, and derives MFCC, deltas and statistics from that one pass. Many clips
+at the same sample rate can be processed in one call (extract_batch).
+
+Long recordings are streamed (stream_file): the file is decoded and resampled
+in blocks, frames are cut with the STFT overlap carried across block
+boundaries, and MFCC/delta frames are handed to a writer block by block, so
+peak memory does not grow with the recording length. The per-clip top_db
+floor needs the global peak, so log-mel frames are spilled to a temporary
+file in a first pass and floored, transformed and emitted in a second.
+
+Usage:
+  python feature_extractor.py verify       # vs librosa, batch and streaming
+  python feature_extractor.py benchmark
+  python feature_extractor.py memory       # peak RSS, in-memory vs streaming
+  python feature_extractor.py stream long.wav output/   # <name>_mfcc/_delta/_delta2.npy
+"""
+
+import functools
+import math
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+import scipy.fft
+import scipy.signal
+import soundfile as sf
+import soxr
+import librosa
+
+# Formats load() decodes: soundfile for WAV/FLAC/OGG, audioread (ffmpeg) for MP3/M4A
+AUDIO_EXTENSIONS = (".wav", ".flac", ".ogg", ".mp3", ".m4a")
+
+
+@functools.lru_cache(maxsize=16)
+def _bases(sr, n_fft, n_mels, n_mfcc, fmin, fmax):
+    """
+    (window float32, mel basis transposed, DCT basis transposed), read-only.
+    The projections are float64 so that a frame's result does not depend on
+    how many frames are multiplied together (batch, streaming blocks)
+    """
+    window = librosa.filters.get_window('hann', n_fft, fftbins=True).astype(np.float32)
+    mel = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=fmin, fmax=fmax).astype(np.float64)
+    # Orthonormal DCT-II as a matrix: the DCT of the identity's columns
+    dct = scipy.fft.dct(np.eye(n_mels), type=2, norm='ortho', axis=0)[:n_mfcc]
+    bases = (window, np.ascontiguousarray(mel.T), np.ascontiguousarray(dct.T))
+    for basis in bases:
+        basis.setflags(write=False)
+    return bases
+
+
+class ArrayFrameWriter:
+    """Collects streamed blocks into whole matrices (for callers that need them)"""
+
+    def __init__(self):
+        self.blocks = {}
+
+    def write(self, mfcc, delta=None, delta_delta=None):
+        for name, block in (('mfcc', mfcc), ('delta', delta), ('delta_delta', delta_delta)):
+            if block is not None:
+                self.blocks.setdefault(name, []).append(block)
+
+    def result(self):
+        return {name: np.concatenate(blocks, axis=1) for name, blocks in self.blocks.items()}
+
+
+class _NpyAppender:
+    """
+    A (rows, frames) float32 .npy written one block of frames at a time.
+    Stored column-major (fortran_order), so each new frame is appended at the
+    end; the header is rewritten with the final shape on close().
+    """
+
+    HEADER_SIZE = 128
+
+    def __init__(self, path, rows):
+        self.path = Path(path)
+        self.rows = rows
+        self.frames = 0
+        self._file = open(self.path, 'wb')
+        self._write_header()
+
+    def _write_header(self):
+        header = repr({'descr': '<f4', 'fortran_order': True, 'shape': (self.rows, self.frames)})
+        # magic (6) + version (2) + header length (2) + header padded with spaces + newline
+        body = header.ljust(self.HEADER_SIZE - 10 - 1) + '\n'
+        self._file.seek(0)
+        self._file.write(b'\x93NUMPY\x01\x00' + len(body).to_bytes(2, 'little') + body.encode('latin1'))
+
+    def write(self, block):
+        self._file.seek(0, 2)
+        self._file.write(np.ascontiguousarray(block.T, dtype='<f4').tobytes())
+        self.frames += block.shape[1]
+
+    def close(self):
+        self._write_header()
+        self._file.close()
+
+
+class NpyFrameWriter:
+    """Streams <base>_mfcc.npy, <base>_delta.npy and <base>_delta2.npy (wav_to_mfcc layout)"""
+
+    def __init__(self, output_dir, base_name, n_mfcc=13):
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.files = {name: _NpyAppender(output_dir / f"{base_name}_{suffix}.npy", n_mfcc)
+                      for name, suffix in (('mfcc', 'mfcc'), ('delta', 'delta'), ('delta_delta', 'delta2'))}
+
+    def write(self, mfcc, delta=None, delta_delta=None):
+        for name, block in (('mfcc', mfcc), ('delta', delta), ('delta_delta', delta_delta)):
+            if block is not None:
+                self.files[name].write(block)
+
+    def close(self):
+        for appender in self.files.values():
+            appender.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class SpillFrameWriter:
+    """
+    Streamed blocks spilled frame by frame to temporary files, for stores that
+    keep each matrix row-major (reference_store, feature_shards): copy_rows()
+    writes a column coefficient by coefficient without the whole matrix in memory
+    """
+
+    # Frames of one coefficient copied per write
+    COPY_FRAMES = 65536
+
+    def __init__(self, rows, spill_dir=None):
+        """
+        Args:
+            rows (int): Coefficients per frame (n_mfcc)
+            spill_dir (str, optional): Directory for the temporary files
+        """
+        self.rows = rows
+        self.frames = 0
+        self.spill_dir = spill_dir
+        self._files = {}
+
+    def write(self, mfcc, delta=None, delta_delta=None):
+        for name, block in (('mfcc', mfcc), ('delta', delta), ('delta_delta', delta_delta)):
+            if block is None:
+                continue
+            if name not in self._files:
+                self._files[name] = tempfile.TemporaryFile(dir=self.spill_dir)
+            self._files[name].write(np.ascontiguousarray(block.T, dtype='<f4').tobytes())
+        self.frames += mfcc.shape[1]
+
+    def _spilled(self, name):
+        """(frames, rows) read-only map of a column's temporary file"""
+        spill = self._files[name]
+        spill.flush()
+        return np.memmap(spill, dtype='<f4', mode='r', shape=(self.frames, self.rows))
+
+    def copy_rows(self, name, out):
+        """
+        Write column name ('mfcc', 'delta', 'delta_delta') to the file object out
+        as a C-order (rows, frames) little-endian float32 matrix
+
+        Returns:
+            int: Bytes written
+        """
+        if self.frames == 0:
+            return 0
+        spilled = self._spilled(name)
+        for row in range(self.rows):
+            for start in range(0, self.frames, self.COPY_FRAMES):
+                out.write(np.ascontiguousarray(spilled[start:start + self.COPY_FRAMES, row]).tobytes())
+        del spilled
+        return self.frames * self.rows * 4
+
+    def array(self, name):
+        """Column name as one (rows, frames) float32 array (for callers that need it)"""
+        if self.frames == 0:
+            return np.zeros((self.rows, 0), dtype=np.float32)
+        spilled = self._spilled(name)
+        matrix = np.array(spilled.T, dtype=np.float32, order='C')
+        del spilled
+        return matrix
+
+    def close(self):
+        for spill in self._files.values():
+            spill.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class _DeltaStream:
+    """
+    Savitzky-Golay deltas over a stream of MFCC blocks, equal to running
+    FeatureExtractor.deltas() on the whole matrix: each call filters the new
+    frames together with width - 1 frames of left context and holds back the
+    last width // 2 frames until their right context (or the end) arrives
+    """
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+        self.width = extractor.delta_width
+        self.buffer = None
+        self.start = 0        # global index of buffer[:, 0]
+        self.emitted = 0      # global index of the first frame not yet returned
+
+    def push(self, block, final=False):
+        """
+        Returns:
+            tuple: (mfcc, delta, delta_delta) of the frames that are final, or None
+        """
+        buffer = block if self.buffer is None else np.concatenate([self.buffer, block], axis=1)
+        end = self.start + buffer.shape[1]
+        stop = end if final else end - self.width // 2
+        if not final and (stop <= self.emitted or buffer.shape[1] < self.width):
+            self.buffer = buffer
+            return None
+
+        delta, delta2 = self.extractor.deltas(buffer)
+        lo, hi = self.emitted - self.start, stop - self.start
+        out = (buffer[:, lo:hi], delta[:, lo:hi], delta2[:, lo:hi])
+        self.emitted = stop
+        keep = max(0, hi - (self.width - 1))
+        self.buffer = buffer[:, keep:]
+        self.start += keep
+        return out
+
+
+class _RunningStatistics:
+    """mean/std/min/max per coefficient over streamed blocks (float64 sums)"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = self.squares = self.low = self.high = None
+
+    def add(self, block):
+        block64 = block.astype(np.float64)
+        if self.count == 0:
+            self.total = np.zeros(block.shape[0])
+            self.squares = np.zeros(block.shape[0])
+            self.low = np.full(block.shape[0], np.inf)
+            self.high = np.full(block.shape[0], -np.inf)
+        self.count += block.shape[1]
+        self.total += block64.sum(axis=1)
+        self.squares += np.square(block64).sum(axis=1)
+        np.minimum(self.low, block.min(axis=1), out=self.low)
+        np.maximum(self.high, block.max(axis=1), out=self.high)
+
+    def result(self):
+        mean = self.total / self.count
+        variance = np.maximum(self.squares / self.count - np.square(mean), 0.0)
+        return {'mean': mean.astype(np.float32), 'std': np.sqrt(variance).astype(np.float32),
+                'min': self.low.astype(np.float32), 'max': self.high.astype(np.float32)}
+
+
+class FeatureExtractor:
+    """MFCC, delta, delta-delta and statistics from one STFT"""
+
+    # Frames transformed together by extract_batch
+    BATCH_FRAMES = 256
+    # Frames per block when streaming
+    STREAM_BLOCK_FRAMES = 1024
+
+    def __init__(self, n_mfcc=13, n_fft=2048, hop_length=512, sr=22050, n_mels=128,
+                 fmin=0.0, fmax=None, top_db=80.0, delta_width=9, stream_seconds=300.0,
+                 audio_cache=None):
+        """
+        Args:
+            n_mfcc (int): Number of coefficients
+            n_fft (int): FFT window length
+            hop_length (int): Samples between frames
+            sr (int): Sample rate of the input (and for load())
+            n_mels (int): Mel bands (librosa default: 128)
+            top_db (float): Dynamic range kept below each clip's peak (librosa default: 80)
+            delta_width (int): Savitzky-Golay window for deltas (librosa default: 9)
+            stream_seconds (float): extract_file() streams files longer than this
+            audio_cache (audio_cache.AudioCache, optional): Decoded-audio cache for load()
+        """
+        self.n_mfcc = n_mfcc
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.sr = sr
+        self.n_mels = n_mels
+        self.fmin = fmin
+        self.fmax = fmax
+        self.top_db = top_db
+        self.delta_width = delta_width
+        self.stream_seconds = stream_seconds
+        self.audio_cache = audio_cache
+        self.window, self.mel_basis_t, self.dct_basis_t = _bases(
+            sr, n_fft, n_mels, n_mfcc, float(fmin), None if fmax is None else float(fmax)
+        )
+        # Frame buffers are reused across calls, one per thread
+        self._local = threading.local()
+
+    def params(self):
+        return {"n_mfcc": self.n_mfcc, "sr": self.sr, "n_fft": self.n_fft, "hop_length": self.hop_length}
+
+    def load(self, path):
+        """Load audio resampled to self.sr, mono (same as librosa.load)"""
+        if self.audio_cache is not None:
+            return self.audio_cache.load(path, self.sr)
+        audio, _ = librosa.load(str(path), sr=self.sr)
+        return audio
+
+    # ---- core -------------------------------------------------------------
+
+    def _frame_count(self, n_samples):
+        return 1 + n_samples // self.hop_length
+
+    def _buffer(self, n_frames):
+        buffer = getattr(self._local, "frames", None)
+        if buffer is None or buffer.shape[0] < n_frames:
+            # Grow geometrically so a run of similar clips reuses one allocation
+            rows = max(n_frames, 0 if buffer is None else buffer.shape[0] * 2)
+            buffer = np.empty((rows, self.n_fft), dtype=np.float32)
+            self._local.frames = buffer
+        return buffer[:n_frames]
+
+    def _write_frames(self, y, out):
+        """Windowed, centered (zero-padded) frames of y into out"""
+        self._write_window(np.pad(np.asarray(y, dtype=np.float32), self.n_fft // 2), out)
+
+    def _write_window(self, samples, out):
+        """Windowed frames of already padded samples into out"""
+        view = np.lib.stride_tricks.sliding_window_view(samples, self.n_fft)[::self.hop_length]
+        np.multiply(view[:out.shape[0]], self.window, out=out)
+
+    def _log_mel(self, frames):
+        """Power spectrum -> mel -> dB (without the top_db floor), (frames, n_mels) float32"""
+        spectrum = scipy.fft.rfft(frames, axis=1)
+        power = np.square(spectrum.real)
+        power += np.square(spectrum.imag)
+        mel = power @ self.mel_basis_t
+        np.maximum(mel, 1e-10, out=mel)
+        np.log10(mel, out=mel)
+        mel *= 10.0
+        return mel.astype(np.float32)
+
+    def _dct(self, log_mel):
+        """(frames, n_mels) -> (n_mfcc, frames) float32"""
+        return np.ascontiguousarray((log_mel @ self.dct_basis_t).T, dtype=np.float32)
+
+    def _finish(self, log_mel):
+        """Apply the per-clip top_db floor and the DCT, (n_mfcc, frames)"""
+        if self.top_db is not None:
+            np.maximum(log_mel, log_mel.max() - self.top_db, out=log_mel)
+        return self._dct(log_mel)
+
+    # ---- public API -------------------------------------------------------
+
+    def mfcc(self, y):
+        """
+        Args:
+            y (numpy.ndarray): Mono audio at self.sr
+
+        Returns:
+            numpy.ndarray: (n_mfcc, frames) float32, as librosa.feature.mfcc
+        """
+        frames = self._buffer(self._frame_count(len(y)))
+        self._write_frames(y, frames)
+        return self._finish(self._log_mel(frames))
+
+    def deltas(self, mfcc):
+        """(delta, delta-delta), as librosa.feature.delta with order 1 and 2"""
+        if self.delta_width > mfcc.shape[-1]:
+            raise ValueError(
+                f"when mode='interp', width={self.delta_width} "
+                f"cannot exceed data.shape[axis]={mfcc.shape[-1]}"
+            )
+        delta = scipy.signal.savgol_filter(mfcc, self.delta_width, deriv=1, polyorder=1, axis=-1, mode='interp')
+        delta2 = scipy.signal.savgol_filter(mfcc, self.delta_width, deriv=2, polyorder=2, axis=-1, mode='interp')
+        return delta, delta2
+
+    @staticmethod
+    def statistics(mfcc):
+        """Mean, std, min and max per coefficient (WavToMFCC.get_mfcc_statistics)"""
+        mean = mfcc.mean(axis=1)
+        centered = mfcc - mean[:, None]
+        return {
+            'mean': mean,
+            'std': np.sqrt(np.square(centered).mean(axis=1)),
+            'min': mfcc.min(axis=1),
+            'max': mfcc.max(axis=1)
+        }
+
+    def extract(self, y, deltas=True, stats=True):
+        """
+        Args:
+            y (numpy.ndarray): Mono audio at self.sr
+
+        Returns:
+            dict: mfcc, and if requested delta, delta_delta and statistics
+        """
+        features = {'mfcc': self.mfcc(y)}
+        if deltas:
+            features['delta'], features['delta_delta'] = self.deltas(features['mfcc'])
+        if stats:
+            features['statistics'] = self.statistics(features['mfcc'])
+        return features
+
+    def extract_file(self, path, deltas=True, stats=True):
+        """
+        extract() on a file, plus 'sr', 'duration' and (unless the file is longer
+        than stream_seconds and therefore streamed) 'audio'
+        """
+        duration = self.file_duration(path)
+        if duration is not None and duration > self.stream_seconds:
+            writer = ArrayFrameWriter()
+            info = self.stream_file(path, writer, deltas=deltas)
+            features = writer.result()
+            if stats:
+                features['statistics'] = self.statistics(features['mfcc'])
+            features['sr'] = self.sr
+            features['duration'] = info['duration']
+            return features
+
+        audio = self.load(path)
+        features = self.extract(audio, deltas, stats)
+        features['audio'] = audio
+        features['sr'] = self.sr
+        features['duration'] = len(audio) / self.sr
+        return features
+
+    # ---- streaming --------------------------------------------------------
+
+    @staticmethod
+    def file_duration(path):
+        """Length in seconds from the file header, or None if soundfile cannot read it"""
+        try:
+            return sf.info(str(path)).duration
+        except (RuntimeError, sf.LibsndfileError):
+            return None
+
+    def _stream_audio(self, path, block_samples):
+        """
+        Mono float32 blocks at self.sr, identical to load() (soundfile decode,
+        channel mean, soxr_hq resampling, length fixed to ceil(n * ratio))
+
+        Yields:
+            numpy.ndarray: consecutive sample blocks
+        """
+        with sf.SoundFile(str(path)) as f:
+            n_in, rate = f.frames, f.samplerate
+            resampler = None
+            n_out = n_in
+            if rate != self.sr:
+                resampler = soxr.ResampleStream(rate, self.sr, 1, dtype='float32', quality='soxr_hq')
+                n_out = int(math.ceil(n_in * float(self.sr) / rate))
+            read = produced = 0
+            while read < n_in:
+                block = f.read(min(block_samples, n_in - read), dtype='float32', always_2d=True)
+                if not len(block):
+                    break
+                read += len(block)
+                mono = block[:, 0] if block.shape[1] == 1 else block.mean(axis=1)
+                if resampler is not None:
+                    mono = resampler.resample_chunk(mono, last=read >= n_in)
+                mono = mono[:n_out - produced]
+                produced += len(mono)
+                if len(mono):
+                    yield mono
+            if produced < n_out:
+                yield np.zeros(n_out - produced, dtype=np.float32)
+
+    def _stream_log_mel(self, path, block_frames, progress):
+        """
+        Args:
+            progress (dict): 'samples' is set to the decoded length at the end
+
+        Yields:
+            numpy.ndarray: (frames, n_mels) log-mel blocks without the top_db floor,
+                           frame for frame the same as _log_mel() on the whole clip
+        """
+        pad = self.n_fft // 2
+        tail = np.zeros(pad, dtype=np.float32)      # centre padding, then the overlap
+        total = 0
+        for samples in self._stream_audio(path, block_frames * self.hop_length):
+            total += len(samples)
+            tail = np.concatenate([tail, samples])
+            count = 0 if len(tail) < self.n_fft else 1 + (len(tail) - self.n_fft) // self.hop_length
+            if count:
+                frames = self._buffer(count)
+                self._write_window(tail, frames)
+                yield self._log_mel(frames)
+                tail = tail[count * self.hop_length:]
+        # Right centre padding; exactly the frames still missing remain
+        tail = np.concatenate([tail, np.zeros(pad, dtype=np.float32)])
+        count = 1 + (len(tail) - self.n_fft) // self.hop_length if len(tail) >= self.n_fft else 0
+        if count:
+            frames = self._buffer(count)
+            self._write_window(tail, frames)
+            yield self._log_mel(frames)
+        progress['samples'] = total
+
+    def stream_file(self, path, writer, deltas=True, block_frames=None, spill_dir=None):
+        """
+        MFCC (and deltas) of a file of any length with bounded memory
+
+        Args:
+            path (str): Audio file readable by soundfile
+            writer: Object with write(mfcc, delta=None, delta_delta=None), called with
+                    consecutive (n_mfcc, frames) blocks (ArrayFrameWriter, NpyFrameWriter,
+                    SpillFrameWriter)
+            block_frames (int, optional): Frames per block (default: STREAM_BLOCK_FRAMES)
+            spill_dir (str, optional): Directory for the temporary log-mel file
+                                       (n_mels float32 per frame)
+
+        Returns:
+            dict: frames, duration, statistics (float64-accumulated)
+        """
+        block_frames = block_frames or self.STREAM_BLOCK_FRAMES
+        delta_stream = _DeltaStream(self) if deltas else None
+        stats = _RunningStatistics()
+        progress = {'samples': 0}
+        frames = 0
+
+        def emit(mfcc, final):
+            nonlocal frames
+            if delta_stream is None:
+                out = (mfcc, None, None)
+            else:
+                out = delta_stream.push(mfcc, final)
+                if out is None:
+                    return
+            stats.add(out[0])
+            frames += out[0].shape[1]
+            writer.write(*out)
+
+        if self.top_db is None:
+            for log_mel in self._stream_log_mel(path, block_frames, progress):
+                emit(self._dct(log_mel), final=False)
+        else:
+            # Pass 1: spill log-mel frames to disk and find the global peak
+            with tempfile.TemporaryFile(dir=spill_dir) as spill:
+                peak = -np.inf
+                spilled = 0
+                for log_mel in self._stream_log_mel(path, block_frames, progress):
+                    peak = max(peak, float(log_mel.max()))
+                    spill.write(log_mel.tobytes())
+                    spilled += log_mel.shape[0]
+                # Pass 2: floor at peak - top_db, DCT, deltas, write
+                spill.seek(0)
+                floor = np.float32(peak - self.top_db)
+                row_bytes = self.n_mels * 4
+                for start in range(0, spilled, block_frames):
+                    count = min(block_frames, spilled - start)
+                    log_mel = np.frombuffer(spill.read(count * row_bytes), dtype=np.float32)
+                    log_mel = log_mel.reshape(count, self.n_mels).copy()
+                    np.maximum(log_mel, floor, out=log_mel)
+                    emit(self._dct(log_mel), final=False)
+
+        if delta_stream is not None:
+            if delta_stream.buffer is None or delta_stream.start + delta_stream.buffer.shape[1] < self.delta_width:
+                available = 0 if delta_stream.buffer is None else delta_stream.start + delta_stream.buffer.shape[1]
+                raise ValueError(
+                    f"when mode='interp', width={self.delta_width} "
+                    f"cannot exceed data.shape[axis]={available}"
+                )
+            emit(np.zeros((self.n_mfcc, 0), dtype=np.float32), final=True)
+
+        return {'frames': frames, 'duration': progress['samples'] / self.sr,
+                'statistics': stats.result() if frames else None}
+
+    def extract_batch(self, signals, deltas=True, stats=True):
+        """
+        Process many clips (all at self.sr) with one STFT, one mel projection and
+        one DCT over the frames of every clip
+
+        Args:
+            signals (list): Mono audio arrays, any lengths
+
+        Returns:
+            list: One extract() dict per clip, in order
+        """
+        if not signals:
+            return []
+        counts = [self._frame_count(len(y)) for y in signals]
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        log_mel = np.empty((int(offsets[-1]), self.n_mels), dtype=np.float32)
+
+        # Clips are packed into a frame buffer of about BATCH_FRAMES rows and
+        # transformed together, so the STFT input stays cache-sized
+        group_start = 0
+        while group_start < len(signals):
+            group_stop = group_start + 1
+            while (group_stop < len(signals)
+                   and offsets[group_stop + 1] - offsets[group_start] <= self.BATCH_FRAMES):
+                group_stop += 1
+            base = offsets[group_start]
+            frames = self._buffer(int(offsets[group_stop] - base))
+            for i in range(group_start, group_stop):
+                self._write_frames(signals[i], frames[offsets[i] - base:offsets[i + 1] - base])
+            log_mel[base:offsets[group_stop]] = self._log_mel(frames)
+            group_start = group_stop
+
+        if self.top_db is not None:
+            # Each clip keeps its own peak reference, as when processed alone
+            peaks = np.maximum.reduceat(log_mel.max(axis=1), offsets[:-1])
+            floors = np.repeat(peaks - self.top_db, counts)
+            np.maximum(log_mel, floors[:, None], out=log_mel)
+        results = []
+        for start, stop in zip(offsets[:-1], offsets[1:]):
+            features = {'mfcc': self._dct(log_mel[start:stop])}
+            if deltas:
+                features['delta'], features['delta_delta'] = self.deltas(features['mfcc'])
+            if stats:
+                features['statistics'] = self.statistics(features['mfcc'])
+            results.append(features)
+        return results
+
+
+def verify(seconds=(0.5, 1.0, 2.5), sr=22050):
+    """Compare against librosa on noise-like clips; prints the largest differences"""
+    rng = np.random.default_rng(0)
+    extractor = FeatureExtractor(sr=sr)
+    signals = [(rng.standard_normal(int(s * sr)) * rng.uniform(0.01, 0.5)).astype(np.float32) for s in seconds]
+    worst = {'mfcc': 0.0, 'delta': 0.0, 'delta_delta': 0.0, 'batch': 0.0}
+    batch = extractor.extract_batch(signals)
+    for y, batched in zip(signals, batch):
+        expected = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, n_fft=2048, hop_length=512)
+        got = extractor.extract(y)
+        worst['mfcc'] = max(worst['mfcc'], float(np.abs(got['mfcc'] - expected).max()))
+        worst['delta'] = max(worst['delta'], float(np.abs(got['delta'] - librosa.feature.delta(expected)).max()))
+        worst['delta_delta'] = max(worst['delta_delta'], float(
+            np.abs(got['delta_delta'] - librosa.feature.delta(expected, order=2)).max()))
+        worst['batch'] = max(worst['batch'], float(np.abs(batched['mfcc'] - got['mfcc']).max()))
+
+    # Streaming vs in-memory on files that need resampling and downmixing
+    worst['stream'] = 0.0
+    with tempfile.TemporaryDirectory() as tmp:
+        for rate, channels in ((sr, 1), (44100, 2), (48000, 1)):
+            path = Path(tmp) / f"stream_{rate}_{channels}.wav"
+            clip = rng.standard_normal((int(7.3 * rate), channels)) * np.linspace(0.01, 0.5, channels)
+            sf.write(str(path), clip.astype(np.float32), rate, subtype='PCM_16')
+            expected = extractor.extract(extractor.load(path))
+            for block_frames in (7, 100, 1024):
+                writer = ArrayFrameWriter()
+                extractor.stream_file(path, writer, block_frames=block_frames)
+                got = writer.result()
+                worst['stream'] = max(worst['stream'], *(float(np.abs(got[k] - expected[k]).max())
+                                                         for k in ('mfcc', 'delta', 'delta_delta')))
+    for key, value in worst.items():
+        print(f"max |difference| {key:<12}: {value:.2e}")
+    return worst
+
+
+_RSS_SCRIPT = """
+import resource, sys
+sys.path.insert(0, sys.argv[1])
+import feature_extractor as fe
+mode, path, out = sys.argv[2:]
+extractor = fe.FeatureExtractor()
+if mode == 'memory':
+    extractor.extract(extractor.load(path))
+elif mode == 'stream':
+    with fe.NpyFrameWriter(out, 'rss') as writer:
+        extractor.stream_file(path, writer)
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def memory_benchmark(minutes=(1, 5, 15), rate=44100, channels=2):
+    """
+    Peak RSS (fresh process per run, Linux/macOS) of load() + extract() vs
+    stream_file() into NpyFrameWriter, on synthetic recordings of growing length
+    """
+    import subprocess
+    import sys
+    import time
+
+    module_dir = str(Path(__file__).resolve().parent)
+
+    def peak_mb(mode, path, out):
+        output = subprocess.run([sys.executable, "-c", _RSS_SCRIPT, module_dir, mode, str(path), str(out)],
+                                check=True, capture_output=True, text=True).stdout
+        kb = int(output.split()[-1])
+        # ru_maxrss is in bytes on macOS, kilobytes on Linux
+        return kb / 1024.0 / (1024.0 if sys.platform == 'darwin' else 1.0)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = peak_mb('import', 'none', tmp)
+        rng = np.random.default_rng(0)
+        for length in minutes:
+            path = Path(tmp) / f"long_{length}m.wav"
+            with sf.SoundFile(str(path), 'w', rate, channels, subtype='PCM_16') as f:
+                for _ in range(length * 60):
+                    f.write((rng.standard_normal((rate, channels)) * 0.1).astype(np.float32))
+            started = time.perf_counter()
+            in_memory = peak_mb('memory', path, tmp)
+            memory_s = time.perf_counter() - started
+            started = time.perf_counter()
+            streamed = peak_mb('stream', path, tmp)
+            stream_s = time.perf_counter() - started
+            rows.append((length, in_memory, streamed, memory_s, stream_s))
+            path.unlink()
+
+    print(f"Peak RSS (MB), {rate} Hz {channels} ch input; imports alone: {baseline:.0f} MB")
+    print(f"{'Minutes':>8} {'In-memory':>10} {'Streaming':>10} {'Time mem (s)':>13} {'Time stream (s)':>16}")
+    for length, in_memory, streamed, memory_s, stream_s in rows:
+        print(f"{length:>8} {in_memory:>10.0f} {streamed:>10.0f} {memory_s:>13.1f} {stream_s:>16.1f}")
+    return rows
+
+
+def benchmark(durations=(0.3, 1.0, 3.0), clips=50, sr=22050):
+    """librosa mfcc + 2 deltas + 4 stats passes vs one extractor call vs batch"""
+    for seconds in durations:
+        _benchmark_clips(seconds, clips, sr)
+
+
+def _benchmark_clips(seconds, clips, sr):
+    import time
+
+    rng = np.random.default_rng(0)
+    signals = [(rng.standard_normal(int(seconds * sr)) * 0.1).astype(np.float32) for _ in range(clips)]
+    extractor = FeatureExtractor(sr=sr)
+
+    def librosa_path():
+        for y in signals:
+            mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13, n_fft=2048, hop_length=512)
+            librosa.feature.delta(mfcc)
+            librosa.feature.delta(mfcc, order=2)
+            np.mean(mfcc, axis=1), np.std(mfcc, axis=1), np.min(mfcc, axis=1), np.max(mfcc, axis=1)
+
+    def extractor_path():
+        for y in signals:
+            extractor.extract(y)
+
+    timings = []
+    for name, fn in (("librosa", librosa_path), ("FeatureExtractor", extractor_path),
+                     ("FeatureExtractor batch", lambda: extractor.extract_batch(signals))):
+        fn()
+        best = float('inf')
+        for _ in range(3):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+        timings.append((name, best * 1000.0 / clips))
+    base = timings[0][1]
+    print(f"{clips} clips of {seconds:.1f}s at {sr} Hz")
+    for name, ms in timings:
+        print(f"  {name:<24} {ms:8.2f} ms/clip  {base / ms:5.2f}x")
+    return timings
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Shared MFCC feature extractor")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("verify", help="Compare with librosa; batch and streaming with in-memory")
+    sub.add_parser("benchmark", help="Speed vs the librosa path")
+    p_memory = sub.add_parser("memory", help="Peak RSS of in-memory vs streaming extraction")
+    p_memory.add_argument("--minutes", default="1,5,15")
+    p_stream = sub.add_parser("stream", help="MFCC/delta/delta2 .npy of a long file with bounded memory")
+    p_stream.add_argument("path")
+    p_stream.add_argument("output_dir")
+    args = parser.parse_args()
+    if args.command == "verify":
+        verify()
+    elif args.command == "benchmark":
+        benchmark()
+    elif args.command == "memory":
+        memory_benchmark([int(m) for m in args.minutes.split(",")])
+    else:
+        extractor = FeatureExtractor()
+        with NpyFrameWriter(args.output_dir, Path(args.path).stem) as writer:
+            info = extractor.stream_file(args.path, writer)
+        print(f"✓ {info['frames']} frames ({info['duration']:.1f}s) written to {args.output_dir}")
@@ -0,0 +1,543 @@
+"""
+Sharded, columnar storage for the MFCC features of a whole dataset.
+Instead of seven files per clip (wav_to_mfcc.py legacy output), every clip is
+appended to a few large shard files, one file per column and shard:
+
+  shard-00000.mfcc.bin    float32 (n_mfcc, frames) matrices, 64-byte aligned
+  shard-00000.delta.bin   same offsets as .mfcc.bin
+  shard-00000.delta2.bin
+  features_index.npy      one structured row per clip: shard, offset, frames,
+                          duration and the mean/std/min/max statistics
+  features_index.json     version, params, columns, shard ids, clip ids (row order)
+
+Everything is read through memory maps, so get() returns zero-copy views.
+Existing shards are never rewritten: re-processed clips are appended to new
+shards, and shards without live clips are deleted when the writer closes.
+
+Usage:
+  python feature_shards.py info output/mfcc_dataset
+  python feature_shards.py export-legacy output/mfcc_dataset [--clip a.wav]
+  python feature_shards.py compact output/mfcc_dataset
+  python feature_shards.py benchmark [--clips 2000]      # files vs shards
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+SHARDS_VERSION = 1
+INDEX_NAME = "features_index"
+COLUMNS = ("mfcc", "delta", "delta2")
+DTYPE = np.dtype('<f4')
+ALIGNMENT = 64
+# Bytes per column file before a new shard is started
+SHARD_SIZE = 64 << 20
+
+
+def index_paths(directory):
+    """(rows .npy, metadata .json) of the index in a directory"""
+    directory = Path(directory)
+    return directory / f"{INDEX_NAME}.npy", directory / f"{INDEX_NAME}.json"
+
+
+def shard_path(directory, shard, column):
+    return Path(directory) / f"shard-{shard:05d}.{column}.bin"
+
+
+def row_dtype(n_mfcc):
+    """Structured dtype of one index row"""
+    return np.dtype([
+        ('shard', '<u4'),
+        ('offset', '<u8'),
+        ('frames', '<u4'),
+        ('duration', '<f4'),
+        ('stats', '<f4', (4, n_mfcc)),     # mean, std, min, max per coefficient
+    ])
+
+
+class FeatureShards:
+    """Read-only, memory-mapped view of a sharded feature dataset"""
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): Directory containing features_index.{npy,json} and the shards
+        """
+        self.directory = Path(directory)
+        rows_path, meta_path = index_paths(directory)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("version") != SHARDS_VERSION:
+            raise ValueError(f"Unsupported feature shards version: {meta.get('version')}")
+
+        self.params = meta["params"]
+        self.columns = tuple(meta["columns"])
+        self.shards = list(meta["shards"])
+        self.dtype = np.dtype(meta["dtype"])
+        self.n_mfcc = int(self.params["n_mfcc"])
+        self.clip_ids = list(meta["clip_ids"])
+        self._rows_by_id = {clip_id: i for i, clip_id in enumerate(self.clip_ids)}
+        self.rows = np.load(rows_path, mmap_mode='r') if self.clip_ids else np.zeros(0, row_dtype(self.n_mfcc))
+        self._maps = {}
+
+    @classmethod
+    def open_if_exists(cls, directory):
+        """The dataset in a directory, or None if there is none"""
+        rows_path, meta_path = index_paths(directory)
+        if not (rows_path.exists() and meta_path.exists()):
+            return None
+        return cls(directory)
+
+    def __len__(self):
+        return len(self.clip_ids)
+
+    def __contains__(self, clip_id):
+        return clip_id in self._rows_by_id
+
+    def __iter__(self):
+        return iter(self.clip_ids)
+
+    def _map(self, shard, column):
+        key = (int(shard), column)
+        data = self._maps.get(key)
+        if data is None:
+            path = shard_path(self.directory, shard, column)
+            data = np.memmap(path, dtype=np.uint8, mode='r') if path.stat().st_size else np.zeros(0, np.uint8)
+            self._maps[key] = data
+        return data
+
+    def _view(self, row, column):
+        shape = (self.n_mfcc, int(row['frames']))
+        start = int(row['offset'])
+        nbytes = shape[0] * shape[1] * self.dtype.itemsize
+        return self._map(row['shard'], column)[start:start + nbytes].view(self.dtype).reshape(shape)
+
+    def row(self, clip_id):
+        index = self._rows_by_id.get(clip_id)
+        if index is None:
+            raise KeyError(f"No features for '{clip_id}'")
+        return self.rows[index]
+
+    def get(self, clip_id, column="mfcc"):
+        """
+        Args:
+            clip_id (str): Clip id (path of the WAV relative to the dataset root)
+            column (str): "mfcc", "delta" or "delta2"
+
+        Returns:
+            numpy.ndarray: (n_mfcc, frames) float32 view into the mapped shard (read-only)
+        """
+        if column not in self.columns:
+            raise KeyError(f"Unknown column '{column}'")
+        return self._view(self.row(clip_id), column)
+
+    def statistics(self, clip_id):
+        """mean/std/min/max per coefficient, as WavToMFCC.get_mfcc_statistics"""
+        stats = self.row(clip_id)['stats']
+        return {'mean': stats[0], 'std': stats[1], 'min': stats[2], 'max': stats[3]}
+
+    def features(self, clip_id):
+        """Every column plus statistics and duration of one clip"""
+        row = self.row(clip_id)
+        features = {column: self._view(row, column) for column in self.columns}
+        features['statistics'] = self.statistics(clip_id)
+        features['duration'] = float(row['duration'])
+        return features
+
+    def storage_order(self):
+        """Row numbers sorted by (shard, offset), i.e. sequential reads"""
+        if not len(self.rows):
+            return np.zeros(0, dtype=np.int64)
+        return np.lexsort((self.rows['offset'], self.rows['shard']))
+
+    def export_legacy(self, output_dir, clip_ids=None, converter=None):
+        """
+        Write the per-clip files of wav_to_mfcc.py (npy, stats JSON, CSV, VB.NET text)
+        for some or all clips, for tools that still read them
+
+        Returns:
+            int: Number of clips exported
+        """
+        if converter is None:
+            from wav_to_mfcc import WavToMFCC
+            converter = WavToMFCC(**{k: self.params[k] for k in ("n_mfcc", "n_fft", "hop_length", "sr")})
+        output_dir = Path(output_dir)
+        count = 0
+        for clip_id in (self.clip_ids if clip_ids is None else clip_ids):
+            features = self.features(clip_id)
+            relative = Path(clip_id)
+            converter.write_legacy_files(
+                relative.name, features['mfcc'], features['delta'], features['delta2'],
+                features['statistics'], output_dir / relative.parent / relative.stem,
+                {'filename': relative.name, 'duration': features['duration'],
+                 'sample_rate': self.params.get("sr")}
+            )
+            count += 1
+        return count
+
+    def close(self):
+        # Drop the mappings so shards can be replaced or deleted (required on Windows)
+        self._maps = {}
+        self.rows = None
+
+
+class FeatureShardWriter:
+    """Appends clips to new shards and swaps in the updated index on close()"""
+
+    def __init__(self, directory, params, shard_size=SHARD_SIZE, append=True, first_shard=0):
+        """
+        Args:
+            directory (str): Dataset directory
+            params (dict): MFCC parameters (n_mfcc, n_fft, hop_length, sr)
+            shard_size (int): Bytes per column file before starting a new shard
+            append (bool): Keep the clips already in the directory (if the params match)
+            first_shard (int): Lowest number for new shards (compact() writes elsewhere
+                               and moves them next to the shards they replace)
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.params = dict(params)
+        self.shard_size = shard_size
+        self.dtype = row_dtype(int(params["n_mfcc"]))
+        # Shards of an existing dataset are only deleted once the new index is in place
+        self.previous = FeatureShards.open_if_exists(directory)
+        old_shards = [] if self.previous is None else self.previous.shards
+        if self.previous is not None and (not append or self.previous.params != self.params):
+            if append:
+                print(f"Feature shards in {directory} use other parameters; starting a new dataset")
+            self.previous.close()
+            self.previous = None
+
+        # clip id -> index row; rows of the previous dataset are kept as they are
+        self.rows = {}
+        if self.previous is not None:
+            for clip_id, row in zip(self.previous.clip_ids, np.array(self.previous.rows)):
+                self.rows[clip_id] = row
+        self._old_shards = set(old_shards)
+        self._first_new = self._next_shard = max(max(old_shards, default=-1) + 1, first_shard)
+        self._shard = None
+        self._files = {}
+        self._offset = 0
+
+    def __contains__(self, clip_id):
+        return clip_id in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, clip_id, column="mfcc"):
+        """Features of a clip kept from the previous run"""
+        return self.previous.get(clip_id, column)
+
+    def _start_shard(self):
+        self._close_files()
+        self._shard = self._next_shard
+        self._next_shard += 1
+        self._files = {column: open(shard_path(self.directory, self._shard, column), 'wb') for column in COLUMNS}
+        self._offset = 0
+
+    def _close_files(self):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def add(self, clip_id, mfcc, delta, delta2, statistics, duration):
+        """
+        Append one clip (replaces an earlier entry with the same id)
+
+        Args:
+            clip_id (str): Clip id (path of the WAV relative to the dataset root)
+            mfcc, delta, delta2 (numpy.ndarray): (n_mfcc, frames) matrices
+            statistics (dict): mean/std/min/max per coefficient
+            duration (float): Clip length in seconds
+        """
+        matrices = [np.ascontiguousarray(m, dtype=DTYPE) for m in (mfcc, delta, delta2)]
+        self._align()
+        for column, matrix in zip(COLUMNS, matrices):
+            self._files[column].write(matrix.tobytes())
+        self._record(clip_id, matrices[0].shape[1], matrices[0].nbytes, statistics, duration)
+
+    def add_frames(self, clip_id, frames, statistics, duration):
+        """
+        add() for a streamed recording, copied column by column from its spill files
+
+        Args:
+            frames (feature_extractor.SpillFrameWriter): mfcc, delta and delta_delta frames
+        """
+        self._align()
+        nbytes = 0
+        for column, name in zip(COLUMNS, ('mfcc', 'delta', 'delta_delta')):
+            nbytes = frames.copy_rows(name, self._files[column])
+        self._record(clip_id, frames.frames, nbytes, statistics, duration)
+
+    def _align(self):
+        """Start a new shard if needed and pad every column file to ALIGNMENT"""
+        if self._shard is None or self._offset >= self.shard_size:
+            self._start_shard()
+        padding = -self._offset % ALIGNMENT
+        if padding:
+            for f in self._files.values():
+                f.write(b'\0' * padding)
+            self._offset += padding
+
+    def _record(self, clip_id, frames, nbytes, statistics, duration):
+        row = np.zeros((), dtype=self.dtype)
+        row['shard'] = self._shard
+        row['offset'] = self._offset
+        row['frames'] = frames
+        row['duration'] = duration
+        row['stats'] = [statistics['mean'], statistics['std'], statistics['min'], statistics['max']]
+        self.rows.pop(clip_id, None)
+        self.rows[clip_id] = row
+        self._offset += nbytes
+
+    def remove(self, clip_id):
+        self.rows.pop(clip_id, None)
+
+    def close(self):
+        """Write the index atomically, then delete shards that no clip refers to"""
+        self._close_files()
+        clip_ids = list(self.rows)
+        rows = np.array([self.rows[c] for c in clip_ids], dtype=self.dtype)
+        live = sorted({int(s) for s in rows['shard']})
+        rows_path, meta_path = index_paths(self.directory)
+
+        tmp_rows = rows_path.with_name(rows_path.name + '.tmp')
+        with open(tmp_rows, 'wb') as f:
+            np.save(f, rows)
+        tmp_meta = meta_path.with_name(meta_path.name + '.tmp')
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": SHARDS_VERSION,
+                "dtype": DTYPE.str,
+                "params": self.params,
+                "columns": list(COLUMNS),
+                "shards": live,
+                "clip_ids": clip_ids,
+            }, f)
+        if self.previous is not None:
+            self.previous.close()
+        os.replace(tmp_rows, rows_path)
+        os.replace(tmp_meta, meta_path)
+
+        written = set(range(self._first_new, self._next_shard))
+        for shard in (self._old_shards | written) - set(live):
+            for column in COLUMNS:
+                path = shard_path(self.directory, shard, column)
+                if path.exists():
+                    path.unlink()
+
+    def abort(self):
+        """Drop the shards written by this writer; the previous index stays in place"""
+        self._close_files()
+        if self.previous is not None:
+            self.previous.close()
+        for shard in range(self._first_new, self._next_shard):
+            for column in COLUMNS:
+                path = shard_path(self.directory, shard, column)
+                if path.exists():
+                    path.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class FeatureLoader:
+    """
+    Batches for ML training, read straight from the shards
+
+    Each batch is a dict with 'clip_ids', 'lengths' (frames per clip) and one
+    (batch, n_mfcc, max_frames) float32 array per requested column, zero-padded
+    to the longest clip in the batch. With shuffle=True the shard order and the
+    clips within each shard are shuffled again every epoch, but reads still go
+    through one shard at a time.
+    """
+
+    def __init__(self, shards, batch_size=32, columns=("mfcc",), shuffle=False, seed=0, drop_last=False):
+        """
+        Args:
+            shards (FeatureShards): Dataset to read
+            batch_size (int): Clips per batch
+            columns (tuple): Columns to load ("mfcc", "delta", "delta2")
+            shuffle (bool): New random order every epoch
+        """
+        self.shards = shards
+        self.batch_size = batch_size
+        self.columns = tuple(columns)
+        self.shuffle = shuffle
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+
+    def __len__(self):
+        full, rest = divmod(len(self.shards), self.batch_size)
+        return full if self.drop_last or not rest else full + 1
+
+    def _order(self):
+        order = self.shards.storage_order()
+        if not self.shuffle:
+            return order
+        rng = np.random.default_rng(self.seed + self.epoch)
+        shard_of = np.asarray(self.shards.rows['shard'])[order]
+        groups = [order[shard_of == s] for s in np.unique(shard_of)]
+        rng.shuffle(groups)
+        return np.concatenate([rng.permutation(g) for g in groups]) if groups else order
+
+    def __iter__(self):
+        order = self._order()
+        self.epoch += 1
+        rows = self.shards.rows
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            if self.drop_last and len(batch) < self.batch_size:
+                break
+            lengths = np.asarray(rows['frames'][batch], dtype=np.int64)
+            out = {'clip_ids': [self.shards.clip_ids[i] for i in batch], 'lengths': lengths}
+            for column in self.columns:
+                padded = np.zeros((len(batch), self.shards.n_mfcc, int(lengths.max())), dtype=np.float32)
+                for b, i in enumerate(batch):
+                    padded[b, :, :lengths[b]] = self.shards._view(rows[i], column)
+                out[column] = padded
+            yield out
+
+
+def compact(directory):
+    """
+    Rewrite the live clips into fresh, full shards (drops superseded data).
+    The new shards are numbered after every existing shard file, moved in next
+    to the old ones, and the index is replaced last; the old shards are only
+    deleted once nothing refers to them, so an interrupt leaves a readable dataset
+    """
+    directory = Path(directory)
+    shards = FeatureShards(directory)
+    # Above every shard file present, also ones left behind by an interrupted run
+    numbers = [int(p.name.split('.')[0][len("shard-"):]) for p in directory.glob("shard-*.bin")]
+    first = max(numbers + list(shards.shards), default=-1) + 1
+    tmp_dir = Path(tempfile.mkdtemp(prefix="feature_shards_", dir=directory))
+    try:
+        with FeatureShardWriter(tmp_dir, shards.params, append=False, first_shard=first) as writer:
+            for i in shards.storage_order():
+                clip_id = shards.clip_ids[i]
+                features = shards.features(clip_id)
+                writer.add(clip_id, features['mfcc'], features['delta'], features['delta2'],
+                           features['statistics'], features['duration'])
+        old = list(shards.shards)
+        shards.close()
+        for path in sorted(tmp_dir.glob("shard-*.bin")):
+            os.replace(path, directory / path.name)
+        for path in index_paths(tmp_dir):
+            os.replace(path, directory / path.name)
+        for shard in old:
+            for column in COLUMNS:
+                shard_path(directory, shard, column).unlink(missing_ok=True)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def benchmark(clips=2000, frames=(20, 120), n_mfcc=13, seed=0):
+    """
+    Write the same synthetic features as per-clip .npy files (the three of the
+    legacy output) and as shards, then read everything back
+    """
+    rng = np.random.default_rng(seed)
+    data = []
+    for c in range(clips):
+        m = int(rng.integers(*frames))
+        mfcc = rng.normal(0, 20, size=(n_mfcc, m)).astype(np.float32)
+        data.append((f"speaker{c % 20}/clip{c:05d}.wav", mfcc))
+    stats = {'mean': np.zeros(n_mfcc), 'std': np.ones(n_mfcc), 'min': np.zeros(n_mfcc), 'max': np.ones(n_mfcc)}
+
+    tmp = Path(tempfile.mkdtemp(prefix="feature_shards_bench_"))
+    try:
+        files_dir, shards_dir = tmp / "files", tmp / "shards"
+        started = time.perf_counter()
+        for clip_id, mfcc in data:
+            out = files_dir / Path(clip_id).parent / Path(clip_id).stem
+            out.mkdir(parents=True, exist_ok=True)
+            for suffix in ("mfcc", "delta", "delta2"):
+                np.save(out / f"{Path(clip_id).stem}_{suffix}.npy", mfcc)
+        write_files = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with FeatureShardWriter(shards_dir, {"n_mfcc": n_mfcc, "n_fft": 2048, "hop_length": 512, "sr": 22050}) as writer:
+            for clip_id, mfcc in data:
+                writer.add(clip_id, mfcc, mfcc, mfcc, stats, 1.0)
+        write_shards = time.perf_counter() - started
+
+        started = time.perf_counter()
+        total = 0.0
+        for path in sorted(files_dir.rglob("*_mfcc.npy")):
+            total += float(np.load(path).sum())
+        read_files = time.perf_counter() - started
+
+        started = time.perf_counter()
+        shards = FeatureShards(shards_dir)
+        for batch in FeatureLoader(shards, batch_size=64):
+            total -= float(batch['mfcc'].sum())
+        shards.close()
+        read_shards = time.perf_counter() - started
+
+        n_files = sum(1 for p in files_dir.rglob("*") if p.is_file())
+        n_shard_files = sum(1 for p in shards_dir.iterdir() if p.is_file())
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"Clips: {clips}")
+    print(f"{'':<22} {'Per-clip .npy':>14} {'Shards':>10} {'Ratio':>8}")
+    for label, legacy, sharded in (("Files", n_files, n_shard_files),
+                                   ("Write all (s)", write_files, write_shards),
+                                   ("Read all mfcc (s)", read_files, read_shards)):
+        print(f"{label:<22} {legacy:>14.2f} {sharded:>10.2f} {legacy / max(sharded, 1e-9):>7.1f}x")
+    status = "✓" if abs(total) < 1e-3 * clips else "❌"
+    print(f"{status} Same values read back from both layouts")
+
+
+def main():
+    import argparse
+
+    default_dir = Path(__file__).parent / "output" / "mfcc_dataset"
+    parser = argparse.ArgumentParser(description="Sharded MFCC feature datasets")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_info = sub.add_parser("info", help="Clips, shards and sizes")
+    p_info.add_argument("directory", nargs="?", default=str(default_dir))
+    p_export = sub.add_parser("export-legacy", help="Write per-clip npy/json/csv/txt files")
+    p_export.add_argument("directory", nargs="?", default=str(default_dir))
+    p_export.add_argument("--output", default=None, help="Default: the dataset directory")
+    p_export.add_argument("--clip", action="append", help="Clip id (repeatable); default: all clips")
+    p_compact = sub.add_parser("compact", help="Rewrite live clips into fresh shards")
+    p_compact.add_argument("directory", nargs="?", default=str(default_dir))
+    p_bench = sub.add_parser("benchmark", help="Per-clip files vs shards on synthetic features")
+    p_bench.add_argument("--clips", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.command == "info":
+        shards = FeatureShards(args.directory)
+        size = sum(shard_path(args.directory, s, c).stat().st_size for s in shards.shards for c in shards.columns)
+        live = int(np.asarray(shards.rows['frames'], dtype=np.int64).sum()) * shards.n_mfcc * 4 * len(shards.columns)
+        print(f"Clips : {len(shards)}")
+        print(f"Shards: {len(shards.shards)} x {len(shards.columns)} columns, {size / 1024 / 1024:.1f} MB "
+              f"({live / max(size, 1):.0%} live)")
+        print(f"Params: {shards.params}")
+    elif args.command == "export-legacy":
+        count = FeatureShards(args.directory).export_legacy(args.output or args.directory, args.clip)
+        print(f"✓ Exported {count} clips to {args.output or args.directory}")
+    elif args.command == "compact":
+        compact(args.directory)
+        print(f"✓ Compacted {args.directory}")
+    else:
+        benchmark(args.clips)
+
+
+if __name__ == "__main__":
+    main()
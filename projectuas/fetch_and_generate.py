@@ -2,46 +2,68 @@
 Batch Dataset Generation for MFCC-DTW Voice Recognition
 This script filters a CSV of audio URLs, downloads the MP3s, 
 and generates MFCC JSON files for VB.NET.
+For the whole questions table (checkpointed, sharded) see build_references.py.
 """
 
 import os
-import csv
 import json
-import librosa
+import queue
+import threading
+import time
 import numpy as np
-import requests
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
-import time
+from audio_cache import AudioCache
+from downloader import Downloader
+from feature_extractor import FeatureExtractor
 from generate_references import ReferenceGenerator
+from word_index import WordIndex
 
 class BatchGenerator:
-    def __init__(self, csv_path, target_words, output_audio_dir, output_json_dir):
+    def __init__(self, csv_path, target_words, output_audio_dir, output_json_dir, audio_cache=None,
+                 downloader=None, prefer='us', feature_workers=None, queue_size=8, question_ids=None,
+                 on_result=None):
+        """
+        Args:
+            downloader (downloader.Downloader, optional): Download stage (its workers = download concurrency)
+            prefer (str): 'us' or 'gb' audio when a word has both
+            feature_workers (int, optional): Decode/MFCC processes (default: CPU count, 0 = a thread)
+            queue_size (int): Items waiting between two pipeline stages
+            question_ids (dict, optional): Word -> question id written into the JSON (default 0)
+            on_result (callable, optional): Called as on_result(word, stage, error) once per
+                word; stage and error are None when its JSON was written
+        """
         self.csv_path = Path(csv_path)
+        self.prefer = prefer
         self.target_words = [w.lower().strip() for w in target_words]
         self.output_audio_dir = Path(output_audio_dir)
         self.output_json_dir = Path(output_json_dir)
-        self.generator = ReferenceGenerator(n_mfcc=13, sr=22050)
+        # Decoded MP3s are cached, so generate_references.py reuses them too
+        self.generator = ReferenceGenerator(n_mfcc=13, sr=22050,
+                                            audio_cache=audio_cache if audio_cache is not None else AudioCache())
+        # Pooled keep-alive connections, per-host rate limit and retries (see downloader.py)
+        self.downloader = downloader if downloader is not None else Downloader()
+        self.feature_workers = (os.cpu_count() or 1) if feature_workers is None else feature_workers
+        self.queue_size = queue_size
+        self.question_ids = question_ids or {}
+        self.on_result = on_result
+        self.stage_counters = None
+        self._result_lock = threading.Lock()
         
         # Ensure directories exist
         self.output_audio_dir.mkdir(parents=True, exist_ok=True)
         self.output_json_dir.mkdir(parents=True, exist_ok=True)
 
     def fetch_word_urls(self):
-        """Parse CSV and find URLs for target words"""
-        word_map = {}
+        """Find URLs for target words in the word index of the CSV (see word_index.py)"""
         target_set = set(self.target_words)
         
-        print(f"Reading CSV: {self.csv_path}")
+        print(f"Looking up words in: {self.csv_path}")
         try:
-            with open(self.csv_path, mode='r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    word = row['word'].lower().strip()
-                    if word in target_set:
-                        # Prefer US audio, fallback to GB
-                        url = row.get('us_audio_url') or row.get('gb_audio_url')
-                        if url:
-                            word_map[word] = url
+            # Built once, rebuilt only when the CSV changes
+            with WordIndex(self.csv_path) as index:
+                # Prefer US audio, fallback to GB (or the other way round)
+                word_map = index.lookup(self.target_words, self.prefer)
         except Exception as e:
             print(f"Error reading CSV: {e}")
             return {}
@@ -53,78 +75,244 @@ class BatchGenerator:
             
         return word_map
 
-    def download_audio(self, word, url):
-        """Download MP3 file"""
+    def _result(self, word, stage=None, error=None):
+        """Final outcome of one word (stages run in different threads)"""
+        if self.on_result is not None:
+            with self._result_lock:
+                self.on_result(word, stage, error)
+
+    def audio_path(self, word):
+        """<word>_ref.mp3 in the audio directory"""
         # Ensure we use underscorized name for the filename
         safe_word = word.replace(" ", "_")
-        output_path = self.output_audio_dir / f"{safe_word}_ref.mp3"
-        
-        if output_path.exists():
-            print(f"  - already exists: {output_path.name}")
-            return output_path
-            
-        try:
-            print(f"  - downloading {word} from {url}...")
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(url, timeout=15, headers=headers)
-            response.raise_for_status()
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
-            print(f"  - saved to {output_path.name}")
-            return output_path
-        except Exception as e:
-            print(f"  - error downloading {word}: {e}")
+        return self.output_audio_dir / f"{safe_word}_ref.mp3"
+
+    def _report_download(self, word, result):
+        if result['status'] == 'exists':
+            print(f"  - already exists: {result['path'].name}")
+            return result['path']
+        if result['status'] == 'not_modified':
+            print(f"  - unchanged on the server: {result['path'].name}")
+            return result['path']
+        if result['status'] == 'error':
+            print(f"  - error downloading {word}: {result['error']}")
             return None
+        retried = f" after {result['attempts']} attempts" if result['attempts'] > 1 else ""
+        resumed = "resumed, " if result['status'] == 'resumed' else ""
+        print(f"  - saved {result['path'].name} ({resumed}{result['seconds']:.2f}s{retried})")
+        return result['path']
+
+    def download_audio(self, word, url):
+        """Download MP3 file"""
+        return self._report_download(word, self.downloader.download(url, self.audio_path(word)))
 
     def process_all(self):
-        """Main execution flow"""
+        """
+        Main execution flow: download -> decode/MFCC -> JSON as a pipeline, so
+        downloads continue while earlier words are being processed
+
+        Returns:
+            list: Words whose JSON was written, in target order
+        """
         word_map = self.fetch_word_urls()
-        
-        results = []
+        jobs = [(word, word_map[word], self.audio_path(word)) for word in self.target_words if word in word_map]
         for word in self.target_words:
             if word not in word_map:
-                continue
-                
-            url = word_map[word]
-            print(f"\nProcessing: {word}")
-            
-            # 1. Download
-            audio_path = self.download_audio(word, url)
-            if not audio_path:
-                continue
-                
-            # 2. Extract MFCC
+                self._result(word, "lookup", "no audio URL in the word index")
+        print(f"\nProcessing {len(jobs)} words: {self.downloader.workers} downloads, "
+              f"{self.feature_workers or 'in-process'} feature workers, queues of {self.queue_size}")
+        
+        counters = {name: StageCounters(name) for name in ("download", "features", "write")}
+        # Bounded queues: a full queue blocks the stage before it (backpressure),
+        # so at most queue_size paths / MFCCs wait between two stages
+        feature_queue = queue.Queue(maxsize=self.queue_size)
+        write_queue = queue.Queue(maxsize=self.queue_size)
+        
+        stages = [
+            threading.Thread(target=self._download_stage, args=(jobs, feature_queue, counters["download"]),
+                             name="download-stage", daemon=True),
+            threading.Thread(target=self._feature_stage,
+                             args=(feature_queue, write_queue, counters["features"]),
+                             name="feature-stage", daemon=True)
+        ]
+        for stage in stages:
+            stage.start()
+        written = self._write_stage(write_queue, counters["write"])
+        for stage in stages:
+            stage.join()
+        
+        results = [word for word in self.target_words if word in written]
+        print(f"\nFinished! Successfully processed {len(results)} words.")
+        print_stage_counters(counters.values())
+        self.stage_counters = counters
+        return results
+
+    def _download_stage(self, jobs, out_queue, counters):
+        """I/O-bound: downloader thread pool -> paths of the MP3s on disk"""
+        try:
+            for word, result in self.downloader.download_many(jobs):
+                path = self._report_download(word, result)
+                if path is None:
+                    counters.add(error=True, busy=result['seconds'])
+                    self._result(word, "download", result['error'])
+                    continue
+                counters.add(busy=result['seconds'])
+                out_queue.put((word, path))
+        except Exception as e:
+            print(f"  - download stage failed: {type(e).__name__}: {e}")
+        finally:
+            out_queue.put(None)
+
+    def _feature_stage(self, in_queue, out_queue, counters):
+        """CPU-bound: decode + MFCC in a process pool, at most 2 x workers in flight"""
+        params = self.generator.extractor.params()
+        audio_cache = self.generator.extractor.audio_cache
+        pool = ProcessPoolExecutor(max_workers=self.feature_workers) if self.feature_workers else None
+        max_pending = 2 * max(self.feature_workers, 1)
+        pending = {}
+        
+        def finish(done):
+            for future in done:
+                word = pending[future]
+                try:
+                    mfcc, seconds = future.result()
+                except Exception as e:
+                    del pending[future]
+                    print(f"  - error processing {word}: {e}")
+                    counters.add(error=True)
+                    self._result(word, "features", f"{type(e).__name__}: {e}")
+                    continue
+                counters.add(busy=seconds)
+                out_queue.put((word, mfcc))
+                # Still pending until handed on, so a failing put() reports it
+                del pending[future]
+        
+        finished = False
+        try:
+            while not finished or pending:
+                if pending:
+                    finish(wait(pending, timeout=0, return_when=FIRST_COMPLETED)[0])
+                if finished or len(pending) >= max_pending:
+                    # Wait for a worker instead of pulling more work
+                    if pending:
+                        finish(wait(pending, return_when=FIRST_COMPLETED)[0])
+                    continue
+                try:
+                    item = in_queue.get(timeout=0.05 if pending else None)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    finished = True
+                    continue
+                word, path = item
+                if pool is None:
+                    future = Future()
+                    try:
+                        future.set_result(_extract_worker(params, str(path), audio_cache))
+                    except Exception as e:
+                        future.set_exception(e)
+                else:
+                    future = pool.submit(_extract_worker, params, str(path), audio_cache)
+                pending[future] = word
+        except Exception as e:
+            error = f"feature stage failed: {type(e).__name__}: {e}"
+            print(f"  - {error}")
+            # Words in flight and words still coming are failed, and the queue is
+            # drained to its sentinel so the download stage never blocks on put()
+            for word in pending.values():
+                counters.add(error=True)
+                self._result(word, "features", error)
+            pending.clear()
+            while not finished:
+                item = in_queue.get()
+                if item is None:
+                    break
+                counters.add(error=True)
+                self._result(item[0], "features", error)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            out_queue.put(None)
+
+    def _write_stage(self, in_queue, counters):
+        """JSON files for VB.NET, written in this thread"""
+        written = set()
+        while True:
+            item = in_queue.get()
+            if item is None:
+                return written
+            word, mfcc = item
+            started = time.perf_counter()
             try:
-                # librosa can load MP3 directly
                 # We normalize word for filename consistency (cake -> cake_mfcc.json)
                 safe_word = word.replace(" ", "_")
-                
-                # We need to adapt the ReferenceGenerator to handle MP3 if it doesn't
-                # Actually librosa.load handled by librosa.feature.mfcc -> internally uses audioread
-                audio, sr = librosa.load(str(audio_path), sr=self.generator.sr)
-                
-                mfcc = librosa.feature.mfcc(
-                    y=audio,
-                    sr=sr,
-                    n_mfcc=self.generator.n_mfcc,
-                    n_fft=self.generator.n_fft,
-                    hop_length=self.generator.hop_length
-                )
-                
                 json_path = self.output_json_dir / f"{safe_word}_mfcc.json"
-                self.generator.save_mfcc_as_json(mfcc, str(json_path), 0, word)
-                
-                results.append(word)
-                # Small delay to be nice to servers
-                time.sleep(0.5)
-                
+                self.generator.save_mfcc_as_json(mfcc, str(json_path), self.question_ids.get(word, 0), word)
+                written.add(word)
+                counters.add(busy=time.perf_counter() - started)
+                self._result(word)
             except Exception as e:
-                print(f"  - error processing {word}: {e}")
-                
-        print(f"\nFinished! Successfully processed {len(results)} words.")
-        return results
+                print(f"  - error writing {word}: {e}")
+                counters.add(error=True, busy=time.perf_counter() - started)
+                self._result(word, "write", f"{type(e).__name__}: {e}")
+
+
+def _extract_worker(params, audio_path, audio_cache=None):
+    """
+    Runs in the feature process pool: decode + MFCC of one file
+
+    Returns:
+        tuple: (mfcc, seconds)
+    """
+    started = time.perf_counter()
+    # librosa.load (inside the shared extractor) decodes MP3 via audioread,
+    # once per file content thanks to the audio cache
+    extractor = FeatureExtractor(**params, audio_cache=audio_cache)
+    mfcc = extractor.extract_file(audio_path, deltas=False, stats=False)['mfcc']
+    return mfcc, time.perf_counter() - started
+
+
+class StageCounters:
+    """Items, errors, busy time and wall-clock span of one pipeline stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy_s = 0.0
+        self.first = None
+        self.last = None
+        self._lock = threading.Lock()
+
+    def add(self, error=False, busy=0.0):
+        now = time.perf_counter()
+        with self._lock:
+            if error:
+                self.errors += 1
+            else:
+                self.items += 1
+            self.busy_s += busy
+            # Span from the start of the first item to the end of the last
+            if self.first is None:
+                self.first = now - busy
+            self.last = now
+
+    def snapshot(self):
+        with self._lock:
+            wall = (self.last - self.first) if self.first is not None else 0.0
+            return {'stage': self.name, 'items': self.items, 'errors': self.errors,
+                    'busy_s': round(self.busy_s, 3), 'wall_s': round(wall, 3),
+                    'items_per_s': round(self.items / wall, 2) if wall > 0 else None}
+
+
+def print_stage_counters(counters):
+    """Table of StageCounters.snapshot() rows"""
+    print(f"{'Stage':<10} {'Items':>6} {'Errors':>7} {'Busy (s)':>9} {'Wall (s)':>9} {'Items/s':>8}")
+    for stage in counters:
+        row = stage.snapshot()
+        rate = f"{row['items_per_s']:.2f}" if row['items_per_s'] is not None else "-"
+        print(f"{row['stage']:<10} {row['items']:>6} {row['errors']:>7} {row['busy_s']:>9.2f} "
+              f"{row['wall_s']:>9.2f} {rate:>8}")
 
 if __name__ == "__main__":
     WORDS = [
@@ -5,35 +5,63 @@ This script processes reference audio files and creates JSON MFCC files for VB.N
 
 import os
 import numpy as np
-import librosa
 from pathlib import Path
 import json
 
+from audio_cache import AudioCache, DEFAULT_MAX_BYTES
+from feature_extractor import AUDIO_EXTENSIONS, FeatureExtractor, SpillFrameWriter
+from manifest import Manifest, MANIFEST_NAME
+from reference_store import ReferenceStore, ReferenceStoreWriter, store_paths
+
+
+def reference_text(path):
+    """Word of a <word>_ref.<ext> file (fetch_and_generate writes spaces as _)"""
+    return Path(path).stem[:-len("_ref")].replace("_", " ").lower()
+
+
+def find_reference_audio(reference_dir):
+    """
+    Reference audio in every format FeatureExtractor.load decodes; when a word
+    has several files, the first format in AUDIO_EXTENSIONS wins (a recorded
+    WAV over a downloaded MP3)
+
+    Returns:
+        dict: word -> path, sorted by word
+    """
+    found = {}
+    for path in sorted(Path(reference_dir).glob("*_ref.*")):
+        ext = path.suffix.lower()
+        if ext not in AUDIO_EXTENSIONS:
+            continue
+        text = reference_text(path)
+        current = found.get(text)
+        if current is None or AUDIO_EXTENSIONS.index(ext) < AUDIO_EXTENSIONS.index(current.suffix.lower()):
+            found[text] = path
+    return dict(sorted(found.items()))
+
 
 class ReferenceGenerator:
     """Generate MFCC references from audio files"""
     
-    def __init__(self, n_mfcc=13, sr=22050, n_fft=2048, hop_length=512):
+    # Changed references whose MFCC is computed in one extractor call
+    BATCH_SIZE = 32
+    
+    def __init__(self, n_mfcc=13, sr=22050, n_fft=2048, hop_length=512, audio_cache=None):
+        """
+        Args:
+            audio_cache (audio_cache.AudioCache, optional): Reuse decoded, resampled audio
+                across runs (e.g. after changing n_mfcc or hop_length)
+        """
         self.n_mfcc = n_mfcc
         self.sr = sr
         self.n_fft = n_fft
         self.hop_length = hop_length
+        self.extractor = FeatureExtractor(n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length, sr=sr,
+                                          audio_cache=audio_cache)
     
     def extract_mfcc_from_wav(self, wav_path):
-        """Extract MFCC from WAV file"""
-        # Load audio
-        audio, sr = librosa.load(wav_path, sr=self.sr)
-        
-        # Extract MFCC
-        mfcc = librosa.feature.mfcc(
-            y=audio,
-            sr=sr,
-            n_mfcc=self.n_mfcc,
-            n_fft=self.n_fft,
-            hop_length=self.hop_length
-        )
-        
-        return mfcc
+        """Extract MFCC from WAV file (long recordings are streamed in blocks)"""
+        return self.extractor.extract_file(wav_path, deltas=False, stats=False)['mfcc']
     
     def save_mfcc_as_json(self, mfcc, output_path, question_id, text):
         """Save MFCC as JSON for VB.NET"""
@@ -50,9 +78,12 @@ class ReferenceGenerator:
             "shape": list(mfcc.shape)
         }
         
-        # Save to JSON
-        with open(output_path, 'w') as f:
+        # Save to JSON (temp file + rename, so an interrupted run never leaves half a file)
+        output_path = Path(output_path)
+        temp_path = output_path.with_name(f".{output_path.name}.tmp")
+        with open(temp_path, 'w') as f:
             json.dump(data, f, indent=2)
+        os.replace(temp_path, output_path)
         
         print(f"✓ Saved: {output_path}")
     
@@ -70,71 +101,231 @@ class ReferenceGenerator:
         
         return output_path
     
-    def generate_all_references(self, reference_dir, output_dir):
-        """Generate MFCC for all reference audio files"""
+    def params(self):
+        return {"n_mfcc": self.n_mfcc, "sr": self.sr, "n_fft": self.n_fft, "hop_length": self.hop_length}
+    
+    @staticmethod
+    def _failed(audio_file, text, error):
+        message = str(error) or type(error).__name__
+        print(f"✗ Error: {audio_file.name}: {message}")
+        return {
+            'text': text,
+            'wav_file': str(audio_file),
+            'status': 'error',
+            'error': message
+        }
+    
+    def _add_reference(self, writer, manifest, output_dir, write_json, audio_file, text, question_id, digest,
+                       mfcc=None, frames=None):
+        """Store entry, legacy JSON and manifest record of one computed reference"""
+        outputs = []
+        if write_json:
+            json_path = output_dir / f"{text.replace(' ', '_')}_mfcc.json"
+            self.save_mfcc_as_json(mfcc if frames is None else frames.array('mfcc'), json_path, question_id, text)
+            outputs.append(json_path.name)
+        if frames is None:
+            writer.add(text, mfcc, question_id)
+        else:
+            writer.add_frames(text, frames, question_id)
+        if not write_json:
+            print(f"✓ Added to store: {text} {writer.entries[text]['shape']}")
+        manifest.record(audio_file.name, audio_file, digest, outputs)
+        return {
+            'text': text,
+            'wav_file': str(audio_file),
+            'store_file': str(writer.data_path),
+            'status': 'success'
+        }
+    
+    def _stream_reference(self, writer, manifest, output_dir, write_json, audio_file, text, question_id, digest):
+        """A recording longer than extractor.stream_seconds, streamed block by block into the store"""
+        with SpillFrameWriter(self.n_mfcc, spill_dir=output_dir) as frames:
+            self.extractor.stream_file(str(audio_file), frames, deltas=False, spill_dir=output_dir)
+            return self._add_reference(writer, manifest, output_dir, write_json, audio_file, text,
+                                       question_id, digest, frames=frames)
+    
+    def _build_store(self, audio_files, output_dir, writer, manifest, previous, incremental, write_json,
+                     question_ids, removed):
+        """
+        Add every reference to the writer (reused, recomputed or carried over)
+
+        Returns:
+            tuple: (results, kept, dropped)
+        """
+        store_path = writer.data_path
+        same_params = previous is not None and previous.params == self.params()
+        results = []
+        pending = []
+        for text, audio_file in audio_files.items():
+            question_id = question_ids.get(text, 0)
+            
+            up_to_date, digest = manifest.check(audio_file.name, audio_file, output_dir)
+            if incremental and up_to_date and same_params and text in previous:
+                writer.add(text, np.array(previous.get(text)), question_id)
+                results.append({
+                    'text': text,
+                    'wav_file': str(audio_file),
+                    'store_file': str(store_path),
+                    'status': 'skipped'
+                })
+                continue
+            
+            duration = self.extractor.file_duration(audio_file)
+            if duration is not None and duration > self.extractor.stream_seconds:
+                # Long recordings stay out of the batch: decoding them whole is what streaming avoids
+                print(f"\nStreaming: {audio_file.name} ({duration:.0f}s)")
+                try:
+                    results.append(self._stream_reference(writer, manifest, output_dir, write_json,
+                                                          audio_file, text, question_id, digest))
+                except Exception as e:
+                    results.append(self._failed(audio_file, text, e))
+                continue
+            
+            pending.append((audio_file, text, question_id, digest))
+        
+        # Changed references: load a batch, then one extractor call for its MFCCs
+        for start in range(0, len(pending), self.BATCH_SIZE):
+            loaded = []
+            for audio_file, text, question_id, digest in pending[start:start + self.BATCH_SIZE]:
+                print(f"\nProcessing: {audio_file.name}")
+                print(f"  Text: {text}")
+                try:
+                    loaded.append((audio_file, text, question_id, digest, self.extractor.load(str(audio_file))))
+                except Exception as e:
+                    results.append(self._failed(audio_file, text, e))
+            
+            signals = [item[4] for item in loaded]
+            try:
+                features = self.extractor.extract_batch(signals, deltas=False, stats=False)
+            except Exception:
+                # One bad clip must not fail the others: redo this batch clip by clip
+                features = []
+                for y in signals:
+                    try:
+                        features.append(self.extractor.extract(y, deltas=False, stats=False))
+                    except Exception as e:
+                        features.append(e)
+            for (audio_file, text, question_id, digest, _), feature in zip(loaded, features):
+                try:
+                    if isinstance(feature, Exception):
+                        raise feature
+                    results.append(self._add_reference(writer, manifest, output_dir, write_json,
+                                                       audio_file, text, question_id, digest,
+                                                       mfcc=feature['mfcc']))
+                except Exception as e:
+                    results.append(self._failed(audio_file, text, e))
+        
+        # Entries this run did not write are carried over: words without reference
+        # audio here (not deleted ones) and words whose audio failed this time,
+        # unless they were computed with other MFCC parameters
+        kept = dropped = 0
+        if previous is not None:
+            for word in previous.words():
+                if word in removed or word in writer.entries:
+                    continue
+                if not same_params:
+                    dropped += 1
+                    continue
+                writer.add(word, np.array(previous.get(word)), previous.entries[word]['question_id'])
+                kept += 1
+        
+        return results, kept, dropped
+    
+    def generate_all_references(self, reference_dir, output_dir, incremental=True, write_json=False,
+                                question_ids=None):
+        """
+        Generate MFCC for all reference audio files (<word>_ref.wav, .mp3, ...)
+        into one binary reference store (reference_store.bin + reference_store.json,
+        see reference_store.py)
+        
+        With incremental=True, references whose audio and MFCC parameters are
+        unchanged since the last run are copied from the previous store instead of
+        being recomputed. Outputs of deleted reference audio are removed
+        (tracked in <output_dir>/.manifest.json). Store entries that have no
+        reference audio here (e.g. merged by build_references.py) are kept.
+        
+        Args:
+            write_json (bool): Also write legacy <word>_mfcc.json files
+            question_ids (dict, optional): Lowercase word -> question id
+        """
         reference_dir = Path(reference_dir)
         output_dir = Path(output_dir)
         
         # Create output directory
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        # Find all WAV files
-        wav_files = list(reference_dir.glob("*_ref.wav"))
-        
-        if not wav_files:
-            print(f"❌ No reference WAV files found in {reference_dir}")
-            print("   Expected format: <word>_ref.wav (e.g., cup_ref.wav)")
+        # Find all reference audio files
+        audio_files = find_reference_audio(reference_dir)
+        if not audio_files:
+            print(f"❌ No reference audio files found in {reference_dir}")
+            print(f"   Expected format: <word>_ref.wav or .mp3 (e.g., cup_ref.wav)")
             return
         
-        print(f"Found {len(wav_files)} reference audio files")
+        question_ids = question_ids or {}
+        
+        # The manifest is kept with --force as well: it tells which store entries
+        # belong to reference audio that has since been deleted
+        manifest = Manifest(output_dir / MANIFEST_NAME, dict(self.params(), json=write_json))
+        removed = set()
+        for name in manifest.prune([f.name for f in audio_files.values()], output_dir):
+            print(f"🗑️  Removed outputs of deleted reference: {name}")
+            removed.add(reference_text(name))
+        previous = ReferenceStore.open_if_exists(output_dir)
+        
+        print(f"Found {len(audio_files)} reference audio files")
         print("=" * 60)
         
-        results = []
-        for wav_file in wav_files:
-            # Extract text from filename (remove _ref.wav)
-            text = wav_file.stem.replace("_ref", "")
-            
-            print(f"\nProcessing: {wav_file.name}")
-            print(f"  Text: {text}")
-            
-            try:
-                # Process
-                output_path = self.process_reference_audio(
-                    str(wav_file),
-                    str(output_dir),
-                    question_id=0,  # Will be updated from DB
-                    text=text
-                )
-                
-                results.append({
-                    'text': text,
-                    'wav_file': str(wav_file),
-                    'json_file': str(output_path),
-                    'status': 'success'
-                })
-                
-            except Exception as e:
-                print(f"✗ Error: {str(e)}")
-                results.append({
-                    'text': text,
-                    'wav_file': str(wav_file),
-                    'status': 'error',
-                    'error': str(e)
-                })
+        store_path = store_paths(output_dir)[0]
+        writer = ReferenceStoreWriter(output_dir, self.params())
+        try:
+            results, kept, dropped = self._build_store(audio_files, output_dir, writer, manifest, previous,
+                                                       incremental, write_json, question_ids, removed)
+        except BaseException:
+            # Leave the previous store in place and no temp file behind
+            writer.abort()
+            if previous is not None:
+                previous.close()
+            raise
+        
+        # Release the old mapping before the new store replaces it
+        if previous is not None:
+            previous.close()
+        writer.close()
+        manifest.save()
         
         print("\n" + "=" * 60)
         print("SUMMARY")
         print("=" * 60)
         successful = sum(1 for r in results if r['status'] == 'success')
+        skipped = sum(1 for r in results if r['status'] == 'skipped')
         print(f"Total: {len(results)}")
         print(f"Successful: {successful}")
-        print(f"Failed: {len(results) - successful}")
+        print(f"Skipped (unchanged): {skipped}")
+        print(f"Failed: {len(results) - successful - skipped}")
+        if kept:
+            print(f"Kept from the previous store (no reference audio here): {kept}")
+        if dropped:
+            print(f"❌ Dropped {dropped} previous entries made with other MFCC parameters "
+                  f"({previous.params}); rebuild them with build_references.py")
         
         return results
 
 
 def main():
     """Main function"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Generate reference MFCC JSON files")
+    parser.add_argument("--force", action="store_true",
+                        help="Regenerate every reference, ignoring the manifest of the previous run")
+    parser.add_argument("--json", action="store_true",
+                        help="Also write legacy <word>_mfcc.json files (older clients only)")
+    parser.add_argument("--no-audio-cache", action="store_true",
+                        help="Always decode the audio again (skip cache/audio, see audio_cache.py)")
+    parser.add_argument("--audio-cache-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Size limit of the decoded-audio cache in MB")
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("REFERENCE MFCC GENERATOR")
     print("=" * 60)
@@ -166,17 +357,32 @@ def main():
         n_mfcc=13,
         sr=22050,
         n_fft=2048,
-        hop_length=512
+        hop_length=512,
+        audio_cache=None if args.no_audio_cache else AudioCache(max_bytes=args.audio_cache_mb * 1024 * 1024)
     )
     
     # Generate all references
-    results = generator.generate_all_references(reference_dir, output_dir)
+    # Question ids come from the questions table dump when it is available
+    question_ids = {}
+    try:
+        from questions import load_questions
+        for q in load_questions():
+            question_ids.setdefault(q['text'].strip().lower(), q['id'])
+    except OSError:
+        print("db.sql not found; question_id is left at 0")
+    
+    results = generator.generate_all_references(
+        reference_dir, output_dir,
+        incremental=not args.force,
+        write_json=args.json,
+        question_ids=question_ids
+    )
     
     if results:
         print("\n✅ Reference generation complete!")
-        print(f"\nJSON files saved to: {output_dir}")
+        print(f"\nReference store saved to: {store_paths(output_dir)[0]}")
         print("\nNext steps:")
-        print("1. Copy JSON files to your VB.NET project folder")
+        print("1. Copy reference_store.bin/.json (or the JSON files from --json) to your VB.NET project folder")
         print("2. Install NuGet packages: NAudio, Accord.Audio, Newtonsoft.Json")
         print("3. Add the VB.NET modules to your project")
         print("4. Modify Form2 and Form3 as per implementation plan")
@@ -0,0 +1,283 @@
+"""
+Selectable CPU inference backends for the Wav2Vec2 scoring model.
+
+  torch       plain PyTorch fp32 (baseline)
+  torch-int8  PyTorch with dynamic INT8 quantization of the Linear layers (done at load)
+  onnx        exported graph on ONNX Runtime
+  onnx-int8   exported graph with ONNX Runtime dynamic INT8 quantization
+
+The ONNX graphs take input_values and attention_mask; when no mask is given
+(models without one, like the base checkpoint) the backend feeds all ones,
+which is the same as running without a mask.
+
+Usage:
+  python inference_backend.py export              # one-shot export/quantize into models/
+  python inference_backend.py verify [clip_dir]   # transcription check + latency table
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from transformers import Wav2Vec2Config, Wav2Vec2ForCTC, Wav2Vec2Processor
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+DEFAULT_MODEL_ID = "facebook/wav2vec2-base-960h"
+DEFAULT_MODEL_DIR = Path(__file__).parent / "models"
+
+
+def artifact_paths(model_dir, model_id=DEFAULT_MODEL_ID):
+    """File names produced by `export` for a given model"""
+    model_dir = Path(model_dir)
+    stem = model_id.split("/")[-1]
+    return {
+        "onnx": model_dir / f"{stem}.onnx",
+        "onnx-int8": model_dir / f"{stem}-int8.onnx",
+    }
+
+
+class TorchBackend:
+    """PyTorch forward pass; logits are returned as float32 numpy arrays"""
+
+    name = "torch"
+
+    def __init__(self, model, device="cpu"):
+        self.model = model
+        self.device = device
+        self.config = model.config
+
+    def __call__(self, input_values, attention_mask=None):
+        with torch.no_grad():
+            inputs = torch.from_numpy(input_values).to(self.device)
+            if attention_mask is not None:
+                mask = torch.from_numpy(attention_mask).to(self.device)
+                logits = self.model(inputs, attention_mask=mask).logits
+            else:
+                logits = self.model(inputs).logits
+        return logits.float().cpu().numpy()
+
+    def frame_counts(self, sample_counts):
+        return output_lengths(self.config, sample_counts)
+
+
+class OnnxBackend:
+    """ONNX Runtime session on the exported graph (CPU execution provider)"""
+
+    def __init__(self, onnx_path, config, name="onnx", num_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            str(onnx_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.config = config
+        self.name = name
+
+    def __call__(self, input_values, attention_mask=None):
+        feeds = {"input_values": input_values.astype(np.float32, copy=False)}
+        if "attention_mask" in self.input_names:
+            if attention_mask is None:
+                attention_mask = np.ones(input_values.shape, dtype=np.int64)
+            feeds["attention_mask"] = attention_mask.astype(np.int64, copy=False)
+        return self.session.run(["logits"], feeds)[0]
+
+    def frame_counts(self, sample_counts):
+        return output_lengths(self.config, sample_counts)
+
+
+def output_lengths(config, sample_counts):
+    """Number of logit frames the conv feature encoder yields per input length"""
+    lengths = np.asarray(sample_counts, dtype=np.int64)
+    for kernel, stride in zip(config.conv_kernel, config.conv_stride):
+        lengths = (lengths - kernel) // stride + 1
+    return np.maximum(lengths, 0)
+
+
+def quantize_torch(model):
+    """Dynamic INT8 quantization of all Linear layers (CPU only)"""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_backend(name, model_id=DEFAULT_MODEL_ID, device="cpu", model_dir=DEFAULT_MODEL_DIR,
+                 num_threads=None, local_files_only=False):
+    """
+    Build the inference backend selected in config
+
+    Args:
+        name (str): One of BACKENDS
+        model_id (str): Hugging Face model id
+        device (str): Torch device for the fp32 backend; the others are CPU only
+        model_dir (str): Directory holding artifacts written by `export`
+        num_threads (int, optional): ONNX Runtime intra-op threads
+        local_files_only (bool): Never contact the Hugging Face hub
+
+    Returns:
+        Backend callable: backend(input_values, attention_mask=None) -> logits
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of {BACKENDS}")
+
+    if name.startswith("onnx"):
+        # The graph holds the weights; only the config (conv layout for frame_counts) is needed
+        path = artifact_paths(model_dir, model_id)[name]
+        if not path.exists():
+            raise FileNotFoundError(
+                f"{path} not found. Run `python inference_backend.py export` first."
+            )
+        config = Wav2Vec2Config.from_pretrained(model_id, local_files_only=local_files_only)
+        return OnnxBackend(path, config, name=name, num_threads=num_threads)
+
+    model = Wav2Vec2ForCTC.from_pretrained(model_id, local_files_only=local_files_only)
+    model.eval()
+
+    if name == "torch":
+        return TorchBackend(model.to(device), device)
+
+    # Dynamic quantization of the fp32 weights takes seconds; nothing is stored for it
+    backend = TorchBackend(quantize_torch(model), "cpu")
+    backend.name = name
+    return backend
+
+
+class _LogitsOnly(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_values, attention_mask):
+        return self.model(input_values, attention_mask=attention_mask).logits
+
+
+def export(model_id=DEFAULT_MODEL_ID, model_dir=DEFAULT_MODEL_DIR):
+    """Write the fp32 and INT8 ONNX graphs"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    paths = artifact_paths(model_dir, model_id)
+    Path(model_dir).mkdir(parents=True, exist_ok=True)
+
+    model = Wav2Vec2ForCTC.from_pretrained(model_id)
+    model.eval()
+
+    print(f"Exporting ONNX graph: {paths['onnx']}")
+    dummy = torch.zeros(1, 16000, dtype=torch.float32)
+    dummy_mask = torch.ones(1, 16000, dtype=torch.int64)
+    torch.onnx.export(
+        _LogitsOnly(model), (dummy, dummy_mask), str(paths["onnx"]),
+        input_names=["input_values", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={"input_values": {0: "batch", 1: "samples"},
+                      "attention_mask": {0: "batch", 1: "samples"},
+                      "logits": {0: "batch", 1: "frames"}},
+        opset_version=14,
+        do_constant_folding=True
+    )
+
+    print(f"Quantizing ONNX graph: {paths['onnx-int8']}")
+    quantize_dynamic(str(paths["onnx"]), str(paths["onnx-int8"]), weight_type=QuantType.QInt8)
+
+    print("✓ Export complete")
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two sequences"""
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def verify(clip_dir, backends=BACKENDS, model_id=DEFAULT_MODEL_ID, model_dir=DEFAULT_MODEL_DIR,
+           sampling_rate=16000, repeats=3):
+    """
+    Compare greedy transcriptions of every backend with the fp32 baseline
+
+    Returns:
+        list: One row per backend with latency and agreement numbers
+    """
+    import librosa
+
+    clip_dir = Path(clip_dir)
+    clips = sorted(p for p in clip_dir.iterdir() if p.suffix.lower() in (".wav", ".mp3", ".flac"))
+    if not clips:
+        raise FileNotFoundError(f"No reference clips found in {clip_dir}")
+
+    processor = Wav2Vec2Processor.from_pretrained(model_id)
+    audio = [librosa.load(str(p), sr=sampling_rate)[0] for p in clips]
+    inputs = [processor(a, sampling_rate=sampling_rate, return_tensors="np").input_values for a in audio]
+
+    # fp32 always runs first and is the reference for the others
+    backends = ["torch"] + [b for b in backends if b != "torch"]
+    baseline = None
+    rows = []
+    for name in backends:
+        try:
+            backend = load_backend(name, model_id, "cpu", model_dir)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"  - skipping {name}: {e}")
+            continue
+
+        latencies = []
+        transcripts = []
+        for values in inputs:
+            backend(values)  # warm-up
+            started = time.perf_counter()
+            for _ in range(repeats):
+                logits = backend(values)
+            latencies.append((time.perf_counter() - started) / repeats * 1000.0)
+            transcripts.append(processor.decode(np.argmax(logits[0], axis=-1)).upper())
+
+        if baseline is None:
+            baseline = transcripts
+
+        matches = sum(t == b for t, b in zip(transcripts, baseline))
+        errors = sum(edit_distance(t, b) for t, b in zip(transcripts, baseline))
+        chars = max(1, sum(len(b) for b in baseline))
+        rows.append({
+            "backend": name,
+            "mean_ms": float(np.mean(latencies)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "exact_match": f"{matches}/{len(clips)}",
+            "cer_vs_fp32": errors / chars,
+        })
+
+    print("\n" + "=" * 66)
+    print(f"{'Backend':<12}{'Mean ms':>10}{'p95 ms':>10}{'Speedup':>10}{'Match':>10}{'CER':>10}")
+    print("=" * 66)
+    for row in rows:
+        speedup = rows[0]["mean_ms"] / row["mean_ms"] if row["mean_ms"] else 0.0
+        print(f"{row['backend']:<12}{row['mean_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+              f"{speedup:>9.2f}x{row['exact_match']:>10}{row['cer_vs_fp32']:>10.3f}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wav2Vec2 inference backend tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_cmd = sub.add_parser("export", help="Export ONNX and quantized models")
+    export_cmd.add_argument("--model-dir", default=str(DEFAULT_MODEL_DIR))
+
+    verify_cmd = sub.add_parser("verify", help="Check transcriptions against fp32 and time each backend")
+    verify_cmd.add_argument("clip_dir", nargs="?",
+                            default=str(Path(__file__).parent / "dataset" / "references"))
+    verify_cmd.add_argument("--model-dir", default=str(DEFAULT_MODEL_DIR))
+    verify_cmd.add_argument("--backends", default=",".join(BACKENDS))
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export(model_dir=args.model_dir)
+    else:
+        verify(args.clip_dir, backends=args.backends.split(","), model_dir=args.model_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Dynamic micro-batching for Wav2Vec2 inference.
+Concurrent /compare requests are collected for a few milliseconds, padded into
+one batch and run through a single forward pass; logits are scattered back.
+
+Models that take no attention mask (base wav2vec2) see the zero padding, so a
+clip is only batched with clips of about its own length (max_padding); its
+logits then stay within rounding of an unbatched forward pass.
+
+Usage:
+  python inference_batcher.py verify [clip_dir]   # batched vs one-by-one transcripts
+"""
+
+import itertools
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class _PendingRequest:
+    """One speech buffer waiting for its logits"""
+
+    __slots__ = ("speech", "enqueued_at", "started_at", "preprocess_s", "forward_s",
+                 "done", "logits", "error")
+
+    def __init__(self, speech):
+        self.speech = speech
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+        self.preprocess_s = 0.0
+        self.forward_s = 0.0
+        self.done = threading.Event()
+        self.logits = None
+        self.error = None
+
+
+class InferenceBatcher:
+    """Collect pending inference calls and run them as one padded batch"""
+
+    def __init__(self, processor, backend, sampling_rate=16000,
+                 max_batch_size=8, max_wait_ms=10.0, max_padding=0.05, history_size=1000):
+        """
+        Args:
+            processor: Wav2Vec2Processor used for normalization and padding
+            backend: Callable from inference_backend.load_backend
+            max_padding (float): Without an attention mask, the longest clip of a
+                batch is at most this fraction longer than the shortest
+        """
+        self.processor = processor
+        self.backend = backend
+        self.sampling_rate = sampling_rate
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_padding = max(0.0, float(max_padding))
+
+        # Base wav2vec2 checkpoints (group norm) must not receive an attention
+        # mask; they are zero-padded instead, as recommended by transformers.
+        self.use_attention_mask = bool(
+            getattr(processor.feature_extractor, "return_attention_mask", False)
+        )
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._worker = None
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=history_size)
+        self._queue_waits = deque(maxlen=history_size)
+        self._batch_sizes = deque(maxlen=history_size)
+        self._completed = deque(maxlen=history_size)
+        self._total_requests = 0
+        self._total_batches = 0
+
+    def infer(self, speech, timings=None):
+        """
+        Run speech through the model, batched with concurrent callers.
+
+        Args:
+            speech (numpy.ndarray): Mono float32 audio at ``sampling_rate``
+            timings (dict, optional): Filled with queue_wait, preprocess and
+                forward seconds for this request
+
+        Returns:
+            numpy.ndarray: Logits with shape (frames, vocab_size)
+        """
+        self._ensure_worker()
+        item = _PendingRequest(np.asarray(speech, dtype=np.float32))
+        with self._cond:
+            self._pending.append(item)
+            self._cond.notify()
+
+        item.done.wait()
+        if timings is not None and item.started_at is not None:
+            timings["queue_wait"] = item.started_at - item.enqueued_at
+            timings["preprocess"] = item.preprocess_s
+            timings["forward"] = item.forward_s
+        if item.error is not None:
+            raise item.error
+
+        latency = time.perf_counter() - item.enqueued_at
+        with self._stats_lock:
+            self._latencies.append(latency)
+            self._completed.append(time.perf_counter())
+            self._total_requests += 1
+        return item.logits
+
+    def _ensure_worker(self):
+        """Start the batching thread on first use (also after a fork)"""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._cond:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="inference-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _collect_batch(self):
+        """Block for the first request, then wait up to max_wait for more"""
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+
+            deadline = self._pending[0].enqueued_at + self.max_wait
+            while len(self._compatible()) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._compatible()
+            taken = set(map(id, batch))
+            # The others keep their order and go first in the next batch
+            self._pending = deque(item for item in self._pending if id(item) not in taken)
+            return batch
+
+    def _compatible(self):
+        """
+        The oldest pending request plus the next ones that can share its batch
+        (any length with an attention mask, else within max_padding of each other)
+        """
+        first = self._pending[0]
+        shortest = longest = len(first.speech)
+        batch = [first]
+        for item in itertools.islice(self._pending, 1, None):
+            if len(batch) >= self.max_batch_size:
+                break
+            length = len(item.speech)
+            if not self.use_attention_mask:
+                low, high = min(shortest, length), max(longest, length)
+                if high > low * (1.0 + self.max_padding):
+                    continue
+                shortest, longest = low, high
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            for item in batch:
+                item.started_at = started
+            try:
+                self._forward(batch)
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+            finally:
+                with self._stats_lock:
+                    self._total_batches += 1
+                    self._batch_sizes.append(len(batch))
+                    self._queue_waits.extend(started - item.enqueued_at for item in batch)
+                for item in batch:
+                    item.done.set()
+
+    def _forward(self, batch):
+        """Pad the batch, run one forward pass and scatter logits back"""
+        started = time.perf_counter()
+        inputs = self.processor(
+            [item.speech for item in batch],
+            sampling_rate=self.sampling_rate,
+            return_tensors="np",
+            padding=True,
+            return_attention_mask=True,
+        )
+        attention_mask = inputs.attention_mask
+        preprocessed = time.perf_counter()
+        logits = self.backend(
+            inputs.input_values,
+            attention_mask if self.use_attention_mask else None
+        )
+        finished = time.perf_counter()
+
+        # Trim each row back to the number of frames its own audio produced
+        frame_counts = self.backend.frame_counts(attention_mask.sum(-1))
+        for i, item in enumerate(batch):
+            item.logits = logits[i, :int(frame_counts[i])]
+            item.preprocess_s = preprocessed - started
+            item.forward_s = finished - preprocessed
+
+    def stats(self):
+        """Per-request latency and aggregate throughput for tuning the window"""
+        with self._stats_lock:
+            latencies = np.array(self._latencies, dtype=np.float64) * 1000.0
+            waits = np.array(self._queue_waits, dtype=np.float64) * 1000.0
+            batch_sizes = np.array(self._batch_sizes, dtype=np.float64)
+            completed = list(self._completed)
+            total_requests = self._total_requests
+            total_batches = self._total_batches
+
+        def percentiles(values):
+            if values.size == 0:
+                return {"p50": None, "p95": None, "p99": None, "mean": None}
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            return {
+                "p50": round(float(p50), 2),
+                "p95": round(float(p95), 2),
+                "p99": round(float(p99), 2),
+                "mean": round(float(values.mean()), 2),
+            }
+
+        throughput = None
+        if len(completed) > 1 and completed[-1] > completed[0]:
+            throughput = round((len(completed) - 1) / (completed[-1] - completed[0]), 2)
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "total_requests": total_requests,
+            "total_batches": total_batches,
+            "mean_batch_size": round(float(batch_sizes.mean()), 2) if batch_sizes.size else None,
+            "latency_ms": percentiles(latencies),
+            "queue_wait_ms": percentiles(waits),
+            "throughput_rps": throughput,
+        }
+
+
+def verify(clip_dir, model_id=None, sampling_rate=16000, max_batch_size=8, max_padding=0.05):
+    """
+    Transcribe every clip alone and then all of them concurrently through the
+    batcher; prints how many transcripts match and the largest logit difference
+
+    Returns:
+        dict: clips, batches, matching transcripts, max_logit_diff
+    """
+    import librosa
+    from concurrent.futures import ThreadPoolExecutor
+    from pathlib import Path
+    from transformers import Wav2Vec2Processor
+
+    from inference_backend import DEFAULT_MODEL_ID, load_backend
+
+    model_id = model_id or DEFAULT_MODEL_ID
+    clips = sorted(p for p in Path(clip_dir).iterdir() if p.suffix.lower() in (".wav", ".mp3", ".flac"))
+    if not clips:
+        raise FileNotFoundError(f"No clips found in {clip_dir}")
+    processor = Wav2Vec2Processor.from_pretrained(model_id)
+    backend = load_backend("torch", model_id)
+    audio = [librosa.load(str(p), sr=sampling_rate)[0] for p in clips]
+
+    def transcript(logits):
+        return processor.decode(np.argmax(logits, axis=-1)).upper()
+
+    alone = InferenceBatcher(processor, backend, sampling_rate, max_batch_size=1)
+    expected = [alone.infer(a) for a in audio]
+
+    # A long window so that every clip is pending before the first batch is cut
+    batcher = InferenceBatcher(processor, backend, sampling_rate, max_batch_size=max_batch_size,
+                               max_wait_ms=500.0, max_padding=max_padding)
+    with ThreadPoolExecutor(max_workers=len(audio)) as pool:
+        batched = list(pool.map(batcher.infer, audio))
+
+    matches = sum(transcript(a) == transcript(b) for a, b in zip(expected, batched))
+    diff = max(float(np.abs(a - b).max()) for a, b in zip(expected, batched))
+    stats = batcher.stats()
+    print(f"Clips: {len(clips)}  batches: {stats['total_batches']}  mean batch size: {stats['mean_batch_size']}")
+    print(f"Transcripts identical to one-by-one: {matches}/{len(clips)}")
+    print(f"Max |logit difference|: {diff:.2e}")
+    status = "✓" if matches == len(clips) else "❌"
+    print(f"{status} Batched transcripts {'match' if matches == len(clips) else 'differ'}")
+    return {"clips": len(clips), "batches": stats["total_batches"], "matches": matches, "max_logit_diff": diff}
+
+
+def main():
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description="Micro-batching checks")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_verify = sub.add_parser("verify", help="Batched vs one-by-one transcripts on a clip directory")
+    p_verify.add_argument("clip_dir", nargs="?", default=str(Path(__file__).parent / "dataset" / "references"))
+    p_verify.add_argument("--max-padding", type=float, default=0.05)
+    args = parser.parse_args()
+    verify(args.clip_dir, max_padding=args.max_padding)
+
+
+if __name__ == "__main__":
+    main()
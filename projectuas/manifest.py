@@ -0,0 +1,172 @@
+"""
+Content-hash manifest for incremental batch processing.
+Each input is recorded with its size, mtime and sha256 plus the outputs it
+produced, under a fingerprint of the processing parameters. A re-run skips
+inputs whose content and parameters are unchanged and prunes the outputs of
+inputs that were deleted.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = ".manifest.json"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """sha256 of a file's contents"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def param_fingerprint(params):
+    """Stable short hash of the processing parameters"""
+    encoded = json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class Manifest:
+    """Per-input content hashes and outputs, stored as JSON next to the outputs"""
+
+    def __init__(self, path, params, save_every=100):
+        """
+        Args:
+            path (str): Manifest file
+            params (dict): Parameters that affect the outputs (e.g. n_mfcc, n_fft, hop_length, sr)
+            save_every (int): Flush to disk after this many recorded inputs
+        """
+        self.path = Path(path)
+        self.params = params
+        self.fingerprint = param_fingerprint(params)
+        self.save_every = save_every
+        self.entries = {}
+        self._unsaved = 0
+
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable manifest {self.path}: {e}")
+                data = {}
+            if data.get('version') == MANIFEST_VERSION:
+                self.entries = data.get('entries', {})
+                if data.get('fingerprint') != self.fingerprint:
+                    # Produced with other parameters: everything is stale, but the
+                    # recorded outputs are kept so deleted inputs can still be pruned
+                    for entry in self.entries.values():
+                        entry['sha256'] = None
+
+    def check(self, key, input_path, output_root=None):
+        """
+        Args:
+            key (str): Input id (e.g. path relative to the input directory)
+            input_path (str): Input file
+            output_root (str, optional): Directory the recorded outputs are relative to
+
+        Returns:
+            tuple: (up_to_date, digest) - digest is reused for record()
+        """
+        stat = os.stat(input_path)
+        entry = self.entries.get(key)
+
+        # Unchanged size and mtime: trust the stored hash instead of re-reading the file
+        if (entry and entry.get('sha256') and entry.get('size') == stat.st_size
+                and entry.get('mtime_ns') == stat.st_mtime_ns):
+            digest = entry['sha256']
+        else:
+            digest = file_digest(input_path)
+
+        return self._is_current(entry, digest, output_root), digest
+
+    def check_digest(self, key, digest, output_root=None):
+        """
+        check() for inputs that are not files (e.g. in-memory arrays); the
+        caller hashes the content
+
+        Returns:
+            bool: up_to_date
+        """
+        return self._is_current(self.entries.get(key), digest, output_root)
+
+    def _is_current(self, entry, digest, output_root):
+        if not entry or entry.get('sha256') != digest:
+            return False
+        if output_root is not None:
+            root = Path(output_root)
+            if not all((root / out).exists() for out in entry.get('outputs', [])):
+                return False
+        return True
+
+    def record(self, key, input_path, digest, outputs, info=None):
+        """
+        Args:
+            key (str): Input id
+            input_path (str): Input file (None for check_digest() inputs)
+            digest (str): sha256 from check()
+            outputs (list): Output paths, relative to the output root
+            info (dict, optional): Small result summary kept for skipped re-runs
+        """
+        stat = os.stat(input_path) if input_path is not None else None
+        self.entries[key] = {
+            'size': stat.st_size if stat else None,
+            'mtime_ns': stat.st_mtime_ns if stat else None,
+            'sha256': digest,
+            'outputs': [str(out) for out in outputs],
+            'info': info or {},
+        }
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def info(self, key):
+        return self.entries.get(key, {}).get('info', {})
+
+    def prune(self, present_keys, output_root):
+        """
+        Delete outputs of inputs that no longer exist and drop their entries
+
+        Args:
+            present_keys (iterable): Input ids found in this run
+            output_root (str): Directory the recorded outputs are relative to
+
+        Returns:
+            list: Removed input ids
+        """
+        root = Path(output_root).resolve()
+        present = set(present_keys)
+        removed = sorted(key for key in self.entries if key not in present)
+        for key in removed:
+            for out in self.entries[key].get('outputs', []):
+                target = (root / out).resolve()
+                # Never delete anything outside the output directory
+                if target == root or root not in target.parents:
+                    continue
+                if target.is_dir():
+                    shutil.rmtree(target, ignore_errors=True)
+                elif target.exists():
+                    target.unlink()
+            del self.entries[key]
+        if removed:
+            self._unsaved += len(removed)
+        return removed
+
+    def save(self):
+        """Write atomically so an interrupted run leaves the previous manifest intact"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'fingerprint': self.fingerprint,
+                'params': self.params,
+                'entries': {k: self.entries[k] for k in sorted(self.entries)},
+            }, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
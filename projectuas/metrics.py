@@ -0,0 +1,161 @@
+"""
+Per-stage latency metrics for the scoring API.
+Stage timers feed sliding-window summaries (p50/p95/p99) plus request and
+error counters, rendered in Prometheus text format or JSON on /metrics.
+Timings of the current request are also collected for a debug header.
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class Summary:
+    """Count, sum and quantiles over the most recent observations"""
+
+    def __init__(self, window=2048):
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self):
+        if not self.values:
+            return {q: None for q in QUANTILES}
+        points = np.quantile(np.fromiter(self.values, dtype=np.float64), QUANTILES)
+        return dict(zip(QUANTILES, (float(p) for p in points)))
+
+
+class Metrics:
+    """Thread-safe registry of stage summaries and request/error counters"""
+
+    def __init__(self, prefix="vr", window=2048):
+        self.prefix = prefix
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._requests = {}
+        self._request_latency = {}
+        self._errors = {}
+
+    # ---- per-request collection -------------------------------------------
+
+    def start_request(self):
+        """Begin collecting stage timings for the current request"""
+        return _request_timings.set([])
+
+    def finish_request(self, token):
+        """Stop collecting and return [(stage, seconds), ...] for the request"""
+        timings = _request_timings.get() or []
+        _request_timings.reset(token)
+        return timings
+
+    # ---- recording --------------------------------------------------------
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block as one pipeline stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(name, time.perf_counter() - started)
+
+    def observe_stage(self, name, seconds):
+        with self._lock:
+            summary = self._stages.get(name)
+            if summary is None:
+                summary = self._stages[name] = Summary(self.window)
+            summary.observe(seconds)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, seconds))
+
+    def observe_request(self, endpoint, status, seconds):
+        with self._lock:
+            key = (endpoint, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            summary = self._request_latency.get(endpoint)
+            if summary is None:
+                summary = self._request_latency[endpoint] = Summary(self.window)
+            summary.observe(seconds)
+
+    def count_error(self, endpoint, error_type):
+        with self._lock:
+            key = (endpoint, error_type)
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    # ---- export -----------------------------------------------------------
+
+    def snapshot(self):
+        """JSON view: stage and request latency quantiles in ms, counters"""
+        def summarize(summary):
+            q = summary.quantiles()
+            ms = lambda v: round(v * 1000.0, 3) if v is not None else None
+            return {
+                "count": summary.count,
+                "mean_ms": ms(summary.total / summary.count) if summary.count else None,
+                "p50_ms": ms(q[0.5]),
+                "p95_ms": ms(q[0.95]),
+                "p99_ms": ms(q[0.99]),
+            }
+
+        with self._lock:
+            return {
+                "stages": {name: summarize(s) for name, s in self._stages.items()},
+                "requests": {name: summarize(s) for name, s in self._request_latency.items()},
+                "request_counts": [
+                    {"endpoint": e, "status": st, "count": n} for (e, st), n in self._requests.items()
+                ],
+                "errors": [
+                    {"endpoint": e, "type": t, "count": n} for (e, t), n in self._errors.items()
+                ],
+            }
+
+    def render_prometheus(self):
+        """Prometheus text exposition format"""
+        p = self.prefix
+        lines = []
+
+        def summary_lines(name, label, summaries):
+            lines.append(f"# TYPE {name} summary")
+            for key, summary in summaries.items():
+                for q, value in summary.quantiles().items():
+                    if value is not None:
+                        lines.append(f'{name}{{{label}="{key}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'{name}_sum{{{label}="{key}"}} {summary.total:.6f}')
+                lines.append(f'{name}_count{{{label}="{key}"}} {summary.count}')
+
+        with self._lock:
+            summary_lines(f"{p}_stage_seconds", "stage", self._stages)
+            summary_lines(f"{p}_request_seconds", "endpoint", self._request_latency)
+
+            lines.append(f"# TYPE {p}_requests_total counter")
+            for (endpoint, status), n in sorted(self._requests.items()):
+                lines.append(f'{p}_requests_total{{endpoint="{endpoint}",status="{status}"}} {n}')
+
+            lines.append(f"# TYPE {p}_errors_total counter")
+            for (endpoint, error_type), n in sorted(self._errors.items()):
+                lines.append(f'{p}_errors_total{{endpoint="{endpoint}",type="{error_type}"}} {n}')
+
+        return "\n".join(lines) + "\n"
+
+
+def server_timing_header(timings):
+    """Format stage timings as a Server-Timing header value"""
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000.0:.2f}" for name, seconds in totals.items())
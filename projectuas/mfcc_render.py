@@ -0,0 +1,280 @@
+"""
+MFCC visualization (<name>_mfcc.png) rendered off the conversion loop.
+Plots are drawn on a headless Agg canvas after the features are written (from
+the feature shards, or from the <name>_mfcc.npy files of the per-clip output),
+either in a background process pool while the conversion continues
+(RenderQueue) or later on demand (render_directory / the CLI below). A render
+manifest keyed by the content hash of the features skips images whose
+features and plot settings have not changed.
+
+Usage:
+  python mfcc_render.py render output/mfcc_dataset [--dpi 150] [--workers 2]
+  python mfcc_render.py benchmark dataset/sample.wav     # extraction vs plot cost per dpi
+"""
+
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import librosa.display
+
+from manifest import Manifest
+
+RENDER_MANIFEST_NAME = ".render_manifest.json"
+DEFAULT_DPI = 300
+FIGSIZE = (12, 6)
+
+
+def png_path_for(mfcc_path):
+    """<name>_mfcc.npy -> <name>_mfcc.png"""
+    return Path(mfcc_path).with_suffix('.png')
+
+
+def render_mfcc(mfcc, png_path, hop_length=512, sr=22050, dpi=DEFAULT_DPI, figsize=FIGSIZE):
+    """
+    Draw one MFCC matrix to a PNG (same plot as WavToMFCC.visualize_mfcc)
+
+    Args:
+        mfcc (numpy.ndarray): (n_mfcc, frames)
+        png_path (str): Output image
+        dpi (int): Resolution of the saved image
+    """
+    # A standalone Figure on an Agg canvas: no pyplot state, no display needed
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    img = librosa.display.specshow(mfcc, x_axis='time', sr=sr, hop_length=hop_length, cmap='viridis', ax=ax)
+    fig.colorbar(img, ax=ax, format='%+2.0f dB')
+    ax.set_title('MFCC')
+    ax.set_xlabel('Time')
+    ax.set_ylabel('MFCC Coefficients')
+    fig.tight_layout()
+    fig.savefig(png_path, dpi=dpi, bbox_inches='tight')
+
+
+def render_file(mfcc_path, png_path, hop_length=512, sr=22050, dpi=DEFAULT_DPI, figsize=FIGSIZE):
+    """render_mfcc() from a saved .npy (runs in the render pool)"""
+    render_mfcc(np.load(mfcc_path), png_path, hop_length, sr, dpi, figsize)
+    return str(png_path)
+
+
+def array_digest(mfcc):
+    """sha256 of a matrix's float32 contents and shape"""
+    matrix = np.ascontiguousarray(mfcc, dtype='<f4')
+    return hashlib.sha256(str(matrix.shape).encode('ascii') + matrix.tobytes()).hexdigest()
+
+
+class RenderQueue:
+    """Renders PNGs for submitted .npy files or arrays in the background, skipping unchanged ones"""
+
+    def __init__(self, output_dir, hop_length=512, sr=22050, dpi=DEFAULT_DPI, workers=1, max_pending=None):
+        """
+        Args:
+            output_dir (str): Root of the converted dataset (holds the render manifest)
+            dpi (int): Resolution of the saved images
+            workers (int): Render processes (0 = render in this process on close())
+            max_pending (int, optional): Renders queued at once (default: 4 x workers)
+        """
+        self.output_dir = Path(output_dir)
+        self.options = {'hop_length': hop_length, 'sr': sr, 'dpi': dpi, 'figsize': FIGSIZE}
+        # Plot settings are the fingerprint: a new dpi re-renders everything
+        self.manifest = Manifest(self.output_dir / RENDER_MANIFEST_NAME, self.options)
+        self.max_pending = max_pending or 4 * max(workers, 1)
+        self.counts = {'rendered': 0, 'skipped': 0, 'failed': 0}
+        self._pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        self._pending = {}
+        self._deferred = []
+
+    def _key(self, mfcc_path):
+        return Path(mfcc_path).resolve().relative_to(self.output_dir.resolve()).as_posix()
+
+    def submit(self, mfcc_path):
+        """
+        Queue the PNG of one <name>_mfcc.npy
+
+        Returns:
+            bool: False if the existing image is already up to date
+        """
+        mfcc_path = Path(mfcc_path)
+        key = self._key(mfcc_path)
+        up_to_date, digest = self.manifest.check(key, mfcc_path, self.output_dir)
+        if up_to_date:
+            self.counts['skipped'] += 1
+            return False
+
+        self._queue((key, mfcc_path, png_path_for(mfcc_path), digest))
+        return True
+
+    def submit_array(self, key, mfcc, png_path):
+        """
+        Queue the PNG of an in-memory matrix (e.g. a clip read from feature shards)
+
+        Args:
+            key (str): Clip id in the render manifest
+            mfcc (numpy.ndarray): (n_mfcc, frames)
+            png_path (str): Output image, inside the output directory
+
+        Returns:
+            bool: False if the existing image is already up to date
+        """
+        digest = array_digest(mfcc)
+        if self.manifest.check_digest(key, digest, self.output_dir):
+            self.counts['skipped'] += 1
+            return False
+        png_path = Path(png_path)
+        png_path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue((key, np.array(mfcc, dtype=np.float32), png_path, digest))
+        return True
+
+    def _queue(self, job):
+        if self._pool is None:
+            self._deferred.append(job)
+            return
+        while len(self._pending) >= self.max_pending:
+            done, _ = wait(self._pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._finish(self._pending.pop(future), future)
+        self._pending[self._pool.submit(self._render_job(job), job[1], str(job[2]), **self.options)] = job
+
+    @staticmethod
+    def _render_job(job):
+        return render_mfcc if isinstance(job[1], np.ndarray) else render_file
+
+    def _finish(self, job, future=None):
+        key, source, png_path, digest = job
+        try:
+            if future is None:
+                self._render_job(job)(source, png_path, **self.options)
+            else:
+                future.result()
+        except Exception as e:
+            print(f"✗ Render failed {key}: {type(e).__name__}: {e}")
+            self.counts['failed'] += 1
+            return
+        self.counts['rendered'] += 1
+        input_path = None if isinstance(source, np.ndarray) else source
+        self.manifest.record(key, input_path, digest, [self._key(png_path)])
+
+    def prune(self, present_mfcc_paths):
+        """Delete images whose .npy no longer exists"""
+        return self.prune_keys([self._key(p) for p in present_mfcc_paths])
+
+    def prune_keys(self, present_keys):
+        """Delete images of keys (clip ids or .npy paths) that were not seen in this run"""
+        return self.manifest.prune(present_keys, self.output_dir)
+
+    def close(self):
+        """
+        Wait for every queued image and save the render manifest
+
+        Returns:
+            dict: rendered / skipped / failed counts
+        """
+        for job in self._deferred:
+            self._finish(job)
+        self._deferred = []
+        if self._pool is not None:
+            for future in list(self._pending):
+                self._finish(self._pending.pop(future), future)
+            self._pool.shutdown()
+            self._pool = None
+        self.manifest.save()
+        return dict(self.counts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def render_directory(output_dir, hop_length=512, sr=22050, dpi=DEFAULT_DPI, workers=1):
+    """
+    Render (on demand) the PNG of every clip of a converted dataset: from its
+    feature shards into plots/ if it has them, otherwise from every *_mfcc.npy
+
+    Returns:
+        dict: rendered / skipped / failed counts
+    """
+    from feature_shards import FeatureShards
+
+    output_dir = Path(output_dir)
+    shards = FeatureShards.open_if_exists(output_dir)
+    if shards is not None:
+        with RenderQueue(output_dir, hop_length, sr, dpi, workers) as queue:
+            queue.prune_keys(shards.clip_ids)
+            for clip_id in shards:
+                relative = Path(clip_id)
+                png_path = output_dir / "plots" / relative.parent / f"{relative.stem}_mfcc.png"
+                queue.submit_array(clip_id, shards.get(clip_id), png_path)
+        shards.close()
+        return queue.counts
+
+    mfcc_paths = sorted(output_dir.rglob("*_mfcc.npy"))
+    with RenderQueue(output_dir, hop_length, sr, dpi, workers) as queue:
+        queue.prune(mfcc_paths)
+        for mfcc_path in mfcc_paths:
+            queue.submit(mfcc_path)
+    return queue.counts
+
+
+def benchmark(wav_path, dpis=(300, 150, 72), repeats=3):
+    """Time feature extraction against one plot at each resolution"""
+    import tempfile
+    from feature_extractor import FeatureExtractor
+
+    extractor = FeatureExtractor()
+    audio = extractor.load(wav_path)
+
+    def best_of(fn):
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - started)
+        return min(times) * 1000.0
+
+    features = extractor.extract(audio)
+    rows = [("features (mfcc + deltas + stats)", best_of(lambda: extractor.extract(audio)))]
+    with tempfile.TemporaryDirectory() as tmp:
+        png_path = Path(tmp) / "bench.png"
+        for dpi in dpis:
+            rows.append((f"png dpi={dpi}", best_of(lambda: render_mfcc(features['mfcc'], png_path, dpi=dpi))))
+
+    print(f"{Path(wav_path).name}: {len(audio) / extractor.sr:.2f}s audio")
+    for label, ms in rows:
+        print(f"  {label:<34} {ms:8.1f} ms  {ms / rows[0][1]:6.1f}x")
+    return rows
+
+
+def main():
+    import argparse
+
+    default_dir = Path(__file__).parent / "output" / "mfcc_dataset"
+    parser = argparse.ArgumentParser(description="Render MFCC PNGs from converted .npy files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_render = sub.add_parser("render", help="Render missing or stale PNGs")
+    p_render.add_argument("output_dir", nargs="?", default=str(default_dir))
+    p_render.add_argument("--dpi", type=int, default=DEFAULT_DPI)
+    p_render.add_argument("--workers", type=int, default=1, help="Render processes (0 = this process)")
+    p_render.add_argument("--hop-length", type=int, default=512)
+    p_render.add_argument("--sr", type=int, default=22050)
+    p_bench = sub.add_parser("benchmark", help="Plot cost vs feature extraction for one WAV")
+    p_bench.add_argument("wav_path")
+    args = parser.parse_args()
+
+    if args.command == "render":
+        started = time.perf_counter()
+        counts = render_directory(args.output_dir, args.hop_length, args.sr, args.dpi, args.workers)
+        print(f"✓ Rendered: {counts['rendered']}, unchanged: {counts['skipped']}, failed: {counts['failed']} "
+              f"({time.perf_counter() - started:.1f}s)")
+    else:
+        benchmark(args.wav_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Persistent phoneme lexicon in front of g2p_en.
+Words are served from an in-process LRU, then from an on-disk lexicon that is
+precomputed for the whole question vocabulary; G2p only runs for new words,
+whose pronunciations are appended to the lexicon file.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from questions import DEFAULT_SQL_PATH, load_questions, question_words, reference_words
+
+
+class PhonemeLexicon:
+    """Memoized word -> phoneme lookup backed by a JSON-lines file"""
+
+    def __init__(self, lexicon_path, g2p_factory, cache_size=4096):
+        """
+        Args:
+            lexicon_path (str): JSON-lines file, one {"word": ..., "phonemes": [...]} per line
+            g2p_factory (callable): Returns a G2p instance; only called on the first miss
+            cache_size (int): Number of entries kept in the in-process LRU
+        """
+        self.lexicon_path = Path(lexicon_path)
+        self.g2p_factory = g2p_factory
+        self.cache_size = cache_size
+
+        self._g2p = None
+        self._lock = threading.Lock()
+        self._g2p_lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._lexicon = self._load()
+        self._counters = {'lru_hits': 0, 'lexicon_hits': 0, 'g2p_calls': 0}
+
+    @staticmethod
+    def normalize(word):
+        return word.strip().lower()
+
+    def _load(self):
+        lexicon = {}
+        if not self.lexicon_path.exists():
+            return lexicon
+        with open(self.lexicon_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from an interrupted append is ignored
+                    continue
+                lexicon[entry['word']] = tuple(entry['phonemes'])
+        return lexicon
+
+    def _append(self, word, phonemes):
+        self.lexicon_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lexicon_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'word': word, 'phonemes': list(phonemes)}) + "\n")
+
+    def _run_g2p(self, word):
+        with self._g2p_lock:
+            if self._g2p is None:
+                self._g2p = self.g2p_factory()
+            return tuple(p for p in self._g2p(word) if p.strip())
+
+    def _remember(self, word, phonemes):
+        self._lru[word] = phonemes
+        self._lru.move_to_end(word)
+        while len(self._lru) > self.cache_size:
+            self._lru.popitem(last=False)
+
+    def lookup(self, word):
+        """
+        Phonemes for a single word
+
+        Args:
+            word (str): Word in any case
+
+        Returns:
+            list: ARPAbet phonemes, e.g. ['K', 'AH1', 'P']
+        """
+        key = self.normalize(word)
+        with self._lock:
+            phonemes = self._lru.get(key)
+            if phonemes is not None:
+                self._lru.move_to_end(key)
+                self._counters['lru_hits'] += 1
+                return list(phonemes)
+
+            phonemes = self._lexicon.get(key)
+            if phonemes is not None:
+                self._counters['lexicon_hits'] += 1
+                self._remember(key, phonemes)
+                return list(phonemes)
+
+            self._counters['g2p_calls'] += 1
+
+        phonemes = self._run_g2p(key)
+        with self._lock:
+            if key not in self._lexicon:
+                self._lexicon[key] = phonemes
+                self._append(key, phonemes)
+            self._remember(key, phonemes)
+        return list(phonemes)
+
+    def precompute(self, words):
+        """
+        Add every missing word to the lexicon and rewrite the file
+
+        Returns:
+            int: Number of words that had to go through G2p
+        """
+        missing = sorted({self.normalize(w) for w in words} - set(self._lexicon))
+        for i, word in enumerate(missing, 1):
+            phonemes = self._run_g2p(word)
+            with self._lock:
+                self._lexicon[word] = phonemes
+            if i % 200 == 0:
+                print(f"  {i}/{len(missing)} words converted")
+
+        with self._lock:
+            self.lexicon_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.lexicon_path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for word in sorted(self._lexicon):
+                    f.write(json.dumps({'word': word, 'phonemes': list(self._lexicon[word])}) + "\n")
+            tmp_path.replace(self.lexicon_path)
+        return len(missing)
+
+    def stats(self):
+        """Hit/miss counters; g2p_calls stays 0 when the lexicon covers all questions"""
+        with self._lock:
+            lookups = sum(self._counters.values())
+            return {
+                **self._counters,
+                'lookups': lookups,
+                'hit_rate': round(1 - self._counters['g2p_calls'] / lookups, 4) if lookups else None,
+                'lexicon_size': len(self._lexicon),
+                'lru_size': len(self._lru),
+                'g2p_loaded': self._g2p is not None
+            }
+
+
+def main():
+    """Precompute the lexicon for the questions table and the reference vocabulary"""
+    from g2p_en import G2p
+
+    script_dir = Path(__file__).parent
+    lexicon_path = script_dir / "cache" / "phoneme_lexicon.jsonl"
+
+    words = set(question_words(load_questions(DEFAULT_SQL_PATH)))
+    words.update(reference_words(script_dir / "references"))
+
+    print("=" * 60)
+    print("PHONEME LEXICON BUILDER")
+    print("=" * 60)
+    print(f"Vocabulary: {len(words)} words")
+    print(f"Lexicon   : {lexicon_path}")
+
+    lexicon = PhonemeLexicon(lexicon_path, G2p)
+    converted = lexicon.precompute(words)
+    print(f"\n✓ {converted} new words converted, {lexicon.stats()['lexicon_size']} entries total")
+
+
+if __name__ == "__main__":
+    main()
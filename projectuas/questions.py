@@ -0,0 +1,87 @@
+"""
+Read the question vocabulary from the phpMyAdmin dump (db.sql).
+Used by the tools that precompute data for every word in the `questions` table.
+"""
+
+import re
+from pathlib import Path
+
+DEFAULT_SQL_PATH = Path(__file__).parent.parent / "db.sql"
+
+_INSERT_RE = re.compile(
+    r"INSERT INTO `questions` \([^)]*\) VALUES\s*(.*?);\s*$",
+    re.DOTALL | re.MULTILINE
+)
+_SQL_STRING = r"'((?:[^'\\]|\\.|'')*)'"
+_ROW_RE = re.compile(r"\(\s*(\d+)\s*,\s*" + _SQL_STRING + r"\s*,\s*" + _SQL_STRING + r"\s*\)")
+
+
+def _unescape(value):
+    """Undo MySQL string escaping ('' and backslash escapes)"""
+    value = value.replace("''", "'")
+    return re.sub(r"\\(.)", lambda m: {"n": "\n", "t": "\t", "0": "\0"}.get(m.group(1), m.group(1)), value)
+
+
+def load_questions(sql_path=DEFAULT_SQL_PATH):
+    """
+    Parse all rows of the `questions` table from a SQL dump
+
+    Args:
+        sql_path (str): Path to the dump (default: repository db.sql)
+
+    Returns:
+        list: [{'id': int, 'text': str, 'level': str}, ...] in dump order
+    """
+    with open(sql_path, 'r', encoding='utf-8') as f:
+        sql = f.read()
+
+    questions = []
+    for block in _INSERT_RE.findall(sql):
+        for qid, text, level in _ROW_RE.findall(block):
+            questions.append({
+                'id': int(qid),
+                'text': _unescape(text),
+                'level': _unescape(level)
+            })
+    return questions
+
+
+def load_questions_from_mysql(host="localhost", user="root", password="", database="db_vr"):
+    """
+    Read the `questions` table from the live MySQL database (defaults match
+    DatabaseModul.vb). Needs the optional pymysql package.
+
+    Returns:
+        list: [{'id': int, 'text': str, 'level': str}, ...] ordered by id
+    """
+    try:
+        import pymysql
+    except ImportError:
+        raise RuntimeError("Reading from MySQL needs pymysql (pip install pymysql); "
+                           "or use the db.sql dump instead") from None
+
+    connection = pymysql.connect(host=host, user=user, password=password, database=database, charset='utf8mb4')
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id, text, level FROM questions ORDER BY id")
+            return [{'id': int(qid), 'text': text, 'level': level} for qid, text, level in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def question_words(questions):
+    """Unique lowercase words used by a list of questions, sorted"""
+    words = set()
+    for q in questions:
+        for word in q['text'].lower().split():
+            words.add(word)
+    return sorted(words)
+
+
+def reference_words(reference_dir):
+    """Unique lowercase words covered by references/*_mfcc.json, sorted"""
+    words = set()
+    for json_file in Path(reference_dir).glob("*_mfcc.json"):
+        text = json_file.name[:-len("_mfcc.json")].replace("_", " ")
+        words.update(text.lower().split())
+    return sorted(words)
@@ -0,0 +1,275 @@
+"""
+Top-k nearest references for a clip under the /dtw distance.
+Every reference is a candidate, but full DTW only runs for the few that
+survive a cascade of lower bounds, so the result is identical to brute force:
+
+  order   candidates by distance between 52-dim stats vectors (mean/std/min/max
+          per coefficient, as WavToMFCC.get_mfcc_statistics), so good matches
+          fill the top-k early and tighten the threshold
+  LB_Kim  the path always contains the first and the last frame pair
+  LB_Keogh every frame of one clip is matched at least once, and never closer
+          than the distance to the other clip's min/max envelope (both directions)
+  row/col every row and every column of the frame distance matrix is visited,
+          so the sums of their minima bound the path cost
+  DTW     full DTW (same engine as /dtw) for the survivors
+
+Usage:
+  python reference_search.py benchmark [--synthetic 2000] [--k 5]
+"""
+
+import heapq
+import threading
+import time
+
+import numpy as np
+
+from dtw import dtw_distance, frame_distances
+
+# Lower bounds and DTW sum in different orders; never prune on rounding noise
+_EPS = 1e-9
+
+
+def stats_vector(mfcc):
+    """[mean, std, min, max] per coefficient, the layout of the *_features.csv row"""
+    mfcc = np.asarray(mfcc, dtype=np.float64)
+    return np.stack([mfcc.mean(axis=1), mfcc.std(axis=1), mfcc.min(axis=1), mfcc.max(axis=1)], axis=1).ravel()
+
+
+def _box_distance_sum(frames, lower, upper):
+    """
+    Sum over frames of the Euclidean distance from each frame to the box
+    [lower, upper]; frames (..., T, n_mfcc), lower/upper (..., 1, n_mfcc)
+    """
+    excess = frames - np.clip(frames, lower, upper)
+    return np.sqrt(np.square(excess).sum(axis=-1)).sum(axis=-1)
+
+
+class ReferenceIndex:
+    """Reference matrices with precomputed stats, envelopes and end frames"""
+
+    def __init__(self, references, history_size=1000):
+        """
+        Args:
+            references (dict): word -> (n_mfcc, frames) MFCC matrix
+        """
+        self.words = sorted(references)
+        self.mfccs = [np.asarray(references[w], dtype=np.float64) for w in self.words]
+        if not self.mfccs:
+            raise ValueError("No references to index")
+
+        self.lengths = np.array([m.shape[1] for m in self.mfccs])
+        self.first = np.stack([m[:, 0] for m in self.mfccs])
+        self.last = np.stack([m[:, -1] for m in self.mfccs])
+        stats = np.stack([stats_vector(m) for m in self.mfccs])
+        # Envelope = per-coefficient min and max (columns 2 and 3 of each group)
+        self.lower = stats.reshape(len(self.words), -1, 4)[:, :, 2]
+        self.upper = stats.reshape(len(self.words), -1, 4)[:, :, 3]
+        # Standardize so no single statistic dominates the ordering
+        self._stats_mean = stats.mean(axis=0)
+        self._stats_scale = stats.std(axis=0) + 1e-9
+        self.stats_vectors = (stats - self._stats_mean) / self._stats_scale
+
+        # Frames of all references padded into one array for the vectorized bounds
+        n_mfcc = self.mfccs[0].shape[0]
+        self._padded = np.full((len(self.words), int(self.lengths.max()), n_mfcc), np.nan)
+        for r, m in enumerate(self.mfccs):
+            self._padded[r, :m.shape[1]] = m.T
+
+        self._lock = threading.Lock()
+        self._totals = {"searches": 0, "candidates": 0, "pruned_kim": 0, "pruned_keogh": 0,
+                        "pruned_rowcol": 0, "dtw": 0}
+        self._times = []
+        self._history_size = history_size
+
+    @classmethod
+    def from_store(cls, store):
+        """Index every word of a reference_store.ReferenceStore"""
+        return cls({word: np.asarray(mfcc) for word, mfcc in store.items()})
+
+    def __len__(self):
+        return len(self.words)
+
+    def lower_bounds(self, query):
+        """
+        Cheap bounds for all references at once
+
+        Returns:
+            tuple: (lb_kim, lb_keogh) arrays, already normalized by N + M
+        """
+        q = query.T                                       # (N, n_mfcc)
+        n = q.shape[0]
+        norm = n + self.lengths
+
+        lb_kim = np.sqrt(np.square(self.first - q[0]).sum(axis=1))
+        ends = np.sqrt(np.square(self.last - q[-1]).sum(axis=1))
+        # A 1x1 problem has a single cell; otherwise (1,1) and (N,M) are distinct
+        lb_kim = np.where((n == 1) & (self.lengths == 1), lb_kim, lb_kim + ends) / norm
+
+        # Query frames against each reference's envelope
+        query_side = _box_distance_sum(q[None], self.lower[:, None], self.upper[:, None])
+        # Reference frames against the query envelope (padding contributes 0)
+        padded = np.where(np.isnan(self._padded), q.min(axis=0), self._padded)
+        ref_side = _box_distance_sum(padded, q.min(axis=0), q.max(axis=0))
+        lb_keogh = np.maximum(query_side, ref_side) / norm
+        return lb_kim, lb_keogh
+
+    def search(self, query, k=5, band=None, prune=True):
+        """
+        Args:
+            query (numpy.ndarray): (n_mfcc, N) MFCC of the clip
+            k (int): Number of nearest references to return
+            band (int, optional): Sakoe-Chiba radius passed to dtw_distance
+            prune (bool): False = brute force (every reference gets full DTW)
+
+        Returns:
+            tuple: ([(word, distance), ...] nearest first, counters dict)
+        """
+        started = time.perf_counter()
+        query = np.asarray(query, dtype=np.float64)
+        k = max(1, min(k, len(self.words)))
+        counts = {"candidates": len(self.words), "pruned_kim": 0, "pruned_keogh": 0,
+                  "pruned_rowcol": 0, "dtw": 0}
+
+        if prune:
+            lb_kim, lb_keogh = self.lower_bounds(query)
+            query_stats = (stats_vector(query) - self._stats_mean) / self._stats_scale
+            order = np.argsort(np.square(self.stats_vectors - query_stats).sum(axis=1), kind='stable')
+        else:
+            order = range(len(self.words))
+
+        # Max-heap of the best k: (-distance, -index) so ties keep the lower index
+        best = []
+        n = query.shape[1]
+        for r in order:
+            r = int(r)
+            if prune and len(best) == k:
+                threshold = -best[0][0] * (1 + _EPS) + _EPS
+                if lb_kim[r] > threshold:
+                    counts["pruned_kim"] += 1
+                    continue
+                if lb_keogh[r] > threshold:
+                    counts["pruned_keogh"] += 1
+                    continue
+                distances = frame_distances(query, self.mfccs[r])
+                norm = n + self.lengths[r]
+                lb_rowcol = max(distances.min(axis=1).sum(), distances.min(axis=0).sum()) / norm
+                if lb_rowcol > threshold:
+                    counts["pruned_rowcol"] += 1
+                    continue
+            else:
+                distances = frame_distances(query, self.mfccs[r])
+
+            counts["dtw"] += 1
+            d = dtw_distance(query, self.mfccs[r], band=band, distances=distances)
+            entry = (-d, -r)
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif entry > best[0]:
+                heapq.heapreplace(best, entry)
+
+        results = sorted(((-neg_d, -neg_r) for neg_d, neg_r in best))
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._totals["searches"] += 1
+            for key, value in counts.items():
+                self._totals[key] += value
+            self._times.append(elapsed)
+            del self._times[:-self._history_size]
+        counts["ms"] = round(elapsed * 1000.0, 3)
+        return [(self.words[r], float(d)) for d, r in results], counts
+
+    def stats(self):
+        """Cumulative pruning rates per stage and search latency"""
+        with self._lock:
+            totals = dict(self._totals)
+            times = np.array(self._times) * 1000.0
+        candidates = totals["candidates"] or 1
+        rates = {f"{key}_rate": round(totals[key] / candidates, 4)
+                 for key in ("pruned_kim", "pruned_keogh", "pruned_rowcol", "dtw")}
+        latency = None
+        if times.size:
+            p50, p95 = np.percentile(times, [50, 95])
+            latency = {"p50": round(float(p50), 3), "p95": round(float(p95), 3)}
+        return {"references": len(self.words), **totals, **rates, "latency_ms": latency}
+
+
+def _synthetic_references(references, count, seed=0):
+    """Grow a vocabulary by time-warping and perturbing the real references"""
+    rng = np.random.default_rng(seed)
+    words = sorted(references)
+    out = dict(references)
+    while len(out) < count:
+        base = references[words[rng.integers(len(words))]]
+        m = base.shape[1]
+        length = max(2, int(m * rng.uniform(0.7, 1.4)))
+        warp = np.clip(np.sort(rng.uniform(0, m - 1, size=length)), 0, m - 1).astype(int)
+        scale = rng.uniform(0.8, 1.2, size=(base.shape[0], 1))
+        out[f"synthetic_{len(out)}"] = base[:, warp] * scale + rng.normal(0, 8, size=(base.shape[0], length))
+    return out
+
+
+def benchmark(reference_dir, synthetic=0, k=5, queries=30, band=None, seed=0):
+    """Every query is searched with pruning and by brute force; results must match"""
+    from reference_store import ReferenceStore
+
+    store = ReferenceStore(reference_dir)
+    references = {w: np.asarray(m, dtype=np.float64) for w, m in store.items()}
+    store.close()
+    if synthetic > len(references):
+        references = _synthetic_references(references, synthetic, seed)
+    index = ReferenceIndex(references)
+
+    rng = np.random.default_rng(seed + 1)
+    mismatches = 0
+    pruned_ms = brute_ms = 0.0
+    totals = {"pruned_kim": 0, "pruned_keogh": 0, "pruned_rowcol": 0, "dtw": 0}
+    for q in range(queries):
+        base = index.mfccs[rng.integers(len(index))]
+        m = base.shape[1]
+        length = max(2, int(m * rng.uniform(0.8, 1.25)))
+        warp = np.clip(np.sort(rng.uniform(0, m - 1, size=length)), 0, m - 1).astype(int)
+        query = base[:, warp] + rng.normal(0, 10, size=(base.shape[0], length))
+
+        fast, counts = index.search(query, k=k, band=band)
+        slow, slow_counts = index.search(query, k=k, band=band, prune=False)
+        for key in totals:
+            totals[key] += counts[key]
+        pruned_ms += counts["ms"]
+        brute_ms += slow_counts["ms"]
+        if [w for w, _ in fast] != [w for w, _ in slow] or not np.allclose(
+                [d for _, d in fast], [d for _, d in slow], rtol=1e-12, atol=0):
+            mismatches += 1
+
+    candidates = queries * len(index)
+    print(f"References: {len(index)}  queries: {queries}  k: {k}  band: {band}")
+    print(f"Pruned by LB_Kim   : {totals['pruned_kim'] / candidates:6.1%}")
+    print(f"Pruned by LB_Keogh : {totals['pruned_keogh'] / candidates:6.1%}")
+    print(f"Pruned by row/col  : {totals['pruned_rowcol'] / candidates:6.1%}")
+    print(f"Full DTW           : {totals['dtw'] / candidates:6.1%}")
+    print(f"Mean search time   : {pruned_ms / queries:.1f} ms (brute force {brute_ms / queries:.1f} ms, "
+          f"{brute_ms / max(pruned_ms, 1e-9):.1f}x)")
+    status = "✓" if mismatches == 0 else "❌"
+    print(f"{status} Identical to brute force: {queries - mismatches}/{queries}")
+    return mismatches
+
+
+def main():
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description="Top-k reference search with lower-bound pruning")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_bench = sub.add_parser("benchmark", help="Pruning rates and speed vs brute force")
+    p_bench.add_argument("--reference-dir", default=str(Path(__file__).parent / "references"))
+    p_bench.add_argument("--synthetic", type=int, default=0,
+                         help="Grow the vocabulary to this many references with warped copies")
+    p_bench.add_argument("--k", type=int, default=5)
+    p_bench.add_argument("--queries", type=int, default=30)
+    p_bench.add_argument("--band", type=int, default=None)
+    args = parser.parse_args()
+
+    benchmark(args.reference_dir, synthetic=args.synthetic, k=args.k, queries=args.queries, band=args.band)
+
+
+if __name__ == "__main__":
+    main()
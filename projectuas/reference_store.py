@@ -0,0 +1,368 @@
+"""
+Consolidated binary store for reference MFCC matrices.
+All references live in one little-endian float32 file that is memory-mapped on
+open, next to a small JSON index (word -> offset, shape, question_id) carrying
+the MFCC parameters. Replaces one indented JSON file per word; the legacy
+<word>_mfcc.json files can still be exported for older clients.
+
+Usage:
+  python reference_store.py info
+  python reference_store.py import-json references/      # migrate JSON files
+  python reference_store.py export-json references/      # legacy JSON files
+  python reference_store.py benchmark references/        # size/load time vs JSON
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+STORE_VERSION = 1
+STORE_NAME = "reference_store"
+DTYPE = np.dtype('<f4')
+# Matrices start on 64-byte boundaries so memmapped views are aligned
+ALIGNMENT = 64
+
+
+def store_paths(directory, name=STORE_NAME):
+    """(data_path, index_path) of a store in a directory"""
+    directory = Path(directory)
+    return directory / f"{name}.bin", directory / f"{name}.json"
+
+
+class ReferenceStoreWriter:
+    """Builds a store in temporary files and swaps it in atomically on close()"""
+
+    def __init__(self, directory, params, name=STORE_NAME):
+        """
+        Args:
+            directory (str): Directory for <name>.bin and <name>.json
+            params (dict): MFCC parameters (n_mfcc, sr, n_fft, hop_length)
+        """
+        self.data_path, self.index_path = store_paths(directory, name)
+        self.data_path.parent.mkdir(parents=True, exist_ok=True)
+        self.params = params
+        self.entries = {}
+        self._tmp_data = self.data_path.with_name(self.data_path.name + '.tmp')
+        self._file = open(self._tmp_data, 'wb')
+        self._offset = 0
+
+    def add(self, word, mfcc, question_id=0):
+        """
+        Args:
+            word (str): Reference word (stored lowercase)
+            mfcc (numpy.ndarray): (n_mfcc, frames) matrix
+            question_id (int): Question id from the database (0 if unknown)
+        """
+        matrix = np.ascontiguousarray(mfcc, dtype=DTYPE)
+        self._align()
+        self._file.write(matrix.tobytes())
+        self._record(word, question_id, matrix.shape, matrix.nbytes)
+
+    def add_frames(self, word, frames, question_id=0):
+        """
+        add() for a streamed recording, copied from its spill files row by row
+
+        Args:
+            frames (feature_extractor.SpillFrameWriter): MFCC frames of the word
+        """
+        self._align()
+        nbytes = frames.copy_rows('mfcc', self._file)
+        self._record(word, question_id, (frames.rows, frames.frames), nbytes)
+
+    def _align(self):
+        padding = -self._offset % ALIGNMENT
+        if padding:
+            self._file.write(b'\0' * padding)
+            self._offset += padding
+
+    def _record(self, word, question_id, shape, nbytes):
+        self.entries[word.lower()] = {
+            "question_id": int(question_id),
+            "offset": self._offset,
+            "shape": [int(n) for n in shape],
+        }
+        self._offset += nbytes
+
+    def close(self):
+        """Write the index and replace any previous store"""
+        self._file.close()
+        index = {
+            "version": STORE_VERSION,
+            "dtype": DTYPE.str,
+            "params": self.params,
+            "entries": {word: self.entries[word] for word in sorted(self.entries)},
+        }
+        tmp_index = self.index_path.with_name(self.index_path.name + '.tmp')
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=1)
+        os.replace(self._tmp_data, self.data_path)
+        os.replace(tmp_index, self.index_path)
+
+    def abort(self):
+        self._file.close()
+        if self._tmp_data.exists():
+            self._tmp_data.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ReferenceStore:
+    """Read-only, memory-mapped view of a reference store"""
+
+    def __init__(self, directory, name=STORE_NAME):
+        """
+        Args:
+            directory (str): Directory containing <name>.bin and <name>.json
+        """
+        self.data_path, self.index_path = store_paths(directory, name)
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported reference store version: {index.get('version')}")
+
+        self.params = index["params"]
+        self.entries = index["entries"]
+        self.dtype = np.dtype(index["dtype"])
+        self._by_question_id = {}
+        for word, entry in self.entries.items():
+            if entry["question_id"]:
+                self._by_question_id.setdefault(entry["question_id"], word)
+
+        size = self.data_path.stat().st_size
+        self._data = np.memmap(self.data_path, dtype=np.uint8, mode='r') if size else np.zeros(0, np.uint8)
+
+    @classmethod
+    def open_if_exists(cls, directory, name=STORE_NAME):
+        """The store in a directory, or None if there is none"""
+        data_path, index_path = store_paths(directory, name)
+        if not (data_path.exists() and index_path.exists()):
+            return None
+        return cls(directory, name)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, word):
+        return word.lower() in self.entries
+
+    def words(self):
+        return list(self.entries)
+
+    def get(self, word):
+        """
+        Args:
+            word (str): Reference word (case-insensitive)
+
+        Returns:
+            numpy.ndarray: (n_mfcc, frames) float32 view into the mapped file (read-only)
+        """
+        entry = self.entries.get(word.lower())
+        if entry is None:
+            raise KeyError(f"No reference for '{word}'")
+        shape = tuple(entry["shape"])
+        nbytes = int(np.prod(shape)) * self.dtype.itemsize
+        start = entry["offset"]
+        return self._data[start:start + nbytes].view(self.dtype).reshape(shape)
+
+    def get_by_question_id(self, question_id):
+        word = self._by_question_id.get(int(question_id))
+        if word is None:
+            raise KeyError(f"No reference for question_id {question_id}")
+        return self.get(word)
+
+    def items(self):
+        for word in self.entries:
+            yield word, self.get(word)
+
+    def export_json(self, output_dir):
+        """
+        Write the legacy <word>_mfcc.json files (same layout as
+        ReferenceGenerator.save_mfcc_as_json) for clients that still read them
+
+        Returns:
+            list: Paths written
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+        for word, mfcc in self.items():
+            path = output_dir / f"{word}_mfcc.json"
+            with open(path, 'w') as f:
+                json.dump({
+                    "question_id": self.entries[word]["question_id"],
+                    "text": word,
+                    "mfcc": mfcc.tolist(),
+                    "sample_rate": self.params.get("sr"),
+                    "n_mfcc": self.params.get("n_mfcc"),
+                    "shape": list(mfcc.shape)
+                }, f, indent=2)
+            written.append(path)
+        return written
+
+    def close(self):
+        # Drop the mapping so the files can be replaced (required on Windows)
+        self._data = None
+
+
+# The JSON files carry n_mfcc and sample_rate only; these are the frame settings
+# every generator in this folder uses
+JSON_FRAME_PARAMS = {"n_fft": 2048, "hop_length": 512}
+
+
+def import_json_dir(json_dir, store_dir, name=STORE_NAME, question_ids=None, frame_params=None):
+    """
+    Build a store from an existing directory of <word>_mfcc.json files
+
+    Args:
+        question_ids (dict, optional): Lowercase word -> question id, for JSON files
+                                       that still have question_id 0
+        frame_params (dict, optional): n_fft and hop_length the JSON files were made
+                                       with (default: JSON_FRAME_PARAMS)
+
+    Returns:
+        int: Number of references imported
+    """
+    files = sorted(Path(json_dir).glob("*_mfcc.json"))
+    params = None
+    with ReferenceStoreWriter(store_dir, {}, name) as writer:
+        for path in files:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if params is None:
+                params = {"n_mfcc": data.get("n_mfcc"), "sr": data.get("sample_rate"),
+                          **(frame_params or JSON_FRAME_PARAMS)}
+            word = data.get("text") or path.name[:-len("_mfcc.json")]
+            question_id = data.get("question_id") or (question_ids or {}).get(word.lower(), 0)
+            writer.add(word, np.array(data["mfcc"]), question_id)
+        writer.params = params or {}
+    return len(files)
+
+
+def dir_size(paths):
+    return sum(Path(p).stat().st_size for p in paths)
+
+
+def benchmark(json_dir, repeats=5):
+    """
+    Compare the JSON directory with an equivalent store: bytes on disk, time to
+    load every reference (including opening the store), and time to load one
+    reference (JSON parse vs. a lookup in an already open store)
+    """
+    json_files = sorted(Path(json_dir).glob("*_mfcc.json"))
+    if not json_files:
+        print(f"❌ No *_mfcc.json files in {json_dir}")
+        return None
+
+    tmp_dir = tempfile.mkdtemp(prefix="reference_store_bench_")
+    try:
+        import_json_dir(json_dir, tmp_dir)
+        data_path, index_path = store_paths(tmp_dir)
+        word = ReferenceStore(tmp_dir).words()[0]
+        single_json = Path(json_dir) / f"{word}_mfcc.json"
+
+        def load_all_json():
+            for path in json_files:
+                with open(path, 'r') as f:
+                    np.array(json.load(f)["mfcc"], dtype=np.float64)
+
+        def load_all_store():
+            store = ReferenceStore(tmp_dir)
+            for _, mfcc in store.items():
+                np.array(mfcc, dtype=np.float64)
+            store.close()
+
+        def load_one_json():
+            with open(single_json, 'r') as f:
+                np.array(json.load(f)["mfcc"], dtype=np.float64)
+
+        open_store = ReferenceStore(tmp_dir)
+
+        def load_one_store():
+            np.array(open_store.get(word), dtype=np.float64)
+
+        def best_of(fn):
+            times = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - started)
+            return min(times) * 1000.0
+
+        rows = [
+            ("Size on disk (KB)", dir_size(json_files) / 1024.0, dir_size([data_path, index_path]) / 1024.0),
+            ("Files", len(json_files), 2),
+            ("Load all (ms)", best_of(load_all_json), best_of(load_all_store)),
+            ("Load one word (ms)", best_of(load_one_json), best_of(load_one_store)),
+        ]
+        open_store.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"References: {len(json_files)}")
+    print(f"{'':<20} {'JSON dir':>12} {'Store':>12} {'Ratio':>8}")
+    for label, legacy, store in rows:
+        ratio = legacy / store if store else 0.0
+        print(f"{label:<20} {legacy:>12.2f} {store:>12.2f} {ratio:>7.1f}x")
+    return rows
+
+
+def main():
+    import argparse
+
+    default_dir = Path(__file__).parent / "references"
+    parser = argparse.ArgumentParser(description="Binary reference MFCC store")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_info = sub.add_parser("info", help="List the references in a store")
+    p_info.add_argument("store_dir", nargs="?", default=str(default_dir))
+
+    p_import = sub.add_parser("import-json", help="Build the store from <word>_mfcc.json files")
+    p_import.add_argument("json_dir", nargs="?", default=str(default_dir))
+    p_import.add_argument("--store-dir", default=None, help="Default: same as json_dir")
+
+    p_export = sub.add_parser("export-json", help="Write legacy <word>_mfcc.json files")
+    p_export.add_argument("output_dir", nargs="?", default=str(default_dir))
+    p_export.add_argument("--store-dir", default=str(default_dir))
+
+    p_bench = sub.add_parser("benchmark", help="Size and load time vs the JSON directory")
+    p_bench.add_argument("json_dir", nargs="?", default=str(default_dir))
+
+    args = parser.parse_args()
+
+    if args.command == "info":
+        store = ReferenceStore(args.store_dir)
+        print(f"Store : {store.data_path} ({store.data_path.stat().st_size / 1024:.1f} KB)")
+        print(f"Params: {store.params}")
+        for word, entry in store.entries.items():
+            print(f"  {word:<20} shape={tuple(entry['shape'])} question_id={entry['question_id']}")
+    elif args.command == "import-json":
+        question_ids = {}
+        try:
+            from questions import load_questions
+            for q in load_questions():
+                question_ids.setdefault(q['text'].strip().lower(), q['id'])
+        except OSError:
+            print("db.sql not found; question_id is taken from the JSON files")
+        count = import_json_dir(args.json_dir, args.store_dir or args.json_dir, question_ids=question_ids)
+        print(f"✓ Imported {count} references into {store_paths(args.store_dir or args.json_dir)[0]}")
+    elif args.command == "export-json":
+        written = ReferenceStore(args.store_dir).export_json(args.output_dir)
+        print(f"✓ Exported {len(written)} JSON files to {args.output_dir}")
+    elif args.command == "benchmark":
+        benchmark(args.json_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Pre-fork production server for the scoring API.
+The parent loads the model once, then forks N workers that share the weights
+copy-on-write and accept connections on one listening socket. Each worker gets
+its own torch thread count and, optionally, its own set of CPU cores.
+
+Usage:
+  python serve.py --workers 4 --threads-per-worker 2 [--pin-cpus] [--port 5000]
+
+(Linux/macOS only; on Windows run `python api_server.py`.)
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+
+def worker_cpus(index, threads_per_worker):
+    """Cores for one worker: consecutive blocks, wrapping around the machine"""
+    available = sorted(os.sched_getaffinity(0))
+    start = (index * threads_per_worker) % len(available)
+    return {available[(start + i) % len(available)] for i in range(threads_per_worker)}
+
+
+def run_worker(index, listen_fd, host, port, threads_per_worker, pin_cpus):
+    """Body of a forked worker process; never returns"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    if pin_cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, worker_cpus(index, threads_per_worker))
+
+    import torch
+    torch.set_num_threads(threads_per_worker)
+
+    from werkzeug.serving import make_server
+    import api_server
+
+    resources = api_server.resources
+    resources.intra_op_threads = threads_per_worker
+    # Thread pools (torch intra-op, ONNX Runtime, batcher) are created here,
+    # after the fork, so each worker starts its own
+    resources.ready.clear()
+    resources.warm_up()
+
+    server = make_server(host, port, api_server.app, threaded=True, fd=listen_fd)
+    print(f"[worker {index}] pid {os.getpid()} serving with {threads_per_worker} torch threads")
+    server.serve_forever()
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork server for api_server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", "2")))
+    parser.add_argument("--threads-per-worker", type=int,
+                        default=int(os.environ.get("THREADS_PER_WORKER", "2")))
+    parser.add_argument("--pin-cpus", action="store_true", help="Pin each worker to its own cores")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        print("❌ Pre-fork serving needs os.fork; use `python api_server.py` on this platform.")
+        sys.exit(1)
+
+    # Keep the parent single-threaded so forking is safe
+    os.environ["WARMUP_ON_START"] = "0"
+    import api_server
+
+    print("=" * 60)
+    print("PRE-FORK API SERVER")
+    print("=" * 60)
+    print(f"Workers           : {args.workers}")
+    print(f"Threads per worker: {args.threads_per_worker}")
+    print(f"CPU pinning       : {'on' if args.pin_cpus else 'off'}")
+    print("=" * 60)
+
+    # ONNX Runtime sessions own thread pools that do not survive a fork,
+    # so those backends are loaded inside each worker instead
+    load_model = not api_server.INFERENCE_BACKEND.startswith("onnx")
+    api_server.resources.warm_up(load_model=load_model, run_inference=False)
+
+    # Move everything allocated so far out of the GC's reach so collections in
+    # the workers do not touch (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(128)
+    listener.set_inheritable(True)
+
+    children = {}
+    shutting_down = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(index, listener.fileno(), args.host, args.port,
+                           args.threads_per_worker, args.pin_cpus)
+            finally:
+                os._exit(1)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for i in range(args.workers):
+        spawn(i)
+    print(f"Listening on http://{args.host}:{args.port}")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is None or shutting_down:
+            continue
+        print(f"[master] worker {index} (pid {pid}) exited with status {status}, restarting")
+        time.sleep(1)
+        spawn(index)
+
+    listener.close()
+    print("[master] all workers stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Lazily initialized resources for api_server.
+Importing api_server no longer downloads NLTK data or loads the model: the
+processor, inference backend, batcher, phoneme lexicon, G2P and TTS cache are
+created on first use or by an explicit warm_up(). Everything is resolved from
+local caches (Hugging Face hub cache, cache/nltk_data); fetch them once with:
+
+  python server_resources.py download
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Importing g2p_en downloads the tagger and cmudict if nltk cannot find them,
+# so all of these must be present locally before G2p is imported.
+NLTK_RESOURCES = {
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+    "averaged_perceptron_tagger_eng": "taggers/averaged_perceptron_tagger_eng",
+    "cmudict": "corpora/cmudict",
+}
+
+
+class ServerResources:
+    """Model, processor, G2P and caches, created once and shared by all requests"""
+
+    def __init__(self, model_id, backend_name, sampling_rate, batch_max_size, batch_max_wait_ms,
+                 lexicon_path, tts_cache_dir, tts_cache_max_bytes, nltk_data_dir,
+                 offline=True, device=None, process_start=None, intra_op_threads=None,
+                 reference_dir=None, audio_cache_dir=None, audio_cache_max_bytes=0,
+                 batch_max_padding=0.05):
+        self.model_id = model_id
+        self.backend_name = backend_name
+        self.sampling_rate = sampling_rate
+        self.batch_max_size = batch_max_size
+        self.batch_max_wait_ms = batch_max_wait_ms
+        self.batch_max_padding = batch_max_padding
+        self.lexicon_path = Path(lexicon_path)
+        self.tts_cache_dir = Path(tts_cache_dir)
+        self.tts_cache_max_bytes = tts_cache_max_bytes
+        self.nltk_data_dir = Path(nltk_data_dir)
+        self.offline = offline
+        self.device = device
+        self.intra_op_threads = intra_op_threads
+        self.reference_dir = Path(reference_dir) if reference_dir else None
+        self.audio_cache_dir = Path(audio_cache_dir) if audio_cache_dir else None
+        self.audio_cache_max_bytes = audio_cache_max_bytes
+
+        self._lock = threading.RLock()
+        self._processor = None
+        self._backend = None
+        self._batcher = None
+        self._lexicon = None
+        self._tts_cache = None
+        self._aligner = None
+        self._reference_store = None
+        self._reference_index = None
+        self._feature_extractor = None
+        self._audio_cache = None
+
+        self.process_start = process_start if process_start is not None else time.perf_counter()
+        self.timings = {}
+        self.ready = threading.Event()
+        self.warmup_error = None
+        self._first_request_logged = False
+
+    def _timed(self, name, fn):
+        started = time.perf_counter()
+        result = fn()
+        self.timings[f"{name}_s"] = round(time.perf_counter() - started, 3)
+        return result
+
+    def _use_offline_hub(self):
+        if self.offline:
+            # Must be set before huggingface_hub is imported
+            os.environ.setdefault("HF_HUB_OFFLINE", "1")
+            os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+    @property
+    def processor(self):
+        if self._processor is None:
+            with self._lock:
+                if self._processor is None:
+                    self._use_offline_hub()
+                    from transformers import Wav2Vec2Processor
+                    self._processor = self._timed("processor", lambda: Wav2Vec2Processor.from_pretrained(
+                        self.model_id, local_files_only=self.offline
+                    ))
+        return self._processor
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._use_offline_hub()
+                    from inference_backend import load_backend
+                    device = self.device or self._default_device()
+                    print(f"Loading Wav2Vec2 model ({self.backend_name}) on {device}...")
+                    self._backend = self._timed("model", lambda: load_backend(
+                        self.backend_name, self.model_id, device,
+                        num_threads=self.intra_op_threads, local_files_only=self.offline
+                    ))
+        return self._backend
+
+    @staticmethod
+    def _default_device():
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+
+    @property
+    def batcher(self):
+        if self._batcher is None:
+            with self._lock:
+                if self._batcher is None:
+                    from inference_batcher import InferenceBatcher
+                    self._batcher = InferenceBatcher(
+                        self.processor, self.backend,
+                        sampling_rate=self.sampling_rate,
+                        max_batch_size=self.batch_max_size,
+                        max_wait_ms=self.batch_max_wait_ms,
+                        max_padding=self.batch_max_padding
+                    )
+        return self._batcher
+
+    @property
+    def aligner(self):
+        if self._aligner is None:
+            with self._lock:
+                if self._aligner is None:
+                    from ctc_alignment import CTCAligner
+                    tokenizer = self.processor.tokenizer
+                    frame_stride = int(np.prod(self.backend.config.conv_stride))
+                    self._aligner = CTCAligner(
+                        tokenizer.get_vocab(),
+                        blank_id=tokenizer.pad_token_id,
+                        word_delimiter=tokenizer.word_delimiter_token,
+                        frame_duration=frame_stride / self.sampling_rate
+                    )
+        return self._aligner
+
+    @property
+    def lexicon(self):
+        if self._lexicon is None:
+            with self._lock:
+                if self._lexicon is None:
+                    from phoneme_lexicon import PhonemeLexicon
+                    self._lexicon = self._timed(
+                        "lexicon", lambda: PhonemeLexicon(self.lexicon_path, self.make_g2p)
+                    )
+        return self._lexicon
+
+    @property
+    def tts_cache(self):
+        if self._tts_cache is None:
+            with self._lock:
+                if self._tts_cache is None:
+                    from tts_cache import TTSCache
+                    self._tts_cache = TTSCache(self.tts_cache_dir, max_bytes=self.tts_cache_max_bytes)
+        return self._tts_cache
+
+    @property
+    def audio_cache(self):
+        """Decoded-upload cache, or None when disabled (no directory or a 0 size limit)"""
+        if self._audio_cache is None and self.audio_cache_dir and self.audio_cache_max_bytes > 0:
+            with self._lock:
+                if self._audio_cache is None:
+                    from audio_cache import AudioCache
+                    self._audio_cache = AudioCache(self.audio_cache_dir, max_bytes=self.audio_cache_max_bytes)
+        return self._audio_cache
+
+    @property
+    def reference_store(self):
+        if self._reference_store is None:
+            with self._lock:
+                if self._reference_store is None:
+                    from reference_store import ReferenceStore
+                    if self.reference_dir is None:
+                        raise RuntimeError("No reference directory configured")
+                    store = ReferenceStore.open_if_exists(self.reference_dir)
+                    if store is None:
+                        raise RuntimeError(
+                            f"No reference store in {self.reference_dir}. "
+                            "Run `python generate_references.py` first."
+                        )
+                    self._reference_store = store
+        return self._reference_store
+
+    @property
+    def reference_index(self):
+        """Top-k search index over every word of the reference store"""
+        if self._reference_index is None:
+            with self._lock:
+                if self._reference_index is None:
+                    from reference_search import ReferenceIndex
+                    self._reference_index = self._timed(
+                        "reference_index", lambda: ReferenceIndex.from_store(self.reference_store)
+                    )
+        return self._reference_index
+
+    @property
+    def feature_extractor(self):
+        """MFCC extractor with the parameters the references were generated with"""
+        if self._feature_extractor is None:
+            with self._lock:
+                if self._feature_extractor is None:
+                    from feature_extractor import FeatureExtractor
+                    params = self.reference_store.params
+                    missing = [k for k in ("n_mfcc", "n_fft", "hop_length", "sr") if k not in params]
+                    if missing:
+                        print(f"Warning: reference store has no {', '.join(missing)}; assuming the defaults. "
+                              "Rebuild it with `python generate_references.py --force`.")
+                    self._feature_extractor = FeatureExtractor(
+                        n_mfcc=params.get("n_mfcc", 13),
+                        n_fft=params.get("n_fft", 2048),
+                        hop_length=params.get("hop_length", 512),
+                        sr=params.get("sr", 22050)
+                    )
+        return self._feature_extractor
+
+    def make_g2p(self):
+        """G2p factory for the lexicon; only called for words missing from it"""
+        import nltk
+
+        if str(self.nltk_data_dir) not in nltk.data.path:
+            nltk.data.path.insert(0, str(self.nltk_data_dir))
+        missing = []
+        for name, resource in NLTK_RESOURCES.items():
+            try:
+                nltk.data.find(resource)
+            except LookupError:
+                missing.append(name)
+        if missing:
+            raise RuntimeError(
+                f"NLTK data missing ({', '.join(missing)}). "
+                "Run `python server_resources.py download` once."
+            )
+
+        from g2p_en import G2p
+        return self._timed("g2p", G2p)
+
+    def warm_up(self, load_g2p=False, load_model=True, run_inference=True):
+        """
+        Load everything and run one dummy inference so the first request is fast
+
+        Args:
+            load_g2p (bool): Also construct G2p (only needed when the lexicon is incomplete)
+            load_model (bool): Load processor and backend
+            run_inference (bool): Run the dummy inference (starts the batcher thread)
+        """
+        started = time.perf_counter()
+        try:
+            self.lexicon
+            self.tts_cache
+            if load_g2p:
+                self.lexicon.lookup("warmup")
+            if load_model:
+                self.batcher
+                self.aligner
+            if run_inference:
+                silence = np.zeros(self.sampling_rate, dtype=np.float32)
+                self._timed("first_inference", lambda: self.batcher.infer(silence))
+            self.timings["warmup_s"] = round(time.perf_counter() - started, 3)
+            self.timings["cold_start_to_ready_s"] = round(time.perf_counter() - self.process_start, 3)
+            print(f"Warm-up done in {self.timings['warmup_s']:.2f}s "
+                  f"({self.timings['cold_start_to_ready_s']:.2f}s since start)")
+        except Exception as e:
+            self.warmup_error = str(e)
+            print(f"Warm-up failed: {e}")
+            raise
+        finally:
+            self.ready.set()
+
+    def warm_up_in_background(self, **kwargs):
+        def run():
+            try:
+                self.warm_up(**kwargs)
+            except Exception:
+                pass
+        thread = threading.Thread(target=run, name="warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def mark_request_served(self):
+        """Record cold-start time to the first served request"""
+        if self._first_request_logged:
+            return
+        with self._lock:
+            if not self._first_request_logged:
+                self._first_request_logged = True
+                self.timings["cold_start_to_first_request_s"] = round(
+                    time.perf_counter() - self.process_start, 3
+                )
+
+    def batcher_stats(self):
+        """Batcher stats without forcing the model to load"""
+        if self._batcher is None:
+            return {"loaded": False}
+        return self._batcher.stats()
+
+    def status(self):
+        loaded = {
+            "processor": self._processor is not None,
+            "model": self._backend is not None,
+            "lexicon": self._lexicon is not None,
+            "g2p": self._lexicon is not None and self._lexicon.stats()["g2p_loaded"],
+            "tts_cache": self._tts_cache is not None,
+        }
+        return {
+            "ready": self.ready.is_set() and self.warmup_error is None,
+            "warmup_error": self.warmup_error,
+            "backend": self.backend_name,
+            "loaded": loaded,
+            "timings": dict(self.timings),
+        }
+
+
+def download(model_id, nltk_data_dir):
+    """Fetch the model and NLTK data into the local caches (needs network)"""
+    import nltk
+    from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
+
+    print(f"Downloading {model_id} into the Hugging Face cache...")
+    Wav2Vec2Processor.from_pretrained(model_id)
+    Wav2Vec2ForCTC.from_pretrained(model_id)
+
+    Path(nltk_data_dir).mkdir(parents=True, exist_ok=True)
+    for name in NLTK_RESOURCES:
+        print(f"Downloading NLTK '{name}' into {nltk_data_dir}...")
+        nltk.download(name, download_dir=str(nltk_data_dir))
+    print("✓ Offline resources ready")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="API server resource tools")
+    parser.add_argument("command", choices=["download"])
+    parser.add_argument("--model-id", default="facebook/wav2vec2-base-960h")
+    parser.add_argument("--nltk-data", default=str(Path(__file__).parent / "cache" / "nltk_data"))
+    args = parser.parse_args()
+    download(args.model_id, args.nltk_data)
+
+
+if __name__ == "__main__":
+    main()
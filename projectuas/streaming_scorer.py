@@ -0,0 +1,192 @@
+"""
+Incremental Wav2Vec2 inference for streaming pronunciation scoring.
+PCM chunks are appended while the child is still speaking; every `step`
+seconds the model runs on a window that overlaps the already committed
+frames (left context) and holds back the newest frames (right context) until
+more audio arrives. At end-of-speech only the tail window is left to run, so
+final scores follow within a single short forward pass.
+"""
+
+import threading
+import time
+import uuid
+
+import numpy as np
+
+
+class StreamingSession:
+    """Audio buffer plus committed CTC logits for one utterance"""
+
+    def __init__(self, target_text, infer, decode, frame_stride=320, sampling_rate=16000,
+                 input_rate=16000, left_context_s=1.0, right_context_s=0.5, step_s=0.5,
+                 max_duration_s=30.0):
+        """
+        Args:
+            target_text (str): Text the child is expected to say
+            infer (callable): speech -> logits (frames, vocab), e.g. InferenceBatcher.infer
+            decode (callable): predicted ids -> transcription
+            frame_stride (int): Samples per logit frame (product of the conv strides)
+            sampling_rate (int): Model sample rate
+            input_rate (int): Sample rate of the PCM the client sends
+            left_context_s (float): Audio re-run before the first uncommitted frame
+            right_context_s (float): Newest audio whose frames stay provisional
+            step_s (float): New audio needed before the next incremental pass
+            max_duration_s (float): Longest utterance accepted
+        """
+        self.session_id = uuid.uuid4().hex
+        self.target_text = target_text
+        self.infer = infer
+        self.decode = decode
+        self.frame_stride = frame_stride
+        self.sampling_rate = sampling_rate
+        self.left_context_frames = int(left_context_s * sampling_rate) // frame_stride
+        self.right_context_frames = int(right_context_s * sampling_rate) // frame_stride
+        self.step_samples = int(step_s * sampling_rate)
+
+        self._resampler = None
+        if input_rate != sampling_rate:
+            import soxr
+            self._resampler = soxr.ResampleStream(input_rate, sampling_rate, 1, dtype='float32')
+
+        self._audio = np.zeros(int(max_duration_s * sampling_rate), dtype=np.float32)
+        self._n_samples = 0
+        self._processed_samples = 0
+        self._pending_byte = b''
+        self._committed = []
+        self._committed_frames = 0
+        self._provisional = None
+        self._finished = False
+
+        self.lock = threading.Lock()
+        self.last_active = time.monotonic()
+        self.inference_passes = 0
+
+    @property
+    def duration(self):
+        return self._n_samples / self.sampling_rate
+
+    def feed(self, pcm_bytes):
+        """
+        Append 16-bit little-endian mono PCM and run inference if a step is due
+
+        Returns:
+            dict: Partial transcription and progress
+        """
+        if self._finished:
+            raise RuntimeError("Stream already finished")
+        self.last_active = time.monotonic()
+
+        data = self._pending_byte + pcm_bytes
+        usable = len(data) - len(data) % 2
+        self._pending_byte = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32) / 32768.0
+        if self._resampler is not None:
+            samples = self._resampler.resample_chunk(samples)
+        self._append(samples)
+
+        if self._n_samples - self._processed_samples >= self.step_samples:
+            self._advance(final=False)
+        return self.partial()
+
+    def _append(self, samples):
+        free = len(self._audio) - self._n_samples
+        if len(samples) > free:
+            raise ValueError(f"Utterance exceeds {len(self._audio) / self.sampling_rate:.0f} seconds")
+        self._audio[self._n_samples:self._n_samples + len(samples)] = samples
+        self._n_samples += len(samples)
+
+    def _advance(self, final):
+        """Run the model on [committed - left context, end) and commit settled frames"""
+        start_frame = max(0, self._committed_frames - self.left_context_frames)
+        window = self._audio[start_frame * self.frame_stride:self._n_samples]
+        self._processed_samples = self._n_samples
+        if len(window) < self.frame_stride * 2:
+            # Too short for the conv encoder to emit a frame
+            return
+
+        logits = self.infer(window)
+        self.inference_passes += 1
+        total_frames = start_frame + len(logits)
+        if final:
+            commit_until = total_frames
+        else:
+            commit_until = max(self._committed_frames, total_frames - self.right_context_frames)
+
+        begin = self._committed_frames - start_frame
+        if commit_until > self._committed_frames:
+            self._committed.append(logits[begin:commit_until - start_frame])
+            self._committed_frames = commit_until
+        self._provisional = logits[commit_until - start_frame:]
+
+    def _logits(self, include_provisional=True):
+        parts = list(self._committed)
+        if include_provisional and self._provisional is not None and len(self._provisional):
+            parts.append(self._provisional)
+        if not parts:
+            return None
+        return np.concatenate(parts, axis=0)
+
+    def partial(self):
+        logits = self._logits()
+        transcription = self.decode(np.argmax(logits, axis=-1)).upper() if logits is not None else ""
+        return {
+            "session_id": self.session_id,
+            "partial_transcription": transcription,
+            "committed_frames": self._committed_frames,
+            "audio_seconds": round(self.duration, 2)
+        }
+
+    def finish(self):
+        """
+        Flush remaining audio through the model
+
+        Returns:
+            numpy.ndarray: Logits for the whole utterance, shape (frames, vocab)
+        """
+        if self._resampler is not None:
+            self._append(self._resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+        self._finished = True
+        if self._n_samples > self._processed_samples or self._provisional is None:
+            self._advance(final=True)
+        elif self._provisional is not None and len(self._provisional):
+            # No new audio since the last pass: its provisional frames are final
+            self._committed.append(self._provisional)
+            self._committed_frames += len(self._provisional)
+            self._provisional = None
+
+        logits = self._logits(include_provisional=False)
+        if logits is None:
+            raise ValueError("Not enough audio received to score")
+        return logits
+
+
+class StreamingSessions:
+    """Thread-safe registry of open streams with idle expiry"""
+
+    def __init__(self, idle_timeout_s=60.0, max_sessions=256):
+        self.idle_timeout_s = idle_timeout_s
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = time.monotonic()
+        for sid in [s for s, sess in self._sessions.items() if now - sess.last_active > self.idle_timeout_s]:
+            del self._sessions[sid]
+
+    def add(self, session):
+        with self._lock:
+            self._expire()
+            if len(self._sessions) >= self.max_sessions:
+                raise RuntimeError("Too many open streams")
+            self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire()
+            return self._sessions.get(session_id)
+
+    def pop(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
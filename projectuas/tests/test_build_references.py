@@ -0,0 +1,57 @@
+import numpy as np
+
+from build_references import json_path_for, merge_into_store
+from generate_references import ReferenceGenerator
+from reference_store import ReferenceStore, ReferenceStoreWriter
+
+
+def write_json(generator, json_dir, word, frames, question_id=0, seed=0):
+    mfcc = np.random.default_rng(seed).normal(size=(generator.n_mfcc, frames)).astype(np.float32)
+    generator.save_mfcc_as_json(mfcc, json_path_for(json_dir, word), question_id, word)
+    return mfcc
+
+
+def test_done_words_are_merged_and_other_entries_kept(tmp_path):
+    generator = ReferenceGenerator()
+    with ReferenceStoreWriter(tmp_path, generator.params()) as writer:
+        writer.add("cup", np.zeros((13, 4)), 1)
+        writer.add("spoon", np.ones((13, 6)), 2)
+
+    cup = write_json(generator, tmp_path, "cup", 9, question_id=1)
+    ice_cream = write_json(generator, tmp_path, "ice cream", 5, seed=1)
+    report = merge_into_store(tmp_path, tmp_path, ["cup", "ice cream", "missing"], {"ice cream": 7})
+
+    assert (report['merged'], report['kept'], report['dropped']) == (2, 1, 0)
+    assert [e['word'] for e in report['errors']] == ["missing"]
+    store = ReferenceStore(tmp_path)
+    assert store.params == generator.params()
+    assert sorted(store.words()) == ["cup", "ice cream", "spoon"]
+    np.testing.assert_array_equal(store.get("cup"), cup)
+    np.testing.assert_array_equal(store.get("ice cream"), ice_cream)
+    np.testing.assert_array_equal(store.get("spoon"), np.ones((13, 6)))
+    assert store.entries["ice cream"]["question_id"] == 7
+    store.close()
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_entries_with_other_params_are_dropped(tmp_path):
+    generator = ReferenceGenerator()
+    with ReferenceStoreWriter(tmp_path, dict(generator.params(), hop_length=256)) as writer:
+        writer.add("spoon", np.ones((13, 6)), 2)
+    write_json(generator, tmp_path, "cup", 9)
+
+    report = merge_into_store(tmp_path, tmp_path, ["cup"], {})
+    assert (report['merged'], report['kept'], report['dropped']) == (1, 0, 1)
+    store = ReferenceStore(tmp_path)
+    assert store.words() == ["cup"]
+    store.close()
+
+
+def test_nothing_done_leaves_the_store_alone(tmp_path):
+    with ReferenceStoreWriter(tmp_path, ReferenceGenerator().params()) as writer:
+        writer.add("spoon", np.ones((13, 6)), 2)
+    before = (tmp_path / "reference_store.bin").read_bytes()
+
+    report = merge_into_store(tmp_path, tmp_path, [], {})
+    assert report['merged'] == 0
+    assert (tmp_path / "reference_store.bin").read_bytes() == before
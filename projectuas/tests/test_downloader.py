@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from downloader import Downloader, _start_stand_in_server, _stand_in_body
+
+
+@pytest.fixture
+def server():
+    server, base_url, stats = _start_stand_in_server(latency=0.0, flaky_every=5)
+    yield base_url, stats
+    server.shutdown()
+    server.server_close()
+
+
+def fast_downloader(**kwargs):
+    return Downloader(**dict(dict(workers=4, rate=1000, burst=1000, backoff=0.01), **kwargs))
+
+
+def test_pool_retries_flaky_paths_and_keeps_connections(server, tmp_path):
+    base_url, stats = server
+    urls = [f"{base_url}/audio/word{i}.mp3" for i in range(1, 13)]
+    downloader = fast_downloader()
+    results = dict(downloader.download_many((url, url, tmp_path / url.rsplit('/', 1)[-1]) for url in urls))
+    for url in urls:
+        assert results[url]['status'] == 'downloaded'
+        assert results[url]['path'].read_bytes() == _stand_in_body(url.rsplit('/', 1)[-1])
+    # word5 and word10 answer 503 once
+    assert downloader.stats()['retries'] == 2
+    assert results[f"{base_url}/audio/word5.mp3"]['attempts'] == 2
+    assert stats['connections'] <= 4
+    assert not list(tmp_path.glob("*.part*"))
+
+
+def test_404_fails_without_retry(server, tmp_path):
+    base_url, _ = server
+    result = fast_downloader().download(f"{base_url}/missing/none.mp3", tmp_path / "none.mp3")
+    assert result['status'] == 'error'
+    assert result['attempts'] == 1
+    assert not (tmp_path / "none.mp3").exists()
+
+
+def test_truncated_download_is_resumed(server, tmp_path):
+    base_url, stats = server
+    path = tmp_path / "cut.mp3"
+    result = fast_downloader().download(f"{base_url}/truncated/cut.mp3", path)
+    body = _stand_in_body("cut.mp3")
+    assert result['status'] == 'resumed'
+    assert path.read_bytes() == body
+    # Half the body in the dropped response, only the rest in the ranged one
+    # (bytes still buffered when the connection dropped are requested again)
+    assert stats['body_bytes'] < len(body) * 1.5
+
+
+def test_revalidation_answers_304_without_body(server, tmp_path):
+    base_url, stats = server
+    url = f"{base_url}/audio/word1.mp3"
+    path = tmp_path / "word1.mp3"
+    assert fast_downloader().download(url, path)['status'] == 'downloaded'
+    assert fast_downloader().download(url, path)['status'] == 'exists'
+
+    before = stats['body_bytes']
+    result = fast_downloader(revalidate=True).download(url, path)
+    assert result['status'] == 'not_modified'
+    assert stats['body_bytes'] == before
+
+
+def test_file_not_matching_its_sidecar_is_fetched_again(server, tmp_path):
+    base_url, _ = server
+    url = f"{base_url}/audio/word2.mp3"
+    path = tmp_path / "word2.mp3"
+    fast_downloader().download(url, path)
+    path.write_bytes(path.read_bytes()[:10])
+    result = fast_downloader().download(url, path)
+    assert result['status'] == 'downloaded'
+    assert path.read_bytes() == _stand_in_body("word2.mp3")
+
+
+def test_sha256_mismatch_leaves_nothing_behind(server, tmp_path):
+    base_url, _ = server
+    path = tmp_path / "checked.mp3"
+    result = fast_downloader().download(f"{base_url}/audio/checked.mp3", path, expected_sha256="0" * 64)
+    assert result['status'] == 'error'
+    assert 'sha256 mismatch' in result['error']
+    assert not path.exists()
+    assert not list(tmp_path.glob("*.part*"))
+
+
+def test_rate_limit_spaces_requests(server, tmp_path):
+    base_url, stats = server
+    urls = [f"{base_url}/audio/word{i}.mp3" for i in (1, 2, 3, 4, 6, 7)]
+    downloader = fast_downloader(rate=20.0, burst=2)
+    started = time.monotonic()
+    list(downloader.download_many((url, url, tmp_path / url.rsplit('/', 1)[-1]) for url in urls))
+    assert time.monotonic() - started >= (len(urls) - 2) / 20.0 * 0.9
+    times = stats['times']
+    assert times[-1] - times[0] >= (len(times) - 2) / 20.0 * 0.9
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from dtw import _synthetic_pair, band_limits, dtw_distance, dtw_distance_loop, frame_distances
+
+SIZES = [(1, 1), (1, 7), (9, 1), (5, 5), (17, 40), (40, 17), (59, 58), (3, 50)]
+
+
+def banded_loop(mfcc1, mfcc2, band):
+    """The VB recurrence with every cell outside band_limits() left at infinity"""
+    n, m = mfcc1.shape[1], mfcc2.shape[1]
+    lo, hi = band_limits(n, m, band)
+    cost = frame_distances(mfcc1, mfcc2)
+    dtw = np.full((n + 1, m + 1), np.inf)
+    dtw[0, 0] = 0.0
+    for i in range(1, n + 1):
+        for j in range(lo[i - 1], hi[i - 1] + 1):
+            dtw[i, j] = cost[i - 1, j - 1] + min(dtw[i - 1, j], dtw[i, j - 1], dtw[i - 1, j - 1])
+    return dtw[n, m] / (n + m)
+
+
+@pytest.mark.parametrize("n, m", SIZES)
+def test_full_matrix_matches_vb_port(n, m):
+    rec, ref = _synthetic_pair(n, m, seed=n * 100 + m)
+    assert dtw_distance(rec, ref) == pytest.approx(dtw_distance_loop(rec, ref), rel=1e-12)
+
+
+@pytest.mark.parametrize("n, m", SIZES)
+@pytest.mark.parametrize("band", [1, 3, 10])
+def test_band_matches_banded_brute_force(n, m, band):
+    rec, ref = _synthetic_pair(n, m, seed=n * 100 + m)
+    expected = banded_loop(rec, ref, band)
+    assert dtw_distance(rec, ref, band=band) == pytest.approx(expected, rel=1e-12)
+    # Same cells through the precomputed-distance path
+    distances = frame_distances(rec, ref)
+    assert dtw_distance(rec, ref, band=band, distances=distances) == pytest.approx(expected, rel=1e-12)
+
+
+@pytest.mark.parametrize("n, m", SIZES)
+def test_wide_band_equals_full_matrix(n, m):
+    rec, ref = _synthetic_pair(n, m, seed=n + m)
+    assert dtw_distance(rec, ref, band=max(n, m)) == pytest.approx(dtw_distance(rec, ref), rel=1e-12)
+
+
+def test_empty_and_mismatched_inputs():
+    assert dtw_distance(np.zeros((13, 0)), np.zeros((13, 5))) == float('inf')
+    with pytest.raises(ValueError):
+        dtw_distance(np.zeros((13, 4)), np.zeros((12, 4)))
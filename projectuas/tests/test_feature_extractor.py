@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from feature_extractor import ArrayFrameWriter, FeatureExtractor, SpillFrameWriter
+from feature_shards import FeatureShards, FeatureShardWriter
+from reference_store import ReferenceStore, ReferenceStoreWriter
+
+SR = 22050
+COLUMNS = ('mfcc', 'delta', 'delta_delta')
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return FeatureExtractor(sr=SR)
+
+
+def write_clip(path, seconds, rate, channels, seed=0):
+    rng = np.random.default_rng(seed)
+    clip = rng.standard_normal((int(seconds * rate), channels)) * np.linspace(0.01, 0.5, channels)
+    sf.write(str(path), clip.astype(np.float32), rate, subtype='PCM_16')
+    return path
+
+
+@pytest.mark.parametrize("rate, channels", [(SR, 1), (44100, 2), (48000, 1)])
+@pytest.mark.parametrize("block_frames", [7, 100, 1024])
+def test_streaming_equals_in_memory(tmp_path, extractor, rate, channels, block_frames):
+    path = write_clip(tmp_path / "clip.wav", 7.3, rate, channels)
+    expected = extractor.extract(extractor.load(path))
+    writer = ArrayFrameWriter()
+    info = extractor.stream_file(path, writer, block_frames=block_frames, spill_dir=tmp_path)
+    got = writer.result()
+    assert info['frames'] == expected['mfcc'].shape[1]
+    assert info['duration'] == pytest.approx(len(extractor.load(path)) / SR)
+    for column in COLUMNS:
+        assert got[column].shape == expected[column].shape
+        np.testing.assert_allclose(got[column], expected[column], rtol=0, atol=1e-3)
+    for key in ('mean', 'std', 'min', 'max'):
+        np.testing.assert_allclose(info['statistics'][key], expected['statistics'][key], rtol=1e-5, atol=1e-3)
+
+
+def test_batch_equals_single_clip(extractor):
+    rng = np.random.default_rng(1)
+    signals = [(rng.standard_normal(int(s * SR)) * 0.1).astype(np.float32) for s in (0.3, 1.0, 2.5)]
+    for y, batched in zip(signals, extractor.extract_batch(signals)):
+        single = extractor.extract(y)
+        for column in COLUMNS:
+            np.testing.assert_allclose(batched[column], single[column], rtol=0, atol=1e-3)
+
+
+def test_extract_file_streams_long_files(tmp_path):
+    path = write_clip(tmp_path / "long.wav", 3.0, SR, 1)
+    streaming = FeatureExtractor(sr=SR, stream_seconds=1.0).extract_file(path)
+    in_memory = FeatureExtractor(sr=SR).extract_file(path)
+    assert 'audio' not in streaming and 'audio' in in_memory
+    np.testing.assert_allclose(streaming['mfcc'], in_memory['mfcc'], rtol=0, atol=1e-3)
+
+
+def test_spilled_frames_are_copied_row_major(tmp_path, extractor):
+    path = write_clip(tmp_path / "clip.wav", 4.0, 44100, 2)
+    expected = extractor.extract(extractor.load(path))
+    with SpillFrameWriter(extractor.n_mfcc, spill_dir=tmp_path) as frames:
+        frames.COPY_FRAMES = 50
+        info = extractor.stream_file(path, frames, block_frames=64, spill_dir=tmp_path)
+
+        with ReferenceStoreWriter(tmp_path / "store", extractor.params()) as store_writer:
+            store_writer.add("streamed", frames.array('mfcc'))
+            store_writer.add_frames("spilled", frames)
+        with FeatureShardWriter(tmp_path / "shards", extractor.params()) as shard_writer:
+            shard_writer.add_frames("clip.wav", frames, info['statistics'], info['duration'])
+
+    store = ReferenceStore(tmp_path / "store")
+    np.testing.assert_array_equal(store.get("spilled"), store.get("streamed"))
+    np.testing.assert_allclose(store.get("spilled"), expected['mfcc'], rtol=0, atol=1e-3)
+    store.close()
+
+    shards = FeatureShards(tmp_path / "shards")
+    for shard_column, column in zip(("mfcc", "delta", "delta2"), COLUMNS):
+        np.testing.assert_allclose(shards.get("clip.wav", shard_column), expected[column], rtol=0, atol=1e-3)
+    shards.close()
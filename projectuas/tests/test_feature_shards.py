@@ -0,0 +1,92 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from feature_shards import FeatureShards, FeatureShardWriter, compact
+
+PARAMS = {"n_mfcc": 13, "n_fft": 2048, "hop_length": 512, "sr": 22050}
+
+
+def clip_features(seed, frames):
+    rng = np.random.default_rng(seed)
+    mfcc, delta, delta2 = (rng.normal(size=(13, frames)).astype(np.float32) for _ in range(3))
+    stats = {'mean': mfcc.mean(axis=1), 'std': mfcc.std(axis=1), 'min': mfcc.min(axis=1), 'max': mfcc.max(axis=1)}
+    return mfcc, delta, delta2, stats
+
+
+def build_dataset(directory, clips=12):
+    expected = {}
+    # Two runs, the second replacing half of the clips, so the first shard holds dead data
+    for run in range(2):
+        with FeatureShardWriter(directory, PARAMS, shard_size=4096) as writer:
+            for i in range(run, clips, run + 1):
+                features = clip_features(run * 100 + i, 20 + i)
+                writer.add(f"clip{i}.wav", *features, duration=1.0 + i)
+                expected[f"clip{i}.wav"] = features[0]
+    return expected
+
+
+def assert_dataset(directory, expected):
+    shards = FeatureShards(directory)
+    assert sorted(shards.clip_ids) == sorted(expected)
+    for clip_id, mfcc in expected.items():
+        np.testing.assert_array_equal(shards.get(clip_id), mfcc)
+    numbers = list(shards.shards)
+    shards.close()
+    return numbers
+
+
+def test_compact_keeps_every_clip_in_new_shards(tmp_path):
+    expected = build_dataset(tmp_path)
+    before = assert_dataset(tmp_path, expected)
+    compact(tmp_path)
+    after = assert_dataset(tmp_path, expected)
+    assert min(after) > max(before)
+    on_disk = {int(p.name.split('.')[0][len("shard-"):]) for p in tmp_path.glob("shard-*.bin")}
+    assert on_disk == set(after)
+
+
+def test_interrupted_compact_leaves_a_readable_dataset(tmp_path, monkeypatch):
+    expected = build_dataset(tmp_path)
+    real_unlink = Path.unlink
+    deleted = []
+
+    # Interrupted after the first shard file is gone
+    def interrupted(self, missing_ok=False):
+        if self.parent == tmp_path and self.name.startswith("shard-"):
+            if deleted:
+                raise KeyboardInterrupt
+            deleted.append(self.name)
+        real_unlink(self, missing_ok=missing_ok)
+
+    monkeypatch.setattr(Path, "unlink", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        compact(tmp_path)
+    monkeypatch.undo()
+
+    assert_dataset(tmp_path, expected)
+    # The next compact works around the shard files left behind
+    compact(tmp_path)
+    assert_dataset(tmp_path, expected)
+
+
+def test_failed_reprocess_drops_the_old_features(tmp_path):
+    from wav_to_mfcc import WavToMFCC
+
+    input_dir = tmp_path / "wavs"
+    input_dir.mkdir()
+    rng = np.random.default_rng(0)
+    for name in ("a", "b"):
+        sf.write(str(input_dir / f"{name}.wav"), (rng.standard_normal(11025) * 0.1).astype(np.float32), 22050)
+    output_dir = tmp_path / "out"
+    converter = WavToMFCC()
+    converter.process_directory(input_dir, output_dir)
+
+    (input_dir / "a.wav").write_bytes(b"not audio any more")
+    results = converter.process_directory(input_dir, output_dir)
+    assert 'error' in results["a.wav"]
+    shards = FeatureShards(output_dir)
+    assert list(shards.clip_ids) == ["b.wav"]
+    shards.close()
@@ -0,0 +1,58 @@
+import queue
+import threading
+
+import numpy as np
+
+import fetch_and_generate
+from audio_cache import AudioCache
+from fetch_and_generate import BatchGenerator, StageCounters
+
+
+class FailingQueue(queue.Queue):
+    """Accepts the sentinel, fails on the n-th item"""
+
+    def __init__(self, fail_at):
+        super().__init__()
+        self.fail_at = fail_at
+        self.items = 0
+
+    def put(self, item, block=True, timeout=None):
+        if item is not None:
+            self.items += 1
+            if self.items == self.fail_at:
+                raise RuntimeError("write queue broken")
+        super().put(item, block, timeout)
+
+
+def test_failed_feature_stage_drains_and_reports_every_word(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch_and_generate, "_extract_worker",
+                        lambda params, path, audio_cache=None: (np.zeros((13, 4)), 0.0))
+    results = {}
+    generator = BatchGenerator(tmp_path / "urls.csv", [], tmp_path / "audio", tmp_path / "json",
+                               audio_cache=AudioCache(tmp_path / "cache"), feature_workers=0,
+                               on_result=lambda word, stage, error: results.setdefault(word, stage))
+    words = [f"word{i}" for i in range(40)]
+    # Bounded like process_all's queues: the producer blocks unless the stage keeps reading
+    feature_queue = queue.Queue(maxsize=2)
+    out_queue = FailingQueue(fail_at=3)
+
+    def produce():
+        for word in words:
+            feature_queue.put((word, tmp_path / f"{word}.mp3"))
+        feature_queue.put(None)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    stage = threading.Thread(target=generator._feature_stage,
+                             args=(feature_queue, out_queue, StageCounters("features")), daemon=True)
+    stage.start()
+    producer.join(timeout=10)
+    stage.join(timeout=10)
+
+    assert not producer.is_alive() and not stage.is_alive()
+    handed_on = [item[0] for item in list(out_queue.queue) if item is not None]
+    assert handed_on == words[:2]
+    assert out_queue.queue[-1] is None
+    # Every word that did not reach the write stage is reported as failed in "features"
+    assert sorted(results) == sorted(words[2:])
+    assert set(results.values()) == {"features"}
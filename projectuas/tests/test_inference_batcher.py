@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+from inference_batcher import InferenceBatcher
+
+HOP = 320
+
+
+class FakeProcessor:
+    """Zero-pads like Wav2Vec2Processor; no attention mask for the model (base wav2vec2)"""
+
+    feature_extractor = SimpleNamespace(return_attention_mask=False)
+
+    def __call__(self, speech, sampling_rate, return_tensors, padding, return_attention_mask):
+        longest = max(len(s) for s in speech)
+        values = np.zeros((len(speech), longest), dtype=np.float32)
+        mask = np.zeros((len(speech), longest), dtype=np.int64)
+        for i, s in enumerate(speech):
+            values[i, :len(s)] = s
+            mask[i, :len(s)] = 1
+        return SimpleNamespace(input_values=values, attention_mask=mask)
+
+
+class GroupNormBackend:
+    """Normalizes each row over all its samples, padding included, like the base model's first layer"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, input_values, attention_mask=None):
+        self.batch_sizes.append(len(input_values))
+        mean = input_values.mean(axis=1, keepdims=True)
+        std = input_values.std(axis=1, keepdims=True) + 1e-5
+        normed = (input_values - mean) / std
+        frames = normed.shape[1] // HOP
+        pooled = normed[:, :frames * HOP].reshape(len(normed), frames, HOP)
+        # Two "tokens": positive vs negative frame energy around the clip mean
+        score = pooled.mean(axis=2)
+        return np.stack([score, -score], axis=-1)
+
+    def frame_counts(self, sample_counts):
+        return np.asarray(sample_counts) // HOP
+
+
+def run(lengths, **kwargs):
+    rng = np.random.default_rng(0)
+    clips = [(rng.standard_normal(n) * 0.1 + np.sin(np.arange(n) / 50.0)).astype(np.float32) for n in lengths]
+    alone = InferenceBatcher(FakeProcessor(), GroupNormBackend(), max_batch_size=1)
+    expected = [alone.infer(c) for c in clips]
+    backend = GroupNormBackend()
+    batcher = InferenceBatcher(FakeProcessor(), backend, max_wait_ms=300.0, **kwargs)
+    with ThreadPoolExecutor(max_workers=len(clips)) as pool:
+        batched = list(pool.map(batcher.infer, clips))
+    return expected, batched, backend.batch_sizes
+
+
+def test_dissimilar_lengths_are_not_padded_together():
+    expected, batched, sizes = run([16000, 8000, 16000, 8000], max_batch_size=8)
+    assert sorted(sizes) == [2, 2]
+    for a, b in zip(expected, batched):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_similar_lengths_batch_and_keep_transcripts():
+    expected, batched, sizes = run([16000, 16320, 16640, 15900], max_batch_size=8, max_padding=0.05)
+    assert sizes == [4]
+    for a, b in zip(expected, batched):
+        assert a.shape == b.shape
+        np.testing.assert_array_equal(a.argmax(axis=-1), b.argmax(axis=-1))
+        np.testing.assert_allclose(a, b, atol=0.1)
+
+
+def test_masked_models_batch_any_length():
+    processor = FakeProcessor()
+    processor.feature_extractor = SimpleNamespace(return_attention_mask=True)
+    backend = GroupNormBackend()
+    batcher = InferenceBatcher(processor, backend, max_wait_ms=300.0)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        list(pool.map(batcher.infer, [np.zeros(n, np.float32) for n in (4000, 16000, 32000)]))
+    assert backend.batch_sizes == [3]
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from dtw import dtw_distance
+from reference_search import ReferenceIndex, _synthetic_references
+
+REFERENCE_DIR = Path(__file__).resolve().parent.parent / "references"
+
+
+def random_references(count, n_mfcc=13, seed=0):
+    rng = np.random.default_rng(seed)
+    return {f"word{i:03d}": np.cumsum(rng.normal(0, 5, size=(n_mfcc, int(rng.integers(1, 40)))), axis=1)
+            for i in range(count)}
+
+
+def warped_queries(index, count, seed=1):
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        base = index.mfccs[rng.integers(len(index))]
+        m = base.shape[1]
+        length = max(1, int(m * rng.uniform(0.7, 1.3)))
+        warp = np.clip(np.sort(rng.uniform(0, m - 1, size=length)), 0, m - 1).astype(int)
+        yield base[:, warp] + rng.normal(0, 10, size=(base.shape[0], length))
+
+
+def brute_force(index, query, k, band=None):
+    """Every reference through dtw_distance, sorted by (distance, index)"""
+    scored = sorted((dtw_distance(query, m, band=band), r) for r, m in enumerate(index.mfccs))
+    return [(index.words[r], d) for d, r in scored[:k]]
+
+
+@pytest.mark.parametrize("k", [1, 5, 200])
+@pytest.mark.parametrize("band", [None, 5])
+def test_top_k_identical_to_brute_force(k, band):
+    index = ReferenceIndex(random_references(120))
+    for query in warped_queries(index, 15):
+        got, counts = index.search(query, k=k, band=band)
+        expected = brute_force(index, query, k, band)
+        assert [w for w, _ in got] == [w for w, _ in expected]
+        np.testing.assert_allclose([d for _, d in got], [d for _, d in expected], rtol=1e-12, atol=0)
+        assert counts["dtw"] + counts["pruned_kim"] + counts["pruned_keogh"] + counts["pruned_rowcol"] \
+            == len(index)
+
+
+def test_lower_bounds_never_exceed_dtw():
+    index = ReferenceIndex(random_references(60, seed=3))
+    for query in warped_queries(index, 10, seed=4):
+        lb_kim, lb_keogh = index.lower_bounds(query)
+        exact = np.array([dtw_distance(query, m) for m in index.mfccs])
+        assert np.all(lb_kim <= exact * (1 + 1e-9) + 1e-9)
+        assert np.all(lb_keogh <= exact * (1 + 1e-9) + 1e-9)
+
+
+def test_committed_references_identical_to_brute_force():
+    store_module = pytest.importorskip("reference_store")
+    store = store_module.ReferenceStore.open_if_exists(REFERENCE_DIR)
+    if store is None:
+        pytest.skip("no reference store")
+    references = {w: np.asarray(m, dtype=np.float64) for w, m in store.items()}
+    store.close()
+    index = ReferenceIndex(_synthetic_references(references, 300))
+    for query in warped_queries(index, 10, seed=5):
+        got, _ = index.search(query, k=5)
+        assert [w for w, _ in got] == [w for w, _ in brute_force(index, query, 5)]
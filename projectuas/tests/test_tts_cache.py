@@ -0,0 +1,28 @@
+from tts_cache import TTSCache
+
+
+def cached(tmp_path, text):
+    path = tmp_path / f"{TTSCache.make_key(text, 150, None)}.wav"
+    path.write_bytes(b"RIFF stand-in")
+    return path
+
+
+def test_hits_and_misses_are_counted_once(tmp_path):
+    cup = cached(tmp_path, "cup")
+    cached(tmp_path, "glass")
+    cache = TTSCache(tmp_path)
+
+    assert cache.lookup("cup") == cup
+    assert cache.lookup("bottle") is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_file_deleted_behind_the_cache_is_a_miss(tmp_path):
+    cup = cached(tmp_path, "cup")
+    cache = TTSCache(tmp_path)
+    cup.unlink()
+
+    assert cache.lookup("cup") is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (0, 1, 0)
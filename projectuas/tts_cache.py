@@ -0,0 +1,290 @@
+"""
+Content-addressed, size-bounded cache of TTS audio for /tts.
+Rendered WAV files are keyed by (text, rate, voice); hits are served straight
+from disk and never touch the TTS engine. Misses are rendered by one worker
+thread that owns the pyttsx3 engine, with interactive requests ahead of
+pre-warm jobs.
+
+Usage:
+  python tts_cache.py prewarm     # render every word from the questions table
+"""
+
+import hashlib
+import itertools
+import os
+import queue
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+PRIORITY_REQUEST = 0
+PRIORITY_PREWARM = 1
+
+
+class _RenderJob:
+    def __init__(self, key, text, rate, voice):
+        self.key = key
+        self.text = text
+        self.rate = rate
+        self.voice = voice
+        self.done = threading.Event()
+        self.error = None
+
+
+class TTSCache:
+    """Disk-backed TTS cache with LRU eviction"""
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024, default_rate=150, default_voice=None):
+        """
+        Args:
+            cache_dir (str): Directory holding <sha256>.wav files
+            max_bytes (int): Evict least recently used files above this size
+            default_rate (int): Speech rate when the request gives none
+            default_voice (str, optional): pyttsx3 voice id when the request gives none
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.default_rate = default_rate
+        self.default_voice = default_voice
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._total_bytes = 0
+        self._inflight = {}
+        self._jobs = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._worker = None
+        self._counters = {'hits': 0, 'misses': 0, 'renders': 0, 'render_errors': 0, 'evictions': 0}
+        self._load_index()
+
+    def _load_index(self):
+        files = sorted(self.cache_dir.glob("*.wav"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            if path.name.startswith("."):
+                # Leftover from an interrupted render
+                path.unlink(missing_ok=True)
+                continue
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def make_key(text, rate, voice):
+        """Content address for one rendering of a text"""
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{normalized}\0{rate}\0{voice or ''}".encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.wav"
+
+    def lookup(self, text, rate=None, voice=None):
+        """
+        Cached file for (text, rate, voice), or None; marks the entry as recently
+        used and counts the hit or miss
+        """
+        key = self.make_key(text, rate or self.default_rate, voice or self.default_voice)
+        with self._lock:
+            if key not in self._entries:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            # mtime doubles as the LRU timestamp across restarts
+            os.utime(path)
+        except FileNotFoundError:
+            # Deleted behind the cache: a miss, not a hit
+            with self._lock:
+                self._forget(key)
+                self._counters['misses'] += 1
+            return None
+        with self._lock:
+            self._counters['hits'] += 1
+        return path
+
+    def get(self, text, rate=None, voice=None, timeout=5.0):
+        """
+        Cached file for the text, rendering it on a miss
+
+        Returns:
+            Path: WAV file, or None if rendering failed or timed out
+        """
+        path = self.lookup(text, rate, voice)
+        if path is not None:
+            return path
+
+        job = self._submit(text, rate or self.default_rate, voice or self.default_voice, PRIORITY_REQUEST)
+        if not job.done.wait(timeout) or job.error is not None:
+            return None
+        path = self._path(job.key)
+        return path if path.exists() else None
+
+    def open(self, text, rate=None, voice=None, timeout=5.0):
+        """
+        get() as an already opened file, so an eviction by a concurrent render
+        cannot remove the audio between the lookup and the send
+
+        Returns:
+            file: WAV opened for binary reading (name is its cache path), or None
+        """
+        for _ in range(2):
+            path = self.get(text, rate, voice, timeout)
+            if path is None:
+                return None
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                # Evicted right after get(); render it again once (the retry counts
+                # the miss, so the hit get() may have counted is taken back)
+                with self._lock:
+                    self._forget(path.stem)
+                    if self._counters['hits']:
+                        self._counters['hits'] -= 1
+        return None
+
+    def prewarm(self, texts, rate=None, voice=None):
+        """
+        Queue every text that is not cached yet for background rendering
+
+        Returns:
+            list: Render jobs (wait on job.done to block until finished)
+        """
+        rate = rate or self.default_rate
+        voice = voice or self.default_voice
+        jobs = []
+        for text in texts:
+            key = self.make_key(text, rate, voice)
+            with self._lock:
+                if key in self._entries:
+                    continue
+            jobs.append(self._submit(text, rate, voice, PRIORITY_PREWARM))
+        return jobs
+
+    def _submit(self, text, rate, voice, priority):
+        key = self.make_key(text, rate, voice)
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is None:
+                job = _RenderJob(key, text, rate, voice)
+                self._inflight[key] = job
+            # Re-queueing an in-flight job at request priority lets it jump the
+            # pre-warm backlog; the duplicate entry is skipped once it is done.
+            self._jobs.put((priority, next(self._sequence), job))
+        self._ensure_worker()
+        return job
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="tts-render", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        import pyttsx3
+
+        engine = None
+        while True:
+            _, _, job = self._jobs.get()
+            if job.done.is_set():
+                continue
+            with self._lock:
+                already_cached = job.key in self._entries
+            if already_cached:
+                with self._lock:
+                    self._inflight.pop(job.key, None)
+                job.done.set()
+                continue
+
+            final_path = self._path(job.key)
+            temp_path = self.cache_dir / f".{job.key}.tmp.wav"
+            try:
+                if engine is None:
+                    engine = pyttsx3.init()
+                engine.setProperty('rate', job.rate)
+                if job.voice:
+                    engine.setProperty('voice', job.voice)
+                engine.save_to_file(job.text, str(temp_path))
+                engine.runAndWait()
+
+                if not temp_path.exists() or temp_path.stat().st_size == 0:
+                    raise RuntimeError(f"TTS produced no audio for '{job.text}'")
+                os.replace(temp_path, final_path)
+                self._add(job.key, final_path.stat().st_size)
+                with self._lock:
+                    self._counters['renders'] += 1
+            except Exception as e:
+                job.error = e
+                with self._lock:
+                    self._counters['render_errors'] += 1
+                print(f"TTS render failed for '{job.text}': {e}")
+                # Start from a fresh engine after a failure
+                engine = None
+                temp_path.unlink(missing_ok=True)
+            finally:
+                with self._lock:
+                    self._inflight.pop(job.key, None)
+                job.done.set()
+
+    def _add(self, key, size):
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = size
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, _ = next(iter(self._entries.items()))
+                self._forget(old_key)
+                try:
+                    self._path(old_key).unlink(missing_ok=True)
+                except OSError:
+                    # Still open for a response (Windows); the file is picked up again on restart
+                    continue
+                self._counters['evictions'] += 1
+
+    def _forget(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'pending_renders': len(self._inflight)
+            }
+
+
+def main():
+    """Render every question word into the cache"""
+    import argparse
+    from questions import DEFAULT_SQL_PATH, load_questions
+
+    parser = argparse.ArgumentParser(description="TTS cache tools")
+    parser.add_argument("command", choices=["prewarm"])
+    parser.add_argument("--sql", default=str(DEFAULT_SQL_PATH))
+    parser.add_argument("--rate", type=int, default=150)
+    args = parser.parse_args()
+
+    cache = TTSCache(Path(__file__).parent / "cache" / "tts", default_rate=args.rate)
+    texts = sorted({q['text'] for q in load_questions(args.sql)})
+
+    print("=" * 60)
+    print("TTS CACHE PRE-WARM")
+    print("=" * 60)
+    jobs = cache.prewarm(texts)
+    print(f"{len(texts)} questions, {len(jobs)} to render")
+
+    for i, job in enumerate(jobs, 1):
+        job.done.wait()
+        if i % 100 == 0 or i == len(jobs):
+            print(f"  {i}/{len(jobs)} rendered")
+
+    stats = cache.stats()
+    print(f"\n✓ {stats['entries']} cached files, {stats['bytes'] / 1e6:.1f} MB, {stats['render_errors']} errors")
+
+
+if __name__ == "__main__":
+    main()
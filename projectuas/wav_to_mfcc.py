@@ -4,6 +4,12 @@ untuk keperluan dataset audio processing dan machine learning.
 """
 
 import os
+import argparse
+import time
+import tempfile
+import shutil
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
 import librosa
 import librosa.display
@@ -12,13 +18,46 @@ from pathlib import Path
 import json
 import csv
 
+from audio_cache import AudioCache, DEFAULT_MAX_BYTES
+from feature_extractor import FeatureExtractor, SpillFrameWriter
+from manifest import Manifest, MANIFEST_NAME
+from mfcc_render import RenderQueue, render_mfcc, DEFAULT_DPI
+from feature_shards import FeatureShardWriter
+
+
+def _process_file_worker(params, wav_path, output_dir, return_features=False, audio_cache=None):
+    """
+    Dijalankan di worker process: proses satu file dan kembalikan hasil ringkas
+    (array MFCC hanya jika return_features, mis. untuk ditulis ke feature shards
+    oleh parent)
+    """
+    converter = WavToMFCC(**params, audio_cache=audio_cache)
+    try:
+        # Output per file dari worker dibuang; progress dicetak oleh parent
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result = converter.process_single_file(wav_path, output_dir)
+    except Exception as e:
+        return {'error': str(e)}
+    if return_features:
+        return result
+    return {
+        'statistics': result['statistics'],
+        'shape': result['shape'],
+        'duration': result['duration']
+    }
+
+
+def _init_worker():
+    # Worker tidak punya display; render PNG lewat backend Agg
+    plt.switch_backend('Agg')
+
 
 class WavToMFCC:
     """
     Class untuk mengkonversi file WAV ke MFCC features
     """
     
-    def __init__(self, n_mfcc=13, n_fft=2048, hop_length=512, sr=22050):
+    def __init__(self, n_mfcc=13, n_fft=2048, hop_length=512, sr=22050, audio_cache=None):
         """
         Inisialisasi parameter MFCC
         
@@ -27,11 +66,20 @@ class WavToMFCC:
             n_fft (int): Panjang FFT window (default: 2048)
             hop_length (int): Jumlah sample antara frame (default: 512)
             sr (int): Sample rate untuk load audio (default: 22050 Hz)
+            audio_cache (audio_cache.AudioCache, optional): Cache audio hasil decode dan
+                                                            resample (dipakai bersama worker)
         """
         self.n_mfcc = n_mfcc
         self.n_fft = n_fft
         self.hop_length = hop_length
         self.sr = sr
+        self.audio_cache = audio_cache
+        # Basis mel/DCT di-cache per parameter set; satu STFT per file
+        self.extractor = FeatureExtractor(n_mfcc=n_mfcc, n_fft=n_fft, hop_length=hop_length, sr=sr,
+                                          audio_cache=audio_cache)
+    
+    def _params(self):
+        return {'n_mfcc': self.n_mfcc, 'n_fft': self.n_fft, 'hop_length': self.hop_length, 'sr': self.sr}
     
     def extract_mfcc(self, audio_path):
         """
@@ -47,18 +95,12 @@ class WavToMFCC:
                 - sample_rate: sample rate dari audio
         """
         # Load audio file
-        audio, sr = librosa.load(audio_path, sr=self.sr)
+        audio = self.extractor.load(audio_path)
         
         # Ekstrak MFCC
-        mfcc = librosa.feature.mfcc(
-            y=audio,
-            sr=sr,
-            n_mfcc=self.n_mfcc,
-            n_fft=self.n_fft,
-            hop_length=self.hop_length
-        )
+        mfcc = self.extractor.mfcc(audio)
         
-        return mfcc, audio, sr
+        return mfcc, audio, self.sr
     
     def extract_mfcc_with_delta(self, audio_path):
         """
@@ -68,23 +110,43 @@ class WavToMFCC:
             audio_path (str): Path ke file WAV
             
         Returns:
-            dict: Dictionary berisi mfcc, delta, dan delta_delta
+            dict: Dictionary berisi mfcc, delta, delta_delta, statistics dan duration
+                  (semua dari satu STFT). Rekaman panjang (> extractor.stream_seconds)
+                  diproses per blok, sehingga memori tidak tumbuh dengan durasi
+                  dan tidak ada key 'audio'
         """
-        mfcc, audio, sr = self.extract_mfcc(audio_path)
-        
-        # Hitung delta (turunan pertama)
-        delta_mfcc = librosa.feature.delta(mfcc)
-        
-        # Hitung delta-delta (turunan kedua)
-        delta2_mfcc = librosa.feature.delta(mfcc, order=2)
+        return self.extractor.extract_file(audio_path)
+    
+    def is_long(self, audio_path):
+        """True jika file lebih panjang dari extractor.stream_seconds (dan bisa di-stream)"""
+        duration = self.extractor.file_duration(audio_path)
+        return duration is not None and duration > self.extractor.stream_seconds
+    
+    def stream_to_shards(self, wav_path, writer, clip_id, return_mfcc=False):
+        """
+        Rekaman panjang langsung ke feature shards: blok MFCC/delta ditulis ke file
+        sementara lalu disalin ke shard, jadi matrix utuh tidak pernah ada di memori
         
-        return {
-            'mfcc': mfcc,
-            'delta': delta_mfcc,
-            'delta_delta': delta2_mfcc,
-            'audio': audio,
-            'sr': sr
-        }
+        Args:
+            writer (FeatureShardWriter): Shard writer tujuan
+            clip_id (str): Id clip di shard (path relatif)
+            return_mfcc (bool): Sertakan matrix MFCC di hasil (mis. untuk render PNG)
+            
+        Returns:
+            dict: statistics, shape, duration (dan mfcc jika return_mfcc)
+        """
+        with SpillFrameWriter(self.n_mfcc, spill_dir=writer.directory) as frames:
+            info = self.extractor.stream_file(str(wav_path), frames, spill_dir=writer.directory)
+            writer.add_frames(clip_id, frames, info['statistics'], info['duration'])
+            result = {
+                'statistics': info['statistics'],
+                'shape': (self.n_mfcc, info['frames']),
+                'duration': info['duration'],
+                'streamed': True
+            }
+            if return_mfcc:
+                result['mfcc'] = frames.array('mfcc')
+        return result
     
     def get_mfcc_statistics(self, mfcc):
         """
@@ -96,14 +158,9 @@ class WavToMFCC:
         Returns:
             dict: Dictionary berisi statistik
         """
-        return {
-            'mean': np.mean(mfcc, axis=1),
-            'std': np.std(mfcc, axis=1),
-            'min': np.min(mfcc, axis=1),
-            'max': np.max(mfcc, axis=1)
-        }
+        return FeatureExtractor.statistics(mfcc)
     
-    def visualize_mfcc(self, mfcc, sr, save_path=None):
+    def visualize_mfcc(self, mfcc, sr, save_path=None, dpi=DEFAULT_DPI):
         """
         Visualisasi MFCC
         
@@ -111,7 +168,14 @@ class WavToMFCC:
             mfcc (numpy.ndarray): MFCC features
             sr (int): Sample rate
             save_path (str, optional): Path untuk menyimpan visualisasi
+            dpi (int): Resolusi PNG yang disimpan
         """
+        if save_path:
+            # Render ke file lewat canvas Agg, tanpa state pyplot
+            render_mfcc(mfcc, save_path, hop_length=self.hop_length, sr=sr, dpi=dpi)
+            print(f"Visualisasi disimpan di: {save_path}")
+            return
+        
         plt.figure(figsize=(12, 6))
         librosa.display.specshow(
             mfcc,
@@ -125,13 +189,7 @@ class WavToMFCC:
         plt.xlabel('Time')
         plt.ylabel('MFCC Coefficients')
         plt.tight_layout()
-        
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            print(f"Visualisasi disimpan di: {save_path}")
-        else:
-            plt.show()
-        
+        plt.show()
         plt.close()
     
     def export_to_csv(self, mfcc, delta, delta2, stats, output_path):
@@ -238,6 +296,40 @@ class WavToMFCC:
             
         return txt_path
     
+    def write_legacy_files(self, wav_name, mfcc, delta, delta2, stats, output_dir, audio_info):
+        """
+        Tulis output per file: 3 file .npy, statistik JSON, 2 CSV dan text VB.NET
+        
+        Args:
+            wav_name (str): Nama file WAV (stem dipakai untuk nama output)
+            output_dir (str): Directory output untuk file ini
+            audio_info (dict): Informasi audio (filename, duration, sample_rate)
+            
+        Returns:
+            tuple: (csv_path, txt_path)
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Simpan MFCC sebagai numpy file
+        base_name = Path(wav_name).stem
+        np.save(output_dir / f"{base_name}_mfcc.npy", mfcc)
+        np.save(output_dir / f"{base_name}_delta.npy", delta)
+        np.save(output_dir / f"{base_name}_delta2.npy", delta2)
+        
+        # Simpan statistik sebagai JSON
+        stats_serializable = {k: np.asarray(v).tolist() for k, v in stats.items()}
+        with open(output_dir / f"{base_name}_stats.json", 'w') as f:
+            json.dump(stats_serializable, f, indent=2)
+        
+        # Export ke CSV (untuk VB.NET)
+        csv_path, csv_full_path = self.export_to_csv(mfcc, delta, delta2, stats, output_dir / base_name)
+        
+        # Export ke VB.NET text format
+        txt_path = self.export_to_vbnet_format(mfcc, delta, delta2, stats, output_dir / base_name, audio_info)
+        
+        return csv_path, txt_path
+    
     def process_single_file(self, wav_path, output_dir=None, save_visualization=False):
         """
         Process single WAV file dan simpan hasilnya
@@ -260,46 +352,25 @@ class WavToMFCC:
         # Ekstrak MFCC dengan delta
         features = self.extract_mfcc_with_delta(str(wav_path))
         
-        # Hitung statistik
-        stats = self.get_mfcc_statistics(features['mfcc'])
+        # Statistik sudah dihitung bersama MFCC
+        stats = features['statistics']
         
         # Siapkan output directory
         if output_dir:
             output_dir = Path(output_dir)
-            output_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Simpan MFCC sebagai numpy file
             base_name = wav_path.stem
-            np.save(output_dir / f"{base_name}_mfcc.npy", features['mfcc'])
-            np.save(output_dir / f"{base_name}_delta.npy", features['delta'])
-            np.save(output_dir / f"{base_name}_delta2.npy", features['delta_delta'])
-            
-            # Simpan statistik sebagai JSON
-            stats_serializable = {k: v.tolist() for k, v in stats.items()}
-            with open(output_dir / f"{base_name}_stats.json", 'w') as f:
-                json.dump(stats_serializable, f, indent=2)
-            
-            # Export ke CSV (untuk VB.NET)
             audio_info = {
                 'filename': wav_path.name,
-                'duration': len(features['audio']) / features['sr'],
+                'duration': features['duration'],
                 'sample_rate': features['sr']
             }
-            csv_path, csv_full_path = self.export_to_csv(
-                features['mfcc'],
-                features['delta'],
-                features['delta_delta'],
-                stats,
-                output_dir / base_name
-            )
-            
-            # Export ke VB.NET text format
-            txt_path = self.export_to_vbnet_format(
+            csv_path, txt_path = self.write_legacy_files(
+                wav_path.name,
                 features['mfcc'],
                 features['delta'],
                 features['delta_delta'],
                 stats,
-                output_dir / base_name,
+                output_dir,
                 audio_info
             )
             
@@ -321,30 +392,62 @@ class WavToMFCC:
             'delta_delta': features['delta_delta'],
             'statistics': stats,
             'shape': features['mfcc'].shape,
-            'duration': len(features['audio']) / features['sr']
+            'duration': features['duration']
         }
     
-    def process_directory(self, input_dir, output_dir, save_visualization=False, recursive=True):
+    def find_wav_files(self, input_dir, recursive=True):
+        """
+        Cari semua file WAV, diurutkan supaya urutan proses dan summary deterministik
+        
+        Args:
+            input_dir (str): Directory berisi file WAV
+            recursive (bool): Cari file WAV di subdirectory juga
+            
+        Returns:
+            list: Path file WAV (tanpa duplikat)
+        """
+        input_dir = Path(input_dir)
+        pattern = input_dir.rglob if recursive else input_dir.glob
+        # Di filesystem case-insensitive "*.wav" dan "*.WAV" bisa mengembalikan file yang sama
+        return sorted(set(pattern("*.wav")) | set(pattern("*.WAV")))
+    
+    def process_directory(self, input_dir, output_dir, save_visualization=False, recursive=True,
+                          workers=1, max_in_flight=None, incremental=True, dpi=DEFAULT_DPI,
+                          render_workers=1, shards=True, legacy=False):
         """
         Process semua file WAV dalam directory
         
         Args:
             input_dir (str): Directory berisi file WAV
             output_dir (str): Directory untuk menyimpan output
-            save_visualization (bool): Apakah menyimpan visualisasi
+            save_visualization (bool): Render PNG MFCC di render queue terpisah setelah
+                                       fitur ditulis; PNG yang fiturnya tidak berubah
+                                       dilewati (lihat mfcc_render.py)
             recursive (bool): Cari file WAV di subdirectory juga
+            workers (int): Jumlah worker process (1 = sequential di process ini)
+            max_in_flight (int, optional): Maksimum file yang sedang diproses/antri
+                                           sekaligus (default: 2 x workers)
+            incremental (bool): Lewati file yang isi dan parameternya tidak berubah
+                                sejak run sebelumnya, dan hapus output dari file
+                                yang sudah dihapus (lihat manifest.py)
+            dpi (int): Resolusi PNG visualisasi
+            render_workers (int): Process untuk render PNG di background
+                                  (0 = render setelah semua fitur selesai)
+            shards (bool): Tulis fitur semua file ke feature shards di output_dir
+                           (lihat feature_shards.py); PNG masuk ke output_dir/plots
+            legacy (bool): Tulis juga output per file (npy, JSON, CSV, text VB.NET)
             
         Returns:
-            dict: Summary dari processing
+            dict: Hasil per file (relative path -> hasil), urut berdasarkan path.
+                  Dengan workers > 1 atau shards hasil tidak berisi array MFCC/delta.
         """
+        if not shards:
+            # Tanpa shards, output per file adalah satu-satunya output
+            legacy = True
         input_dir = Path(input_dir)
         output_dir = Path(output_dir)
         
-        # Cari semua file WAV (termasuk di subdirectory jika recursive=True)
-        if recursive:
-            wav_files = list(input_dir.rglob("*.wav")) + list(input_dir.rglob("*.WAV"))
-        else:
-            wav_files = list(input_dir.glob("*.wav")) + list(input_dir.glob("*.WAV"))
+        wav_files = self.find_wav_files(input_dir, recursive)
         
         if not wav_files:
             print(f"Tidak ada file WAV ditemukan di: {input_dir}")
@@ -353,31 +456,165 @@ class WavToMFCC:
         print(f"Ditemukan {len(wav_files)} file WAV")
         print("-" * 50)
         
+        # Pertahankan struktur folder relatif
+        jobs = [
+            (str(wav_file.relative_to(input_dir)),
+             wav_file,
+             output_dir / wav_file.relative_to(input_dir).parent / wav_file.stem)
+            for wav_file in wav_files
+        ]
+        
+        job_paths = {relative_path: (wav_file, output_subdir) for relative_path, wav_file, output_subdir in jobs}
         results = {}
-        for wav_file in wav_files:
+        started = time.perf_counter()
+        
+        # Fitur semua file ditambahkan ke beberapa shard file, bukan 7 file per WAV
+        writer = FeatureShardWriter(output_dir, self._params(), append=incremental) if shards else None
+        
+        # Plot tidak lagi di loop konversi: PNG dirender oleh render queue
+        render_queue = None
+        if save_visualization:
+            render_queue = RenderQueue(output_dir, self.hop_length, self.sr, dpi, render_workers)
+        
+        def queue_render(relative_path, mfcc=None):
+            if render_queue is None:
+                return
+            wav_file, output_subdir = job_paths[relative_path]
+            if writer is None:
+                mfcc_path = output_subdir / f"{wav_file.stem}_mfcc.npy"
+                if mfcc_path.exists():
+                    render_queue.submit(mfcc_path)
+                return
+            if mfcc is None:
+                mfcc = writer.get(relative_path)
+            png_path = output_dir / "plots" / Path(relative_path).parent / f"{wav_file.stem}_mfcc.png"
+            render_queue.submit_array(relative_path, mfcc, png_path)
+        
+        manifest = None
+        digests = {}
+        if incremental:
+            # Semua parameter yang mempengaruhi fitur dan format output ikut di fingerprint
+            manifest = Manifest(output_dir / MANIFEST_NAME, dict(self._params(), shards=shards, legacy=legacy))
+            removed = manifest.prune([job[0] for job in jobs], output_dir)
+            for relative_path in removed:
+                print(f"🗑️  Dihapus (input tidak ada lagi): {relative_path}")
+                if writer is not None:
+                    writer.remove(relative_path)
+            
+            pending_jobs = []
+            for job in jobs:
+                relative_path, wav_file, output_subdir = job
+                try:
+                    up_to_date, digests[relative_path] = manifest.check(relative_path, wav_file, output_dir)
+                except OSError:
+                    up_to_date = False
+                if writer is not None and relative_path not in writer:
+                    # Mis. run sebelumnya berhenti sebelum index shard ditulis
+                    up_to_date = False
+                if up_to_date:
+                    info = manifest.info(relative_path)
+                    results[relative_path] = {'shape': tuple(info.get('shape', ())),
+                                              'duration': info.get('duration', 'N/A'),
+                                              'skipped': True}
+                    # Fitur tidak berubah; PNG tetap dicek (mis. belum pernah dirender)
+                    queue_render(relative_path)
+                else:
+                    pending_jobs.append(job)
+            if len(pending_jobs) < len(jobs):
+                print(f"Dilewati (tidak berubah): {len(jobs) - len(pending_jobs)} file")
+            jobs_to_run = pending_jobs
+        else:
+            jobs_to_run = jobs
+        
+        done = [0]
+        
+        def report(relative_path, result):
+            if writer is not None and 'error' in result:
+                # Fitur dari isi file sebelumnya tidak boleh tetap dipakai untuk clip ini
+                writer.remove(relative_path)
+            elif writer is not None:
+                if not result.get('streamed'):
+                    writer.add(relative_path, result['mfcc'], result['delta'], result['delta_delta'],
+                               result['statistics'], result['duration'])
+                queue_render(relative_path, result.get('mfcc'))
+                # Array sudah ada di shard; jangan ditahan di memori sampai akhir
+                result = {k: result[k] for k in ('statistics', 'shape', 'duration')}
+            results[relative_path] = result
+            done[0] += 1
+            prefix = f"[{done[0]}/{len(jobs_to_run)}]"
+            if 'error' in result:
+                print(f"{prefix} ✗ Error pada {relative_path}: {result['error']}")
+                return
+            print(f"{prefix} ✓ Berhasil: {relative_path} - Shape: {result['shape']}, Duration: {result['duration']:.2f}s")
+            wav_file, output_subdir = job_paths[relative_path]
+            if writer is None:
+                queue_render(relative_path)
+            if manifest is not None and relative_path in digests:
+                outputs = [output_subdir.relative_to(output_dir).as_posix()] if legacy else []
+                manifest.record(relative_path, wav_file, digests[relative_path], outputs,
+                                {'shape': list(result['shape']), 'duration': result['duration']})
+        
+        # Rekaman panjang di-stream langsung ke shard oleh process ini (tidak lewat
+        # worker, tidak ada array utuh); output legacy tetap butuh array lengkap
+        long_jobs = []
+        if writer is not None and not legacy:
+            long_jobs = [job for job in jobs_to_run if self.is_long(job[1])]
+        for relative_path, wav_file, output_subdir in long_jobs:
+            print(f"Streaming: {relative_path}")
             try:
-                # Pertahankan struktur folder relatif
-                relative_path = wav_file.relative_to(input_dir)
-                output_subdir = output_dir / relative_path.parent / wav_file.stem
-                
-                result = self.process_single_file(
-                    wav_file,
-                    output_subdir,
-                    save_visualization
-                )
-                results[str(relative_path)] = result
-                print(f"✓ Berhasil: {relative_path} - Shape: {result['shape']}, Duration: {result['duration']:.2f}s")
+                result = self.stream_to_shards(wav_file, writer, relative_path,
+                                               return_mfcc=render_queue is not None)
             except Exception as e:
-                print(f"✗ Error pada {wav_file.name}: {str(e)}")
-                results[str(relative_path)] = {'error': str(e)}
+                result = {'error': str(e)}
+            report(relative_path, result)
             print("-" * 50)
+        if long_jobs:
+            streamed = {job[0] for job in long_jobs}
+            short_jobs = [job for job in jobs_to_run if job[0] not in streamed]
+        else:
+            short_jobs = jobs_to_run
+        
+        if workers <= 1:
+            for relative_path, wav_file, output_subdir in short_jobs:
+                try:
+                    result = self.process_single_file(wav_file, output_subdir if legacy else None)
+                except Exception as e:
+                    result = {'error': str(e)}
+                report(relative_path, result)
+                print("-" * 50)
+        elif short_jobs:
+            self._process_parallel(short_jobs, workers, max_in_flight or 2 * workers, report,
+                                   return_features=writer is not None, legacy=legacy)
+        
+        if writer is not None:
+            writer.close()
+            print(f"Feature shards: {len(writer)} file di {output_dir}")
+        if manifest is not None:
+            manifest.save()
+        
+        features_elapsed = time.perf_counter() - started
+        render_counts = None
+        if render_queue is not None:
+            if writer is None:
+                render_queue.prune([output_subdir / f"{wav_file.stem}_mfcc.npy"
+                                    for wav_file, output_subdir in job_paths.values()])
+            else:
+                render_queue.prune_keys(list(job_paths))
+            render_counts = render_queue.close()
+        
+        elapsed = time.perf_counter() - started
+        
+        # Urutkan hasil berdasarkan path, apapun urutan selesainya
+        results = {k: results[k] for k in sorted(results)}
         
         # Simpan summary
+        output_dir.mkdir(parents=True, exist_ok=True)
         summary_path = output_dir / "processing_summary.json"
         summary = {
             'total_files': len(wav_files),
-            'successful': sum(1 for r in results.values() if 'error' not in r),
+            'successful': sum(1 for r in results.values() if 'error' not in r and not r.get('skipped')),
             'failed': sum(1 for r in results.values() if 'error' in r),
+            'skipped': sum(1 for r in results.values() if r.get('skipped')),
             'files': {k: {'shape': str(v.get('shape', 'N/A')), 
                          'duration': v.get('duration', 'N/A'),
                          'error': v.get('error', None)} 
@@ -388,9 +625,91 @@ class WavToMFCC:
             json.dump(summary, f, indent=2)
         
         print(f"\nSummary disimpan di: {summary_path}")
-        print(f"Total: {summary['total_files']}, Berhasil: {summary['successful']}, Gagal: {summary['failed']}")
+        print(f"Total: {summary['total_files']}, Berhasil: {summary['successful']}, "
+              f"Gagal: {summary['failed']}, Dilewati: {summary['skipped']}")
+        print(f"Waktu: {elapsed:.1f}s ({len(wav_files) / elapsed:.2f} file/s, {max(workers, 1)} worker)")
+        if render_counts is not None:
+            print(f"Visualisasi: {render_counts['rendered']} dirender, {render_counts['skipped']} tidak berubah, "
+                  f"{render_counts['failed']} gagal (fitur selesai dalam {features_elapsed:.1f}s)")
         
         return results
+    
+    def _process_parallel(self, jobs, workers, max_in_flight, report, return_features=False, legacy=True):
+        """
+        Jalankan jobs di process pool dengan jumlah file in-flight terbatas,
+        supaya antrian (dan memori) tidak tumbuh sebesar dataset
+        """
+        pending = {}
+        queue = iter(jobs)
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            def submit_next():
+                job = next(queue, None)
+                if job is None:
+                    return False
+                relative_path, wav_file, output_subdir = job
+                try:
+                    future = pool.submit(_process_file_worker, self._params(), str(wav_file),
+                                         str(output_subdir) if legacy else None, return_features,
+                                         self.audio_cache)
+                except Exception as e:
+                    # Pool rusak (mis. worker mati): tandai file ini gagal, lanjut ke berikutnya
+                    report(relative_path, {'error': f"{type(e).__name__}: {e}"})
+                    return True
+                pending[future] = relative_path
+                return True
+            
+            while len(pending) < max_in_flight and submit_next():
+                pass
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    relative_path = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'error': f"{type(e).__name__}: {e}"}
+                    report(relative_path, result)
+                while len(pending) < max_in_flight and submit_next():
+                    pass
+
+
+def benchmark_workers(input_dir, worker_counts, save_visualization=True, recursive=True):
+    """
+    Ukur throughput process_directory untuk beberapa jumlah worker
+    
+    Args:
+        input_dir (str): Directory berisi file WAV
+        worker_counts (list): Jumlah worker yang diuji, mis. [1, 2, 4, 8]
+        save_visualization (bool): Ikut render PNG (biasanya bagian terberat)
+        
+    Returns:
+        list: Dict per jumlah worker (workers, files, seconds, files_per_s, speedup)
+    """
+    converter = WavToMFCC()
+    n_files = len(converter.find_wav_files(input_dir, recursive))
+    rows = []
+    for workers in worker_counts:
+        output_dir = tempfile.mkdtemp(prefix=f"mfcc_bench_{workers}_")
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                started = time.perf_counter()
+                converter.process_directory(input_dir, output_dir, save_visualization, recursive,
+                                            workers=workers, incremental=False)
+                seconds = time.perf_counter() - started
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        rows.append({'workers': workers, 'files': n_files, 'seconds': seconds,
+                     'files_per_s': n_files / seconds if seconds else 0.0})
+    
+    baseline = rows[0]['seconds'] if rows else 0
+    print(f"{'Workers':>8} {'Files':>6} {'Time (s)':>10} {'File/s':>8} {'Speedup':>8}")
+    for row in rows:
+        row['speedup'] = baseline / row['seconds'] if row['seconds'] else 0.0
+        print(f"{row['workers']:>8} {row['files']:>6} {row['seconds']:>10.2f} "
+              f"{row['files_per_s']:>8.2f} {row['speedup']:>7.2f}x")
+    return rows
 
 
 def main():
@@ -400,20 +719,48 @@ def main():
     # Dapatkan directory script saat ini
     script_dir = Path(__file__).parent
     
+    parser = argparse.ArgumentParser(description="Konversi dataset WAV ke MFCC")
+    parser.add_argument("--input", default=str(script_dir / "dataset"), help="Folder berisi file WAV")
+    parser.add_argument("--output", default=str(script_dir / "output" / "mfcc_dataset"), help="Folder output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Jumlah worker process (1 = sequential)")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="Maksimum file yang diproses/antri sekaligus (default: 2 x workers)")
+    parser.add_argument("--no-visualization", action="store_true", help="Jangan simpan PNG MFCC")
+    parser.add_argument("--lazy-visualization", action="store_true",
+                        help="Tulis fitur saja; PNG dirender nanti dengan: python mfcc_render.py render <output>")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI, help="Resolusi PNG MFCC")
+    parser.add_argument("--render-workers", type=int, default=1,
+                        help="Process untuk render PNG di background (0 = setelah fitur selesai)")
+    parser.add_argument("--legacy", action="store_true",
+                        help="Tulis juga output per file (npy, stats JSON, CSV, text VB.NET)")
+    parser.add_argument("--no-shards", action="store_true",
+                        help="Hanya output per file, tanpa feature shards (format lama)")
+    parser.add_argument("--force", action="store_true",
+                        help="Proses ulang semua file, abaikan manifest run sebelumnya")
+    parser.add_argument("--no-audio-cache", action="store_true",
+                        help="Selalu decode ulang audio (tanpa cache/audio, lihat audio_cache.py)")
+    parser.add_argument("--audio-cache-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Batas ukuran cache audio hasil decode (MB)")
+    parser.add_argument("--benchmark", metavar="N,N,...",
+                        help="Ukur throughput untuk jumlah worker ini (mis. 1,2,4,8), tanpa menyimpan output")
+    args = parser.parse_args()
+    
     # Setup paths
-    input_directory = script_dir / "dataset"
-    output_directory = script_dir / "output" / "mfcc_dataset"
+    input_directory = Path(args.input)
+    output_directory = Path(args.output)
     
     print("=" * 60)
     print("WAV TO MFCC CONVERTER")
     print("=" * 60)
     print(f"Input Directory : {input_directory}")
     print(f"Output Directory: {output_directory}")
+    print(f"Workers         : {args.workers}")
     print("=" * 60)
     
     # Cek apakah folder dataset ada
     if not input_directory.exists():
-        print(f"\n❌ ERROR: Folder 'dataset' tidak ditemukan!")
+        print(f"\n❌ ERROR: Folder '{input_directory.name}' tidak ditemukan!")
         print(f"   Silakan buat folder 'dataset' di: {script_dir}")
         print(f"   Dan masukkan file WAV Anda ke dalamnya.")
         return
@@ -430,9 +777,17 @@ def main():
         n_mfcc=13,      # Jumlah koefisien MFCC
         n_fft=2048,     # FFT window size
         hop_length=512, # Hop length
-        sr=22050        # Sample rate
+        sr=22050,       # Sample rate
+        # Audio hasil decode/resample di-cache: ganti parameter MFCC tanpa decode ulang
+        audio_cache=None if args.no_audio_cache else AudioCache(max_bytes=args.audio_cache_mb * 1024 * 1024)
     )
     
+    if args.benchmark:
+        worker_counts = [int(n) for n in args.benchmark.split(",") if n.strip()]
+        print(f"\n⏱️  Benchmark throughput untuk worker: {worker_counts}\n")
+        benchmark_workers(str(input_directory), worker_counts, save_visualization=not args.no_visualization)
+        return
+    
     # Process semua file WAV di folder dataset
     print("\n🚀 Memulai processing...\n")
     
@@ -440,7 +795,14 @@ def main():
         results = converter.process_directory(
             str(input_directory),
             str(output_directory),
-            save_visualization=True  # Simpan visualisasi MFCC
+            save_visualization=not (args.no_visualization or args.lazy_visualization),  # Simpan visualisasi MFCC
+            workers=args.workers,
+            max_in_flight=args.max_in_flight,
+            incremental=not args.force,
+            dpi=args.dpi,
+            render_workers=args.render_workers,
+            shards=not args.no_shards,
+            legacy=args.legacy
         )
         
         if results:
@@ -448,13 +810,22 @@ def main():
             print("✅ PROCESSING SELESAI!")
             print("=" * 60)
             print(f"\nHasil disimpan di: {output_directory}")
-            print("\nFile yang dihasilkan untuk setiap audio:")
-            print("  - *_mfcc.npy       : MFCC features")
-            print("  - *_delta.npy      : Delta MFCC")
-            print("  - *_delta2.npy     : Delta-delta MFCC")
-            print("  - *_stats.json     : Statistik (mean, std, min, max)")
-            print("  - *_mfcc.png       : Visualisasi MFCC")
+            if not args.no_shards:
+                print("\nFeature shards (semua file):")
+                print("  - shard-*.{mfcc,delta,delta2}.bin : MFCC, delta, delta-delta")
+                print("  - features_index.npy/.json        : Index (clip -> offset, shape, statistik)")
+                print("  - plots/*_mfcc.png                : Visualisasi MFCC")
+                print("  Baca dengan feature_shards.FeatureShards / FeatureLoader")
+            if args.legacy or args.no_shards:
+                print("\nFile yang dihasilkan untuk setiap audio:")
+                print("  - *_mfcc.npy       : MFCC features")
+                print("  - *_delta.npy      : Delta MFCC")
+                print("  - *_delta2.npy     : Delta-delta MFCC")
+                print("  - *_stats.json     : Statistik (mean, std, min, max)")
+                print("  - *_mfcc.png       : Visualisasi MFCC")
             print("  - processing_summary.json : Summary semua file")
+            if args.lazy_visualization:
+                print(f"\nRender PNG: python mfcc_render.py render \"{output_directory}\" --dpi {args.dpi}")
         else:
             print("\n⚠️  Tidak ada file WAV yang diproses.")
             print(f"   Pastikan ada file .wav di folder: {input_directory}")
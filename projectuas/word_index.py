@@ -0,0 +1,311 @@
+"""
+On-disk index of archive/text_audio_urls.csv (word -> US/GB audio URL).
+The CSV is read once into a SQLite table keyed by the lowercase word (a
+B-tree, so lookups and prefix ranges are O(log n) instead of a full CSV scan
+per run). The index records the size, mtime and sha256 of the CSV it was built
+from and is rebuilt only when the CSV content changes.
+
+Usage:
+  python word_index.py --csv archive/text_audio_urls.csv build
+  python word_index.py lookup cup plate "ice cream" [--prefer gb]
+  python word_index.py prefix ice
+  python word_index.py coverage          # questions table words with/without audio
+  python word_index.py benchmark         # CSV scan vs index lookups
+"""
+
+import contextlib
+import csv
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from manifest import file_digest
+
+INDEX_VERSION = 1
+# Bound on parameters per IN (...) query (SQLite's default limit is 999)
+_LOOKUP_CHUNK = 500
+
+
+def normalize(word):
+    """Key used for a CSV word: lowercase, surrounding whitespace removed"""
+    return word.lower().strip()
+
+
+class WordIndex:
+    """Word -> audio URL lookups backed by a SQLite index of the CSV"""
+
+    def __init__(self, csv_path, index_path=None):
+        """
+        Args:
+            csv_path (str): CSV with word, us_audio_url and gb_audio_url columns
+            index_path (str, optional): SQLite file (default: next to the CSV, .sqlite)
+        """
+        self.csv_path = Path(csv_path)
+        self.index_path = Path(index_path) if index_path else self.csv_path.with_suffix('.sqlite')
+        self.rebuilt = False
+        if self.csv_path.exists():
+            self.rebuilt = self._ensure_current()
+        elif not self.index_path.exists():
+            raise FileNotFoundError(f"Neither {self.csv_path} nor an index of it exists")
+        else:
+            print(f"{self.csv_path.name} not found; using the existing index {self.index_path.name}")
+        self._db = sqlite3.connect(str(self.index_path))
+
+    # ---- build ------------------------------------------------------------
+
+    def _source_info(self):
+        stat = os.stat(self.csv_path)
+        return {'size': str(stat.st_size), 'mtime_ns': str(stat.st_mtime_ns)}
+
+    def _stored_meta(self):
+        if not self.index_path.exists():
+            return {}
+        try:
+            # Closed right away: an open handle would block replacing the file on Windows
+            with contextlib.closing(sqlite3.connect(str(self.index_path))) as db:
+                return dict(db.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError as e:
+            print(f"Ignoring unreadable word index {self.index_path}: {e}")
+            return {}
+
+    def _ensure_current(self):
+        """Rebuild the index if the CSV changed since it was built; True if rebuilt"""
+        meta = self._stored_meta()
+        info = self._source_info()
+        if meta.get('version') == str(INDEX_VERSION):
+            # Unchanged size and mtime: trust the stored hash instead of re-reading the CSV
+            if meta.get('size') == info['size'] and meta.get('mtime_ns') == info['mtime_ns']:
+                return False
+            digest = file_digest(self.csv_path)
+            if meta.get('sha256') == digest:
+                with contextlib.closing(sqlite3.connect(str(self.index_path))) as db, db:
+                    db.executemany("UPDATE meta SET value = ? WHERE key = ?",
+                                   [(info['size'], 'size'), (info['mtime_ns'], 'mtime_ns')])
+                return False
+        else:
+            digest = file_digest(self.csv_path)
+        self.build(digest)
+        return True
+
+    def build(self, digest=None):
+        """
+        (Re)build the index from the CSV into a temp file, then swap it in
+
+        Returns:
+            int: Words indexed
+        """
+        started = time.perf_counter()
+        info = self._source_info()
+        digest = digest or file_digest(self.csv_path)
+        temp_path = self.index_path.with_name(f".{self.index_path.name}.{os.getpid()}.tmp")
+        temp_path.unlink(missing_ok=True)
+
+        db = sqlite3.connect(str(temp_path))
+        try:
+            db.execute("PRAGMA journal_mode = OFF")
+            db.execute("PRAGMA synchronous = OFF")
+            db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            db.execute("CREATE TABLE words (word TEXT PRIMARY KEY, us_url TEXT, gb_url TEXT) WITHOUT ROWID")
+            # Like the old scan: rows without any URL are ignored, a later row for
+            # the same word replaces an earlier one
+            insert = ("INSERT INTO words VALUES (?, ?, ?) ON CONFLICT(word) DO UPDATE SET "
+                      "us_url = excluded.us_url, gb_url = excluded.gb_url")
+            with open(self.csv_path, mode='r', encoding='utf-8', newline='') as f:
+                batch = []
+                for row in csv.DictReader(f):
+                    us_url = row.get('us_audio_url') or None
+                    gb_url = row.get('gb_audio_url') or None
+                    if us_url or gb_url:
+                        batch.append((normalize(row['word']), us_url, gb_url))
+                    if len(batch) >= 10000:
+                        db.executemany(insert, batch)
+                        batch = []
+                db.executemany(insert, batch)
+            count = db.execute("SELECT COUNT(*) FROM words").fetchone()[0]
+            db.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ('version', str(INDEX_VERSION)), ('sha256', digest),
+                ('size', info['size']), ('mtime_ns', info['mtime_ns']), ('words', str(count))
+            ])
+            db.commit()
+        except BaseException:
+            db.close()
+            temp_path.unlink(missing_ok=True)
+            raise
+        db.close()
+        os.replace(temp_path, self.index_path)
+        print(f"✓ Indexed {count} words from {self.csv_path.name} ({time.perf_counter() - started:.1f}s)")
+        return count
+
+    # ---- queries ----------------------------------------------------------
+
+    @staticmethod
+    def _pick(us_url, gb_url, prefer):
+        return (gb_url or us_url) if prefer == 'gb' else (us_url or gb_url)
+
+    def get(self, word, prefer='us'):
+        """Audio URL of one word (preferred accent first, the other as fallback), or None"""
+        row = self._db.execute("SELECT us_url, gb_url FROM words WHERE word = ?", (normalize(word),)).fetchone()
+        return self._pick(*row, prefer) if row else None
+
+    def lookup(self, words, prefer='us'):
+        """
+        Audio URLs of many words
+
+        Args:
+            words (list): Words in any case
+            prefer (str): 'us' or 'gb'; the other accent is used when it is missing
+
+        Returns:
+            dict: normalized word -> URL, for the words found
+        """
+        keys = sorted({normalize(w) for w in words})
+        found = {}
+        for start in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = keys[start:start + _LOOKUP_CHUNK]
+            rows = self._db.execute(
+                f"SELECT word, us_url, gb_url FROM words WHERE word IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for word, us_url, gb_url in rows:
+                found[word] = self._pick(us_url, gb_url, prefer)
+        return found
+
+    def prefix(self, prefix, limit=20, prefer='us'):
+        """
+        Words starting with a prefix, in sorted order (a range scan on the key)
+
+        Returns:
+            list: [(word, url), ...]
+        """
+        low = normalize(prefix)
+        # Every key with this prefix sorts below prefix + U+10FFFF
+        rows = self._db.execute(
+            "SELECT word, us_url, gb_url FROM words WHERE word >= ? AND word < ? ORDER BY word LIMIT ?",
+            (low, low + "\U0010ffff", limit)
+        )
+        return [(word, self._pick(us_url, gb_url, prefer)) for word, us_url, gb_url in rows]
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM words").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def scan_csv(csv_path, words):
+    """The old lookup: stream the whole CSV for a set of words (benchmark baseline)"""
+    targets = {normalize(w) for w in words}
+    found = {}
+    with open(csv_path, mode='r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            word = normalize(row['word'])
+            if word in targets:
+                url = row.get('us_audio_url') or row.get('gb_audio_url')
+                if url:
+                    found[word] = url
+    return found
+
+
+def coverage(index, sql_path=None, prefer='us', suggestions=3, show=30):
+    """Which questions have audio; prefix matches are listed for (the first few) missing ones"""
+    from questions import DEFAULT_SQL_PATH, load_questions
+
+    texts = sorted({normalize(q['text']) for q in load_questions(sql_path or DEFAULT_SQL_PATH)})
+    found = index.lookup(texts, prefer)
+    missing = [t for t in texts if t not in found]
+    print(f"Questions with audio: {len(found)}/{len(texts)}")
+    if len(missing) > show:
+        print(f"First {show} of {len(missing)} without audio:")
+    for text in missing[:show]:
+        close = [w for w, _ in index.prefix(text.split()[0], limit=suggestions, prefer=prefer)]
+        hint = f" (prefix matches: {', '.join(close)})" if close else ""
+        print(f"  - {text}{hint}")
+    return found, missing
+
+
+def benchmark(rows=200000, words=50, seed=0):
+    """Scan a synthetic CSV vs build once + indexed lookups"""
+    import random
+    import tempfile
+
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "text_audio_urls.csv"
+        vocabulary = [f"word{i:07d}" for i in range(rows)]
+        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['word', 'us_audio_url', 'gb_audio_url'])
+            for word in vocabulary:
+                writer.writerow([word, f"https://audio.example/us/{word}.mp3", f"https://audio.example/gb/{word}.mp3"])
+        targets = rng.sample(vocabulary, words)
+
+        started = time.perf_counter()
+        expected = scan_csv(csv_path, targets)
+        scan_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        WordIndex(csv_path).close()
+        build_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with WordIndex(csv_path) as index:
+            got = index.lookup(targets)
+        lookup_s = time.perf_counter() - started
+
+    print(f"CSV rows: {rows}  target words: {words}")
+    print(f"  CSV scan per run          : {scan_s * 1000:9.1f} ms")
+    print(f"  index build (once)        : {build_s * 1000:9.1f} ms")
+    print(f"  open + lookup per run     : {lookup_s * 1000:9.1f} ms  ({scan_s / max(lookup_s, 1e-9):.0f}x)")
+    status = "✓" if got == expected else "❌"
+    print(f"{status} Same URLs as the CSV scan")
+    return got == expected
+
+
+def main():
+    import argparse
+
+    default_csv = Path(__file__).parent / "archive" / "text_audio_urls.csv"
+    parser = argparse.ArgumentParser(description="Indexed word -> audio URL lookups")
+    parser.add_argument("--csv", default=str(default_csv))
+    accent = argparse.ArgumentParser(add_help=False)
+    accent.add_argument("--prefer", choices=["us", "gb"], default="us", help="Accent used when both exist")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="Rebuild the index now")
+    p_lookup = sub.add_parser("lookup", parents=[accent], help="URLs of words")
+    p_lookup.add_argument("words", nargs="+")
+    p_prefix = sub.add_parser("prefix", parents=[accent], help="Words starting with a prefix")
+    p_prefix.add_argument("prefix")
+    p_prefix.add_argument("--limit", type=int, default=20)
+    p_cov = sub.add_parser("coverage", parents=[accent], help="Questions table words with and without audio")
+    p_cov.add_argument("--sql", default=None)
+    p_bench = sub.add_parser("benchmark", help="CSV scan vs index on a synthetic CSV")
+    p_bench.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        benchmark(rows=args.rows)
+        return
+
+    with WordIndex(args.csv) as index:
+        if args.command == "build":
+            if not index.rebuilt:
+                index.build()
+        elif args.command == "lookup":
+            found = index.lookup(args.words, args.prefer)
+            for word in args.words:
+                print(f"{word}: {found.get(normalize(word), '-')}")
+        elif args.command == "prefix":
+            for word, url in index.prefix(args.prefix, args.limit, args.prefer):
+                print(f"{word}: {url}")
+        else:
+            coverage(index, args.sql, args.prefer)
+
+
+if __name__ == "__main__":
+    main()